@@ -0,0 +1,98 @@
+"""
+レコード整形・JSON エンコードのベンチマーク（GET /api/reports, /api/customers のレスポンス作成）
+
+使い方:
+    python benchmark_records.py <ファイル.xlsm> [繰り返し回数] [行数の倍率]
+
+以前のセルごとのループ (legacy_clean_records + encode_json) と、
+列ごとの整形 + encode_records_json の時間を比較し、レスポンスのバイト列が一致するか確認する。
+行数の倍率を指定すると、シートの行を繰り返して大きなブックを想定した計測ができる。
+"""
+import sys
+import time
+import logging
+
+import pandas as pd
+
+import main
+
+
+def legacy_clean_records(df, code_columns=(), date_columns=()):
+    """以前の get_reports / get_customers のセルごとの整形ループ（比較用）"""
+    df = df.fillna(value='')
+    for col in date_columns:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+
+    records = df.to_dict(orient="records")
+
+    import math
+    cleaned_records = []
+    for record in records:
+        cleaned_record = {}
+        for key, value in record.items():
+            if isinstance(value, float):
+                if math.isnan(value) or math.isinf(value):
+                    cleaned_record[key] = None
+                elif key in code_columns and not math.isnan(value):
+                    cleaned_record[key] = str(int(value))
+                else:
+                    cleaned_record[key] = value
+            elif value == '':
+                cleaned_record[key] = None
+            elif isinstance(value, str):
+                import re
+                cleaned_value = re.sub(r'_x000D_', '\n', value)
+                cleaned_value = cleaned_value.replace('\r', '')
+                cleaned_record[key] = cleaned_value
+            else:
+                cleaned_record[key] = value
+        cleaned_records.append(cleaned_record)
+    return cleaned_records
+
+
+def time_it(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times), sum(times) / len(times)
+
+
+def main_benchmark():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    excel_file = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    scale = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = {
+        '営業日報': {'code_columns': main.CODE_COLUMNS, 'date_columns': ('日付',)},
+        '得意先_List': {},
+    }
+    for sheet_name, options in cases.items():
+        df = main.read_sheet(excel_file, sheet_name)
+        if scale > 1:
+            df = pd.concat([df] * scale, ignore_index=True)
+        frame = main.SheetView(sheet_name, df).frame
+        print(f"--- {sheet_name} {frame.shape} ---")
+
+        legacy, legacy_best, legacy_avg = time_it(
+            lambda: main.encode_json(legacy_clean_records(frame, **options)), repeat)
+        fast, fast_best, fast_avg = time_it(
+            lambda: main.encode_records_json(main.clean_columns(frame, **options), len(frame)), repeat)
+        records, records_best, _ = time_it(lambda: main.clean_records(frame, **options), repeat)
+
+        print(f"{'legacy':10s} best {legacy_best:.3f}s  avg {legacy_avg:.3f}s")
+        print(f"{'columnar':10s} best {fast_best:.3f}s  avg {fast_avg:.3f}s  ({legacy_best / fast_best:.1f}x)")
+        print(f"bytes identical: {'yes' if legacy == fast else 'NO'} ({len(fast)} bytes)")
+        same_records = main.encode_json(records) == legacy
+        print(f"clean_records matches: {'yes' if same_records else 'NO'} (best {records_best:.3f}s)")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,65 @@
+"""
+シート読み込み方式のベンチマーク（get_cached_dataframe の sheet_reader 設定を選ぶ参考用）
+
+使い方:
+    python benchmark_sheet_reader.py <ファイル.xlsm> [繰り返し回数]
+
+pandas (pd.read_excel) と streaming の読み込み時間を比較し、
+streaming の読み込み範囲（営業日報は A〜AC 列・管理番号のある最後の行まで）で結果が一致するか確認する。
+"""
+import sys
+import time
+import logging
+
+import main
+
+
+def time_reader(reader, excel_file, sheet_name, repeat):
+    times = []
+    df = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = reader(excel_file, sheet_name)
+        times.append(time.perf_counter() - start)
+    return df, min(times), sum(times) / len(times)
+
+
+def project_like_streaming(df, sheet_name):
+    """pandas の結果を streaming と同じ読み込み範囲に揃える"""
+    spec = main.SHEET_READ_SPECS.get(sheet_name)
+    if not spec or df.empty:
+        return df
+    df = df.iloc[:, :spec['max_col']]
+    keys = df.index[df.iloc[:, spec['key_col'] - 1].notna()]
+    return df.loc[:keys.max()] if len(keys) else df.iloc[:0]
+
+
+def main_benchmark():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    excel_file = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for sheet_name in ('営業日報', '得意先_List'):
+        print(f"--- {sheet_name} ---")
+        results = {}
+        for name, reader in main.SHEET_READERS.items():
+            try:
+                df, best, avg = time_reader(reader, excel_file, sheet_name, repeat)
+            except Exception as e:
+                print(f"{name:10s} failed: {e}")
+                continue
+            results[name] = df
+            print(f"{name:10s} best {best:.3f}s  avg {avg:.3f}s  shape {df.shape}")
+
+        if 'pandas' in results and 'streaming' in results:
+            expected = project_like_streaming(results['pandas'], sheet_name)
+            actual = results['streaming']
+            same = expected.equals(actual) and list(expected.dtypes) == list(actual.dtypes)
+            print(f"streaming matches pandas: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -1,21 +1,53 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Request, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, ValidationError
 import pandas as pd
+import numpy as np
 import openpyxl
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_MAC_1904, WINDOWS_EPOCH
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
 from datetime import datetime, timedelta
 import os
 import shutil
 import json
 import pickle
 import hashlib
+import uuid
+import base64
+import bisect
+from email.utils import formatdate, parsedate_to_datetime
+import gzip
+import math
+import mmap
+import struct
+import re
+import zipfile
+import zlib
+import posixpath
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape as xml_escape
+import html
+import threading
+import time
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from copy import copy
+from collections import OrderedDict
 from typing import Optional, List, Dict, Any
 
 
 import logging
+import logging.handlers
 import sys
 import os
 
@@ -33,15 +65,24 @@ try:
 except ImportError:
     pass
 
+# プロセスプールのワーカー（spawn）はこのファイルを import し直す。ワーカーではサーバーの初期化
+# （ログ設定・config.json・売上データ・共有フォルダの一覧・バルクヘッド）を行わず、
+# 親プロセスの設定を環境変数 POOL_WORKER_ENV から受け取る（WorkerPool がワーカー起動前に設定する）。
+# ワーカーのログはキューで親プロセスに送り、親のハンドラー（server_debug.log など）で出力する
+POOL_WORKER_ENV = 'DAILY_REPORT_POOL_WORKER'
+POOL_WORKER_SETTINGS = os.environ.get(POOL_WORKER_ENV)
+IS_POOL_WORKER = POOL_WORKER_SETTINGS is not None
+
 # Setup logging - ファイルとコンソール両方に出力
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('server_debug.log'),
-        logging.StreamHandler()  # コンソール出力
-    ]
-)
+if not IS_POOL_WORKER:
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('server_debug.log'),
+            logging.StreamHandler()  # コンソール出力
+        ]
+    )
 logging.info("Server starting up...")
 logging.info(f"DEBUG PATHS: BASE_DIR={BASE_DIR}")
 STATIC_DIR = os.path.join(BASE_DIR, "static")
@@ -59,6 +100,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Data-Version", "X-Data-Stale", "X-Next-Cursor", "X-Total-Count"],
 )
 
 # バリデーションエラーの詳細をログ出力
@@ -76,6 +118,9 @@ from fastapi import Request
 # ミドルウェアは削除済み - APIエンドポイントは直接 /api/ プレフィックス付きで定義されている
 
 
+# config.json の全設定値（excel_dir 以外のオプションもここから参照する）
+CONFIG = {}
+
 # Load configuration
 def load_config():
     config_path = os.path.join(BASE_DIR, 'config.json')
@@ -86,6 +131,7 @@ def load_config():
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
+                CONFIG.update(config)
                 path = config.get('excel_dir', default_path)
                 logging.info(f"Successfully loaded config. Excel Path: {path}")
                 return path
@@ -97,13 +143,19 @@ def load_config():
     logging.info(f"config.json not found. Using default path: {default_path}")
     return default_path
 
-EXCEL_DIR = load_config()
-logging.info(f"STARTUP: Working with EXCEL_DIR: {EXCEL_DIR}")
+if IS_POOL_WORKER:
+    _worker_settings = json.loads(POOL_WORKER_SETTINGS)
+    CONFIG.update(_worker_settings['config'])
+    EXCEL_DIR = _worker_settings['excel_dir']
+else:
+    EXCEL_DIR = load_config()
+    logging.info(f"STARTUP: Working with EXCEL_DIR: {EXCEL_DIR}")
 
 # --- Global Sales Data Storage ---
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 SALES_CSV_PATH = os.path.join(DATA_DIR, 'sales_data.csv')
-os.makedirs(DATA_DIR, exist_ok=True)
+if not IS_POOL_WORKER:
+    os.makedirs(DATA_DIR, exist_ok=True)
 
 # Global DataFrame to hold sales data
 global_sales_df = None
@@ -138,11 +190,12 @@ def load_sales_data():
         logging.error(f"Failed to load sales data: {e}")
 
 # Load on startup
-load_sales_data()
+if not IS_POOL_WORKER:
+    load_sales_data()
 
 # Find a default Excel file dynamically
 DEFAULT_EXCEL_FILE = "daily_report_template.xlsm" # Fallback
-if os.path.exists(EXCEL_DIR):
+if not IS_POOL_WORKER and os.path.exists(EXCEL_DIR):
     files = [f for f in os.listdir(EXCEL_DIR) if f.endswith('.xlsm') and not f.startswith('~$')]
     if files:
         DEFAULT_EXCEL_FILE = files[0]
@@ -190,11 +243,106 @@ class ReportInput(BaseModel):
             return ""
         return str(v)
 
+
+# --- Bulkheads ---
+# エンドポイントは Starlette の共有スレッドプールではなく、処理の種類ごとの上限付きスレッドプールで実行する。
+#   "share": ネットワーク共有 (\\Asahipack02) 上のファイル操作（一覧・画像・アップロード・書き込みの保存待ち）
+#   "cpu":   DataFrame の整形・集計（キャッシュミス時はブックの読み込み待ちも含む）
+#   "light": メモリ上のデータだけで返せる軽い処理（ヘルスチェック・メトリクス・売上の1件参照）
+# 共有フォルダが応答しなくなっても止まるのは "share" だけで、他の種類のリクエストには応答し続ける。
+# 実行中 + 待ちが workers + queue に達した種類は、それ以上待たせずに 503 (Retry-After) を返す。
+# config.json の "bulkheads": {"share": {"workers": 8, "queue": 64}, ...} で種類ごとに変更できる。
+BULKHEAD_DEFAULTS = {
+    'share': {'workers': 8, 'queue': 64},
+    'cpu': {'workers': 4, 'queue': 64},
+    'light': {'workers': 8, 'queue': 256},
+}
+
+
+class Bulkhead:
+    """種類1つ分のスレッドプール。実行中・待ちの数を数え、上限を超えた分は断る"""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulkhead-{name}")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self.stats = {'completed': 0, 'failed': 0, 'rejected': 0, 'max_in_flight': 0}
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.stats['rejected'] += 1
+                raise HTTPException(status_code=503, detail=f"Server busy ({self.name}). Please retry.",
+                                    headers={'Retry-After': '1'})
+            self._in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, contextvars.copy_context().run, self._call, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self.stats['completed'] += 1
+        return result
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'workers': self.workers, 'max_queue': self.max_queue,
+                    'running': self._running, 'queued': self._in_flight - self._running}
+
+
+def _create_bulkheads() -> dict:
+    settings = CONFIG.get('bulkheads', {})
+    bulkheads = {}
+    for name, defaults in BULKHEAD_DEFAULTS.items():
+        options = {**defaults, **settings.get(name, {})}
+        bulkheads[name] = Bulkhead(name, max(1, int(options['workers'])), max(0, int(options['queue'])))
+    return bulkheads
+
+
+BULKHEADS = {} if IS_POOL_WORKER else _create_bulkheads()  # ワーカーはエンドポイントを実行しない
+
+
+def bulkhead(name: str):
+    """同期のエンドポイントを BULKHEADS[name] で実行する（@app.get などの内側に付ける）"""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def endpoint(*args, **kwargs):
+            return await BULKHEADS[name].run(fn, *args, **kwargs)
+        return endpoint
+    return decorate
+
+
+def bulkhead_metrics() -> dict:
+    return {name: pool.metrics() for name, pool in BULKHEADS.items()}
+
+
 @app.get("/api/health")
+@bulkhead('light')
 def read_root():
     return {"message": "Daily Report API is running", "excel_dir": EXCEL_DIR}
 
 @app.get("/api/files")
+@bulkhead('share')
 def list_excel_files():
     """List all Excel files in the directory"""
     logging.debug(f"Listing files in {EXCEL_DIR}")
@@ -207,23 +355,16 @@ def list_excel_files():
         # Add timeout protection or more verbose logging? 
         # listing network drive can appear to hang.
         
-        items = os.listdir(EXCEL_DIR)
-        logging.debug(f"Found {len(items)} items in directory")
+        # 1回のフォルダ走査でサイズ・更新日時も取得（stat キャッシュも更新される）
+        items = scan_directory_stats(EXCEL_DIR)
+        logging.debug(f"Found {len(items)} Excel files in directory")
         
-        for file in items:
-            if file.endswith(('.xlsx', '.xlsm')):
-                file_path = os.path.join(EXCEL_DIR, file)
-                try:
-                    file_size = os.path.getsize(file_path)
-                    file_mtime = os.path.getmtime(file_path)
-                    files.append({
-                        "name": file,
-                        "size": file_size,
-                        "modified": datetime.fromtimestamp(file_mtime).isoformat()
-                    })
-                except Exception as file_err:
-                    logging.warning(f"Error processing file {file}: {file_err}")
-                    continue
+        for file, (mtime_ns, file_size) in items.items():
+            files.append({
+                "name": file,
+                "size": file_size,
+                "modified": datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+            })
                     
         return {"files": files, "default": DEFAULT_EXCEL_FILE}
     except Exception as e:
@@ -233,8 +374,436 @@ def list_excel_files():
         raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
 
-# Cache for Excel dataframes: {(filename, sheet_name): {'mtime': float, 'df': pd.DataFrame}}
-CACHE = {}
+# --- Workbook Stat Cache ---
+# UNC パス上のブックの stat は1回ごとに SMB の往復になるので、フォルダごとに os.scandir 1回で取った
+# Excel ファイルの (mtime_ns, size) を config.json の "stat_revalidate_seconds" 秒（既定 1 秒、0 で毎回確認）だけ信用する。
+# リクエストに Cache-Control: no-cache（または max-age=0）があれば、そのブックは信用期間に関係なく stat し直す。
+# このサーバーで保存したブックは保存直後に stat し直すので、自分の書き込みはすぐに読める。
+STAT_REVALIDATE_SECONDS = float(CONFIG.get('stat_revalidate_seconds', 1.0))
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+STAT_STATS = {'scans': 0, 'stats': 0, 'trusted': 0, 'revalidations': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': None}
+_STAT_SNAPSHOTS = {}  # {フォルダ: {'at': time.monotonic(), 'files': {ファイル名: (mtime_ns, size)}}}
+_STAT_LOCK = threading.Lock()
+
+
+def _record_stat_latency(kind: str, seconds: float):
+    ms = seconds * 1000
+    with _STAT_LOCK:
+        STAT_STATS[kind] += 1
+        STAT_STATS['total_ms'] += ms
+        STAT_STATS['max_ms'] = max(STAT_STATS['max_ms'], ms)
+        STAT_STATS['last_ms'] = round(ms, 3)
+
+
+def scan_directory_stats(directory: str) -> dict:
+    """フォルダの Excel ファイルの {ファイル名: (mtime_ns, size)}（os.scandir 1回。Windows ではファイルごとの往復なし）"""
+    start = time.perf_counter()
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(EXCEL_EXTENSIONS) and entry.is_file():
+                st = entry.stat()
+                files[entry.name] = (st.st_mtime_ns, st.st_size)
+    _record_stat_latency('scans', time.perf_counter() - start)
+    with _STAT_LOCK:
+        _STAT_SNAPSHOTS[directory] = {'at': time.monotonic(), 'files': files}
+    return files
+
+
+def refresh_workbook_signature(excel_file: str) -> Optional[tuple]:
+    """ブック1つを stat し直して (mtime_ns, size) を返し、フォルダの stat キャッシュにも反映（なければ None）"""
+    start = time.perf_counter()
+    try:
+        st = os.stat(excel_file)
+        signature = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        signature = None
+    _record_stat_latency('stats', time.perf_counter() - start)
+    directory, name = os.path.split(excel_file)
+    with _STAT_LOCK:
+        snapshot = _STAT_SNAPSHOTS.get(directory)
+        if snapshot is not None and name.endswith(EXCEL_EXTENSIONS):
+            if signature is None:
+                snapshot['files'].pop(name, None)
+            else:
+                snapshot['files'][name] = signature
+    return signature
+
+
+def workbook_signature(excel_file: str, revalidate: bool = False) -> Optional[tuple]:
+    """ブックの (mtime_ns, size)。信用期間内ならフォルダの stat キャッシュから返す（ファイルがなければ None）"""
+    directory, name = os.path.split(excel_file)
+    if revalidate:
+        with _STAT_LOCK:
+            STAT_STATS['revalidations'] += 1
+        return refresh_workbook_signature(excel_file)
+    if STAT_REVALIDATE_SECONDS <= 0 or not name.endswith(EXCEL_EXTENSIONS):
+        return refresh_workbook_signature(excel_file)
+
+    with _STAT_LOCK:
+        snapshot = _STAT_SNAPSHOTS.get(directory)
+        if snapshot is not None and time.monotonic() - snapshot['at'] < STAT_REVALIDATE_SECONDS:
+            signature = snapshot['files'].get(name)
+            if signature is not None:
+                STAT_STATS['trusted'] += 1
+                return signature
+    # 期限切れ、または走査後にできたファイルならフォルダを走査し直す
+    try:
+        return scan_directory_stats(directory).get(name)
+    except OSError:
+        return refresh_workbook_signature(excel_file)
+
+
+def wants_revalidation(request: Request) -> bool:
+    """Cache-Control: no-cache / max-age=0 のリクエストは stat キャッシュを使わない"""
+    cache_control = request.headers.get('cache-control', '').lower()
+    return 'no-cache' in cache_control or 'max-age=0' in cache_control
+
+
+def stat_metrics() -> dict:
+    with _STAT_LOCK:
+        calls = STAT_STATS['scans'] + STAT_STATS['stats']
+        return {**STAT_STATS, 'total_ms': round(STAT_STATS['total_ms'], 3), 'max_ms': round(STAT_STATS['max_ms'], 3),
+                'avg_ms': round(STAT_STATS['total_ms'] / calls, 3) if calls else None,
+                'revalidate_seconds': STAT_REVALIDATE_SECONDS}
+
+
+# --- In-Memory Cache ---
+# 読み込んだシートの DataFrame をメモリに保持する。合計サイズ（DataFrame の実メモリ使用量）が
+# config.json の "cache_max_bytes" を超えたら、最後に使われてから最も時間が経ったものから捨てる。
+CACHE_MAX_BYTES = int(CONFIG.get('cache_max_bytes', 512 * 1024 * 1024))
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class LRUCache:
+    """
+    バイト数の上限付き LRU キャッシュ。
+    エントリ: {'mtime_ns': int, 'size': int, 'df': pd.DataFrame, 'store': ColumnCacheFile, 'bytes': int}
+    （シートビューは {'mtime_ns', 'size', 'pending', 'view': SheetView, 'bytes'}）
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'resident_bytes': 0}
+
+    def lookup(self, key, mtime_ns: int, size: int, pending=None) -> Optional[dict]:
+        """ファイルの (mtime_ns, size)（と未反映の変更）と一致するエントリを返す（古いエントリは捨てる）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['mtime_ns'] == mtime_ns and entry['size'] == size \
+                    and entry.get('pending') == pending:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.stats['misses'] += 1
+            return None
+
+    def get(self, key) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def touch(self, key):
+        """エントリを最近使ったものにする（ヒット数には数えない）"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def put(self, key, entry: dict):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            entry['bytes'] = self._measure(entry)
+            self._entries[key] = entry
+            self.stats['resident_bytes'] += entry['bytes']
+            self._evict()
+
+    def revalidate(self, key, entry: dict, mtime_ns: int, size: int) -> bool:
+        """内容が変わっていないと確認できたエントリを、ファイルの新しい (mtime_ns, size) のものとして残す"""
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return False
+            entry['mtime_ns'], entry['size'] = mtime_ns, size
+            return True
+
+    def update_bytes(self, key, entry: dict):
+        """列の読み込みなどでエントリのサイズが変わったときに計り直す"""
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return
+            size = self._measure(entry)
+            self.stats['resident_bytes'] += size - entry['bytes']
+            entry['bytes'] = size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats['resident_bytes'] = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries), 'max_bytes': self.max_bytes}
+
+    def _measure(self, entry: dict) -> int:
+        if entry.get('view') is not None:
+            return entry['view'].resident_bytes()
+        if entry.get('df') is not None:
+            return frame_bytes(entry['df'])
+        store = entry.get('store')
+        return store.resident_bytes() if store is not None else 0
+
+    def _remove(self, key) -> dict:
+        entry = self._entries.pop(key)
+        self.stats['resident_bytes'] -= entry['bytes']
+        return entry
+
+    def _evict(self):
+        # 最後に追加・使用したエントリは上限を超えていても残す
+        while self.stats['resident_bytes'] > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            entry = self._remove(key)
+            self.stats['evictions'] += 1
+            logging.debug(f"Evicted {key} from cache")
+            # ビューはシートの DataFrame・列を数えていないので、共有しているエントリを捨てたらビューも捨てる
+            view_key = (*key, 'view')
+            dependent = self._entries.get(view_key) if len(key) == 2 else None
+            source = dependent['view'].source if dependent is not None else None
+            if source is not None and (source is entry.get('df') or source is entry.get('store')):
+                self._remove(view_key)
+                self.stats['evictions'] += 1
+                logging.debug(f"Evicted {view_key} with its frame")
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら、新しく始めずにその結果を待って共有する。
+    ブックの更新直後にダッシュボードの複数のリクエストが同時にキャッシュミスしても、読み込みは1回になる。
+    キーの先頭要素を種類として、種類ごとに実行数 (loads) と待ち合わせた数 (deduplicated) を数える。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # {key: Future}
+        self.stats = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            stats = self.stats.setdefault(key[0], {'loads': 0, 'deduplicated': 0})
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                stats['loads'] += 1
+            else:
+                stats['deduplicated'] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self.stats.items()}
+
+
+# Cache for Excel dataframes: {(filename, sheet_name): entry}, sheet views: {(filename, sheet_name, 'view'): entry}
+CACHE = LRUCache(CACHE_MAX_BYTES)
+# キャッシュミス時の読み込み: ('sheet', ...) シート1つ, ('excel', ...) ブックの読み込み, ('view', ...) SheetView の作成
+SINGLE_FLIGHT = SingleFlight()
+
+# API が読むシート。どれかを Excel から読むときは、キャッシュにない残りのシートも同じ読み込みで取り出す
+WORKBOOK_SHEETS = ('営業日報', '得意先_List')
+
+# --- Stale-While-Revalidate ---
+# config.json の "stale_while_revalidate": true で有効化。ブックが外部で更新されてキャッシュが古くなったとき、
+# 読み込みを待たずに前の版をすぐ返し（レスポンスに X-Data-Stale: 更新からの秒数）、新しい版はバックグラウンドで1回だけ読み込む。
+# このサーバーで保存した版と未反映の変更は対象外（自分の書き込みはすぐ見える）。
+# 楽観的ロックの確認など最新のデータが必要な処理は get_cached_dataframe / get_sheet_view に fresh=True を渡す。
+STALE_WHILE_REVALIDATE = bool(CONFIG.get('stale_while_revalidate', False))
+STALE_HEADER = 'X-Data-Stale'
+SWR_STATS = {'stale_served': 0, 'refreshes': 0, 'refresh_errors': 0}
+LOCAL_WRITES = {}  # {excel_file: (mtime_ns, size)} このサーバーが最後に保存した版
+_REVALIDATING = set()
+_SWR_LOCK = threading.Lock()
+
+
+def can_serve_stale(filename: str, signature: tuple, fresh: bool) -> bool:
+    """ブックの現在の版を待たずに、キャッシュの前の版を返してよいか"""
+    if not STALE_WHILE_REVALIDATE or fresh:
+        return False
+    return LOCAL_WRITES.get(os.path.join(EXCEL_DIR, filename)) != signature
+
+
+def revalidate_in_background(key, load):
+    """
+    前の版を返したことを記録し、key の読み込みをバックグラウンドで始める（実行中なら何もしない）。
+    SINGLE_FLIGHT を通すので、同じ版を fresh=True で読み込むリクエストとも1回の読み込みを共有する。
+    """
+    with _SWR_LOCK:
+        SWR_STATS['stale_served'] += 1
+        if key in _REVALIDATING:
+            return
+        _REVALIDATING.add(key)
+        SWR_STATS['refreshes'] += 1
+
+    def run():
+        try:
+            SINGLE_FLIGHT.do(key, load)
+        except Exception as e:
+            logging.warning(f"Background refresh failed for {key}: {e}")
+            with _SWR_LOCK:
+                SWR_STATS['refresh_errors'] += 1
+        finally:
+            with _SWR_LOCK:
+                _REVALIDATING.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def swr_metrics() -> dict:
+    with _SWR_LOCK:
+        return {**SWR_STATS, 'enabled': STALE_WHILE_REVALIDATE, 'refreshing': len(_REVALIDATING)}
+
+# --- 管理番号インデックス (営業日報) ---
+# 書き込み系エンドポイントが毎回 A列を全行走査しないよう、ワークブックごとに
+# 管理番号 → 行番号 の対応と採番情報を保持する。ファイルの mtime が一致する間だけ有効。
+# {excel_file: {'mtime': float, 'rows': {管理番号: 行番号}, 'last_row': int, 'next_number': int}}
+ROW_INDEX = {}
+
+# ワークブックごとの書き込みロック（同時の add_report による採番重複を防ぐ）
+_WORKBOOK_LOCKS = {}
+_WORKBOOK_LOCKS_GUARD = threading.Lock()
+
+
+def get_workbook_lock(excel_file: str) -> threading.RLock:
+    """ワークブック単位の書き込みロックを取得（読み込み→変更→保存の間保持する）"""
+    with _WORKBOOK_LOCKS_GUARD:
+        lock = _WORKBOOK_LOCKS.get(excel_file)
+        if lock is None:
+            lock = threading.RLock()
+            _WORKBOOK_LOCKS[excel_file] = lock
+        return lock
+
+
+def build_row_index(excel_file: str, ws, mtime: float) -> dict:
+    """営業日報シートの A列(管理番号) を一度だけ走査してインデックスを作成"""
+    rows = {}
+    max_mgmt_num = 0
+    max_mgmt_row = 1  # データがない場合はヘッダー行
+    for row, (mgmt_num,) in enumerate(ws.iter_rows(min_row=2, max_col=1, values_only=True), start=2):
+        if mgmt_num is None:
+            continue
+        # 検索は従来どおり数値の管理番号のみ一致させる（重複時は先頭行を優先）
+        if isinstance(mgmt_num, (int, float)) and not isinstance(mgmt_num, bool) and mgmt_num == int(mgmt_num):
+            rows.setdefault(int(mgmt_num), row)
+        try:
+            val = int(mgmt_num)
+        except (ValueError, TypeError):
+            continue
+        if val > max_mgmt_num:
+            max_mgmt_num = val
+            max_mgmt_row = row
+
+    index = {
+        'mtime': mtime,
+        'rows': rows,
+        'last_row': max_mgmt_row,  # 最大管理番号の行（新規行はこの直下に追加）
+        'next_number': max_mgmt_num + 1,
+    }
+    ROW_INDEX[excel_file] = index
+    logging.debug(f"Row index built for {excel_file}: {len(rows)} rows, next={index['next_number']}")
+    return index
+
+
+def get_row_index(excel_file: str, ws, mtime: float) -> dict:
+    """mtime が一致すればキャッシュ済みインデックスを返し、なければ再構築"""
+    index = ROW_INDEX.get(excel_file)
+    if index is not None and index['mtime'] == mtime:
+        return index
+    return build_row_index(excel_file, ws, mtime)
+
+
+def find_report_row(excel_file: str, ws, mtime: float, management_number: int) -> Optional[int]:
+    """管理番号から行番号を取得（見つからなければ None）"""
+    index = get_row_index(excel_file, ws, mtime)
+    row = index['rows'].get(management_number)
+    if row is None:
+        return None
+    if ws.cell(row=row, column=1).value != management_number:
+        # インデックスとシートがずれている場合は作り直して再確認
+        index = build_row_index(excel_file, ws, mtime)
+        row = index['rows'].get(management_number)
+    return row
+
+
+def row_index_after_insert(excel_file: str, management_number: int, row: int):
+    """追加保存後にインデックスをその場で更新し、新しい mtime を記録"""
+    index = ROW_INDEX.get(excel_file)
+    if index is None:
+        return
+    index['rows'][management_number] = row
+    if management_number >= index['next_number'] - 1:
+        index['last_row'] = row
+        index['next_number'] = management_number + 1
+    index['mtime'] = os.path.getmtime(excel_file)
+
+
+def row_index_after_delete(excel_file: str, management_number: int, row: int):
+    """行削除後に以降の行番号を詰めてインデックスを更新"""
+    index = ROW_INDEX.get(excel_file)
+    if index is None:
+        return
+    rows = index['rows']
+    rows.pop(management_number, None)
+    for key, value in rows.items():
+        if value > row:
+            rows[key] = value - 1
+    if rows:
+        max_mgmt_num = max(rows)
+        index['last_row'] = rows[max_mgmt_num]
+        index['next_number'] = max_mgmt_num + 1
+    else:
+        index['last_row'] = 1
+        index['next_number'] = 1
+    index['mtime'] = os.path.getmtime(excel_file)
+
+
+def row_index_touch(excel_file: str):
+    """セル値のみ更新した保存の後、行構成は変わらないので mtime だけ更新"""
+    index = ROW_INDEX.get(excel_file)
+    if index is not None:
+        index['mtime'] = os.path.getmtime(excel_file)
 
 def create_backup(file_path):
     try:
@@ -254,67 +823,489 @@ def create_backup(file_path):
         logging.warning(f"Failed to create backup: {e}")
 
 
-def get_cached_dataframe(filename: str, sheet_name: str) -> pd.DataFrame:
+# --- Columnar Disk Cache ---
+# backend/.cache に シートごとの DataFrame を列単位のバッファで保存し、mmap で開く。
+# 数値・日付列は mmap 上のバッファをそのまま使い、文字列列は要求されたときに初めてデコードする。
+# シートビューは返す列だけを読み、全列の DataFrame は書き込み・未反映分の重ね合わせなどで必要になったときに組み立てる。
+# ファイル名は (絶対パス, シート名) と (size, mtime_ns, スキーマ版) から作るので、ブックが変わると別ファイルになる。
+# レイアウト: MAGIC(4) + スキーマ版(uint32) + ヘッダー長(uint64) + ヘッダー JSON + 64バイト境界に揃えた列バッファ
+COLUMN_CACHE_SCHEMA = 1
+COLUMN_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+_COLUMN_CACHE_MAGIC = b'DRCC'
+_COLUMN_CACHE_ALIGN = 64
+
+# object 列の値の種類
+_OBJ_NAN, _OBJ_STR, _OBJ_OTHER, _OBJ_NONE = 0, 1, 2, 3
+
+
+def _align(n: int) -> int:
+    return (n + _COLUMN_CACHE_ALIGN - 1) // _COLUMN_CACHE_ALIGN * _COLUMN_CACHE_ALIGN
+
+
+def column_cache_path(excel_file: str, sheet_name: str, size: int, mtime_ns: int) -> str:
+    source_id = hashlib.sha1(f"{os.path.abspath(excel_file)}|{sheet_name}".encode('utf-8')).hexdigest()[:16]
+    version_id = hashlib.sha1(f"{size}|{mtime_ns}|{COLUMN_CACHE_SCHEMA}".encode('utf-8')).hexdigest()[:12]
+    return os.path.join(COLUMN_CACHE_DIR, f"{source_id}-{version_id}.colcache")
+
+
+def _encode_object_column(values) -> tuple:
+    """object 列を (種類, 文字列オフセット, UTF-8 連結バイト列, その他の値の pickle) に分ける"""
+    kinds = np.empty(len(values), dtype=np.uint8)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    chunks = []
+    others = []
+    pos = 0
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            data = value.encode('utf-8', 'surrogatepass')
+            chunks.append(data)
+            pos += len(data)
+            kinds[i] = _OBJ_STR
+        elif value is None:
+            kinds[i] = _OBJ_NONE
+        elif type(value) is float and value != value:
+            kinds[i] = _OBJ_NAN
+        else:
+            others.append(value)
+            kinds[i] = _OBJ_OTHER
+        offsets[i + 1] = pos
+    return kinds, offsets, b''.join(chunks), pickle.dumps(others, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_column_cache(path: str, df: pd.DataFrame, meta: dict) -> bool:
+    """DataFrame を列キャッシュとして書き込む（一時ファイル + os.replace）。保存できない形なら False"""
+    index = df.index
+    if not (isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1):
+        return False
+    if any(not isinstance(col, str) for col in df.columns) or df.columns.duplicated().any():
+        return False
+
+    buffers = []
+    pos = 0
+
+    def add(data) -> list:
+        nonlocal pos
+        data = bytes(data)
+        buffers.append((pos, data))
+        span = [pos, len(data)]
+        pos = _align(pos + len(data))
+        return span
+
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        dtype = series.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufM':
+            arr = np.ascontiguousarray(series.to_numpy())
+            columns.append({'name': col, 'kind': 'array', 'dtype': arr.dtype.str, 'buffers': [add(arr.tobytes())]})
+        elif dtype == object:
+            kinds, offsets, blob, others = _encode_object_column(series.tolist())
+            columns.append({'name': col, 'kind': 'object',
+                            'buffers': [add(kinds.tobytes()), add(offsets.tobytes()), add(blob), add(others)]})
+        else:
+            columns.append({'name': col, 'kind': 'pickle', 'buffers': [add(pickle.dumps(series, protocol=pickle.HIGHEST_PROTOCOL))]})
+
+    header = json.dumps({**meta, 'schema': COLUMN_CACHE_SCHEMA, 'nrows': len(df), 'columns': columns},
+                        ensure_ascii=False).encode('utf-8')
+    prefix = _COLUMN_CACHE_MAGIC + struct.pack('<IQ', COLUMN_CACHE_SCHEMA, len(header)) + header
+    data_start = _align(len(prefix))
+
+    os.makedirs(COLUMN_CACHE_DIR, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(prefix)
+            for offset, data in buffers:
+                f.seek(data_start + offset)
+                f.write(data)
+            f.truncate(data_start + pos)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    return True
+
+
+class ColumnCacheFile:
+    """列キャッシュファイルを mmap で開き、列は要求されたときに読み込む（読み込んだ列は使い回す）"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != _COLUMN_CACHE_MAGIC:
+            raise ValueError(f"not a column cache file: {path}")
+        schema, header_len = struct.unpack_from('<IQ', self._mm, 4)
+        if schema != COLUMN_CACHE_SCHEMA:
+            raise ValueError(f"column cache schema {schema} != {COLUMN_CACHE_SCHEMA}")
+        self.header = json.loads(self._mm[16:16 + header_len].decode('utf-8'))
+        self._data_start = _align(16 + header_len)
+        self._specs = {spec['name']: spec for spec in self.header['columns']}
+        self.columns = [spec['name'] for spec in self.header['columns']]
+        self.nrows = self.header['nrows']
+        self._loaded = {}
+        self._loaded_bytes = 0
+        self._lock = threading.Lock()
+
+    def _buffer(self, span) -> memoryview:
+        start = self._data_start + span[0]
+        return memoryview(self._mm)[start:start + span[1]]
+
+    def column(self, name) -> np.ndarray:
+        arr = self._loaded.get(name)
+        if arr is not None:
+            return arr
+        with self._lock:
+            # 同じ列を同時に要求されてもデコードは1回
+            if name not in self._loaded:
+                self._loaded[name] = arr = self._decode(self._specs[name])
+                self._loaded_bytes += int(pd.Series(arr, copy=False).memory_usage(index=False, deep=True))
+            return self._loaded[name]
+
+    def _decode(self, spec: dict):
+        if spec['kind'] == 'array':
+            # mmap 上のバッファをそのまま参照（読み取り専用）
+            arr = np.frombuffer(self._buffer(spec['buffers'][0]), dtype=np.dtype(spec['dtype']))
+        elif spec['kind'] == 'object':
+            kinds_span, offsets_span, blob_span, others_span = spec['buffers']
+            kinds = np.frombuffer(self._buffer(kinds_span), dtype=np.uint8)
+            offsets = np.frombuffer(self._buffer(offsets_span), dtype=np.int64)
+            blob = self._buffer(blob_span)
+            others = iter(pickle.loads(self._buffer(others_span)))
+            arr = np.empty(self.nrows, dtype=object)
+            for i, kind in enumerate(kinds.tolist()):
+                if kind == _OBJ_STR:
+                    arr[i] = bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8', 'surrogatepass')
+                elif kind == _OBJ_NAN:
+                    arr[i] = np.nan
+                elif kind == _OBJ_NONE:
+                    arr[i] = None
+                else:
+                    arr[i] = next(others)
+        else:
+            arr = pickle.loads(self._buffer(spec['buffers'][0]))
+        return arr
+
+    def resident_bytes(self) -> int:
+        """読み込み済みの列が使っているメモリ量"""
+        return self._loaded_bytes
+
+    def series(self, name) -> pd.Series:
+        values = self.column(name)
+        if isinstance(values, pd.Series):
+            return values
+        return pd.Series(values, index=pd.RangeIndex(self.nrows), dtype=values.dtype, name=name, copy=False)
+
+    def frame(self) -> pd.DataFrame:
+        data = {name: self.series(name) for name in self.columns}
+        return pd.DataFrame(data, columns=self.columns, index=pd.RangeIndex(self.nrows), copy=False)
+
+
+def load_column_cache(excel_file: str, sheet_name: str, size: int, mtime_ns: int) -> Optional[ColumnCacheFile]:
+    path = column_cache_path(excel_file, sheet_name, size, mtime_ns)
+    if not os.path.exists(path):
+        return None
+    store = ColumnCacheFile(path)
+    header = store.header
+    if (header.get('source'), header.get('sheet'), header.get('size'), header.get('mtime_ns')) != \
+            (os.path.abspath(excel_file), sheet_name, size, mtime_ns):
+        return None
+    return store
+
+
+def save_column_cache(excel_file: str, sheet_name: str, entry: dict):
+    """ディスクキャッシュを書き込み、同じシートの古い版を削除（使用中で消せないものは次回）"""
+    try:
+        path = column_cache_path(excel_file, sheet_name, entry['size'], entry['mtime_ns'])
+        if os.path.exists(path):
+            # 同じ版は保存済み（開いている mmap を置き換えない）
+            return
+        meta = {'source': os.path.abspath(excel_file), 'sheet': sheet_name,
+                'size': entry['size'], 'mtime_ns': entry['mtime_ns'], 'parts': entry.get('parts')}
+        if not write_column_cache(path, entry['df'], meta):
+            logging.debug(f"Disk cache skipped for {excel_file} ({sheet_name}): unsupported frame layout")
+            return
+        logging.debug(f"Saved {excel_file} ({sheet_name}) to disk cache")
+        prefix = os.path.basename(path).split('-')[0] + '-'
+        for name in os.listdir(COLUMN_CACHE_DIR):
+            if name.startswith(prefix) and name.endswith('.colcache') and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(COLUMN_CACHE_DIR, name))
+                except OSError:
+                    pass
+    except Exception as e:
+        logging.warning(f"Failed to save disk cache: {e}")
+
+
+def read_column_cache_header(path: str) -> dict:
+    """列キャッシュのヘッダーだけを読む（mmap しない）"""
+    with open(path, 'rb') as f:
+        prefix = f.read(16)
+        if len(prefix) != 16 or prefix[:4] != _COLUMN_CACHE_MAGIC:
+            raise ValueError(f"not a column cache file: {path}")
+        schema, header_len = struct.unpack_from('<IQ', prefix, 4)
+        if schema != COLUMN_CACHE_SCHEMA:
+            raise ValueError(f"column cache schema {schema} != {COLUMN_CACHE_SCHEMA}")
+        return json.loads(f.read(header_len).decode('utf-8'))
+
+
+# ディスクキャッシュの掃除: 元のブックが削除・改名されたもの、ブックが更新されて古くなった版、
+# 旧形式の .pkl、書き込み途中で残った一時ファイルを消す。起動時と "cache_gc_interval" 秒ごとに実行。
+CACHE_GC_INTERVAL = float(CONFIG.get('cache_gc_interval', 3600))
+CACHE_GC_TEMP_AGE = 3600  # これより古い一時ファイルは書き込み途中で落ちた残骸とみなす
+DISK_CACHE_STATS = {'files': 0, 'bytes': 0, 'gc_removed': 0, 'last_gc': None}
+_CACHE_GC_STOP = threading.Event()
+
+
+def gc_disk_cache() -> int:
+    """不要になったディスクキャッシュを削除し、削除した数を返す"""
+    if not os.path.isdir(COLUMN_CACHE_DIR):
+        return 0
+    removed = 0
+    files = 0
+    total_bytes = 0
+    now = time.time()
+    for name in os.listdir(COLUMN_CACHE_DIR):
+        path = os.path.join(COLUMN_CACHE_DIR, name)
+        try:
+            stale = False
+            if name.endswith('.pkl'):
+                stale = True
+            elif name.endswith('.tmp'):
+                stale = now - os.path.getmtime(path) > CACHE_GC_TEMP_AGE
+            elif name.endswith('.colcache'):
+                try:
+                    header = read_column_cache_header(path)
+                    source = header.get('source')
+                    if not source or not os.path.exists(source):
+                        stale = True
+                    else:
+                        mtime_ns, size = file_signature(source)
+                        stale = (header.get('mtime_ns'), header.get('size')) != (mtime_ns, size)
+                except ValueError:
+                    stale = True
+            if stale:
+                os.remove(path)
+                removed += 1
+                logging.debug(f"Removed stale disk cache: {name}")
+            else:
+                files += 1
+                total_bytes += os.path.getsize(path)
+        except OSError:
+            # 使用中（Windows で mmap 中など）や同時に消されたものは次回
+            continue
+    DISK_CACHE_STATS.update({'files': files, 'bytes': total_bytes, 'last_gc': datetime.now().isoformat()})
+    DISK_CACHE_STATS['gc_removed'] += removed
+    if removed:
+        logging.info(f"Disk cache GC removed {removed} files")
+    return removed
+
+
+def _cache_gc_worker():
+    while True:
+        try:
+            gc_disk_cache()
+        except Exception as e:
+            logging.warning(f"Disk cache GC failed: {e}")
+        if _CACHE_GC_STOP.wait(CACHE_GC_INTERVAL):
+            return
+
+
+# --- Sheet Change Detection ---
+# 保存でブックの mtime が変わっても、シートの内容を決める zip パーツ（シート XML・共有文字列・スタイル・workbook.xml）の
+# CRC32 とサイズが前回と同じなら、そのシートのキャッシュ（DataFrame・ビュー・ディスクキャッシュ）はそのまま使う。
+# CRC とサイズは zip の central directory にあるのでパーツは展開しない（シート名 → パーツ名の対応はブック構成が変わったときだけ読む）。
+SHEET_CHANGE_STATS = {'checks': 0, 'unchanged': 0, 'changed': 0}
+_LAYOUT_PARTS = ('[Content_Types].xml', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels')
+_SHEET_PART_NAMES = {}  # {(excel_file, sheet_name): (ブック構成パーツの CRC, シートのパーツ名, 共有文字列のパーツ名)}
+
+
+def workbook_sheet_parts(excel_file: str, sheet_names) -> dict:
+    """{シート名: {パーツ名: [CRC32, サイズ]}}（ブックにないシートは含めない）"""
+    with zipfile.ZipFile(excel_file) as zf:
+        infos = {info.filename: info for info in zf.infolist()}
+        layout = tuple((infos[name].CRC, infos[name].file_size) if name in infos else None for name in _LAYOUT_PARTS)
+        result = {}
+        for sheet_name in sheet_names:
+            key = (os.path.abspath(excel_file), sheet_name)
+            known = _SHEET_PART_NAMES.get(key)
+            if known is None or known[0] != layout:
+                known = _SHEET_PART_NAMES[key] = (layout, _sheet_part_name(zf, sheet_name), _shared_strings_part(zf))
+            _, part_name, strings_part = known
+            if part_name is None:
+                continue
+            names = (part_name, strings_part, 'xl/styles.xml', 'xl/workbook.xml')
+            result[sheet_name] = {name: [infos[name].CRC, infos[name].file_size] for name in names if name in infos}
+    return result
+
+
+def sheet_parts(excel_file: str, sheet_names) -> dict:
+    """workbook_sheet_parts（zip として読めなければ {} = 比較しない）"""
+    try:
+        return workbook_sheet_parts(excel_file, sheet_names)
+    except (OSError, zipfile.BadZipFile, ET.ParseError, KeyError) as e:
+        logging.debug(f"Could not read sheet parts of {excel_file}: {e}")
+        return {}
+
+
+def revalidate_cached_sheet(filename: str, sheet_name: str, entry: dict, mtime_ns: int, size: int, parts: dict) -> bool:
+    """mtime/size の変わったキャッシュエントリのシートが実際には変わっていなければ、新しい版として使い続ける"""
+    if not entry.get('parts'):
+        return False
+    SHEET_CHANGE_STATS['checks'] += 1
+    if parts.get(sheet_name) != entry['parts'] or not CACHE.revalidate((filename, sheet_name), entry, mtime_ns, size):
+        SHEET_CHANGE_STATS['changed'] += 1
+        return False
+    SHEET_CHANGE_STATS['unchanged'] += 1
+    logging.debug(f"{filename} ({sheet_name}) unchanged since last read, keeping cached frame")
+    return True
+
+
+def retag_column_cache(excel_file: str, sheet_name: str, size: int, mtime_ns: int, parts: Optional[dict]) -> Optional[ColumnCacheFile]:
+    """
+    ブックの前の版で保存した列キャッシュのシートのパーツが現在と同じなら、
+    ヘッダーの版だけ書き換えて現在の版の列キャッシュにする（列バッファはそのままコピー）
+    """
+    if not parts or not os.path.isdir(COLUMN_CACHE_DIR):
+        return None
+    path = column_cache_path(excel_file, sheet_name, size, mtime_ns)
+    prefix = os.path.basename(path).split('-')[0] + '-'
+    for name in os.listdir(COLUMN_CACHE_DIR):
+        if not name.startswith(prefix) or not name.endswith('.colcache') or name == os.path.basename(path):
+            continue
+        old_path = os.path.join(COLUMN_CACHE_DIR, name)
+        try:
+            header = read_column_cache_header(old_path)
+            if header.get('parts') != parts or header.get('source') != os.path.abspath(excel_file) \
+                    or header.get('sheet') != sheet_name:
+                continue
+            new_header = json.dumps({**header, 'size': size, 'mtime_ns': mtime_ns}, ensure_ascii=False).encode('utf-8')
+            new_prefix = _COLUMN_CACHE_MAGIC + struct.pack('<IQ', COLUMN_CACHE_SCHEMA, len(new_header)) + new_header
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(old_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                    _, header_len = struct.unpack_from('<IQ', src.read(16), 4)
+                    src.seek(_align(16 + header_len))
+                    dst.write(new_prefix.ljust(_align(len(new_prefix)), b'\0'))
+                    shutil.copyfileobj(src, dst)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except (OSError, ValueError) as e:
+            logging.debug(f"Could not reuse disk cache {name}: {e}")
+            continue
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass  # 使用中なら GC で消す
+        logging.debug(f"Reused disk cache of unchanged {excel_file} ({sheet_name})")
+        return ColumnCacheFile(path)
+    return None
+
+
+def get_cached_dataframe(filename: str, sheet_name: str, copy: bool = True, fresh: bool = False) -> pd.DataFrame:
     """
     Get dataframe from cache or read from Excel file if modified or not in cache.
+    営業日報は write-behind ジャーナルの未反映分を重ねて返す。
+    copy=False はキャッシュの DataFrame をそのまま返す（呼び出し側で変更しないこと）。
+    stale_while_revalidate が有効なら、ブックが更新されていても前の版を返すことがある。fresh=True は必ず現在の版を返す。
+    """
+    if sheet_name == '営業日報' and pending_journal_entries(filename):
+        # 未反映分はコピーに対して重ねる
+        return overlay_pending_writes(filename, read_cached_dataframe(filename, sheet_name, fresh=fresh))
+    return read_cached_dataframe(filename, sheet_name, copy, fresh)
+
+
+def file_signature(path: str) -> tuple:
+    """キャッシュの有効性判定に使う (mtime_ns, size)"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def cache_entry_frame(entry: dict) -> pd.DataFrame:
+    """キャッシュエントリの DataFrame（ディスクキャッシュから開いた場合は最初に使うときに全列を読み込む）"""
+    if entry.get('df') is None:
+        entry['df'] = entry['store'].frame()
+    return entry['df']
+
+
+def read_cached_dataframe(filename: str, sheet_name: str, copy: bool = True, fresh: bool = False) -> pd.DataFrame:
+    """
+    Read dataframe from in-memory / disk cache, or from the Excel file if modified.
+    """
+    entry = read_cache_entry(filename, sheet_name, fresh)
+    materialized = entry.get('df') is None
+    df = cache_entry_frame(entry)
+    if materialized:
+        CACHE.update_bytes((filename, sheet_name), entry)
+    return df.copy() if copy else df
+
+
+def read_cache_entry(filename: str, sheet_name: str, fresh: bool = False) -> dict:
+    """
+    シートのキャッシュエントリ（メモリ・ディスクキャッシュになければ Excel から読み込む）。
+    ディスクキャッシュから開いたエントリは 'df' が None のまま（列は 'store' から必要な分だけ読む）
     """
     excel_file = os.path.join(EXCEL_DIR, filename)
     
-    if not os.path.exists(excel_file):
+    signature = workbook_signature(excel_file)
+    if signature is None:
         logging.error(f"File not found: {excel_file}")
         raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found at {excel_file}")
     
-    current_mtime = os.path.getmtime(excel_file)
+    current_mtime_ns, current_size = signature
     cache_key = (filename, sheet_name)
     
+    # ブックが更新されていても、このシートのパーツが変わっていなければキャッシュを使い続ける
+    parts = None
+    stale = CACHE.get(cache_key)
+    if stale is not None and (stale['mtime_ns'], stale['size']) != (current_mtime_ns, current_size) and stale.get('parts'):
+        parts = sheet_parts(excel_file, [sheet_name])
+        revalidate_cached_sheet(filename, sheet_name, stale, current_mtime_ns, current_size, parts)
+    
+    # 変わっていたら、読み込みを待たずに前の版を返す（新しい版はバックグラウンドで読み込む）
+    if stale is not None and (stale['mtime_ns'], stale['size']) != signature and can_serve_stale(filename, signature, fresh):
+        revalidate_in_background(('sheet', filename, sheet_name, current_mtime_ns, current_size),
+                                 lambda: load_sheet_entry(filename, sheet_name, current_mtime_ns, current_size, parts))
+        return stale
+    
     # --- In-Memory Cache Check ---
-    if cache_key in CACHE:
-        cached_data = CACHE[cache_key]
-        if cached_data['mtime'] == current_mtime:
-            return cached_data['df'].copy() # Return copy to prevent mutation of cached data
+    cached_data = CACHE.lookup(cache_key, current_mtime_ns, current_size)
+    if cached_data is not None:
+        return cached_data
+
+    # 同じシート・同じ版の読み込みが実行中なら、その結果を待つ
+    return SINGLE_FLIGHT.do(('sheet', filename, sheet_name, current_mtime_ns, current_size),
+                            lambda: load_sheet_entry(filename, sheet_name, current_mtime_ns, current_size, parts))
+
+
+def load_sheet_entry(filename: str, sheet_name: str, mtime_ns: int, size: int, parts: Optional[dict]) -> dict:
+    """メモリにないシートをディスクキャッシュ、なければ Excel から読み込んでキャッシュに入れ、エントリを返す"""
+    excel_file = os.path.join(EXCEL_DIR, filename)
 
     # --- Disk Cache Check ---
-    # Create cache directory if needed
-    CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
-        
-    # Create unique cache filename based on file path and sheet
-    cache_id = hashlib.md5(f"{filename}_{sheet_name}".encode('utf-8')).hexdigest()
-    cache_path = os.path.join(CACHE_DIR, f"{cache_id}.pkl")
-    
     try:
-        if os.path.exists(cache_path):
-            with open(cache_path, 'rb') as f:
-                disk_cache = pickle.load(f)
-            
-            # Use disk cache if timestamp matches
-            if disk_cache.get('mtime') == current_mtime:
-                logging.debug(f"Loaded {filename} ({sheet_name}) from disk cache")
-                df = disk_cache['df']
-                # Update in-memory cache
-                CACHE[cache_key] = {'mtime': current_mtime, 'df': df}
-                return df.copy()
+        store = load_column_cache(excel_file, sheet_name, size, mtime_ns)
+        if store is None:
+            if parts is None:
+                parts = sheet_parts(excel_file, [sheet_name])
+            store = retag_column_cache(excel_file, sheet_name, size, mtime_ns, parts.get(sheet_name))
+        if store is not None:
+            logging.debug(f"Loaded {filename} ({sheet_name}) from disk cache")
+            # Update in-memory cache（列は使うときに読み込む）
+            entry = {'mtime_ns': mtime_ns, 'size': size, 'df': None, 'store': store,
+                     'parts': store.header.get('parts')}
+            CACHE.put((filename, sheet_name), entry)
+            return entry
     except Exception as e:
         logging.warning(f"Failed to load from disk cache: {e}")
 
     # --- Read from Excel (Expensive Operation) ---
     try:
-        logging.debug(f"Reading Excel {excel_file}, sheet={sheet_name}")
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, header=0)
-        
-        # Update in-memory cache
-        CACHE[cache_key] = {'mtime': current_mtime, 'df': df}
-        
-        # Update disk cache
-        try:
-            with open(cache_path, 'wb') as f:
-                pickle.dump({'mtime': current_mtime, 'df': df}, f)
-            logging.debug(f"Saved {filename} ({sheet_name}) to disk cache")
-        except Exception as e:
-            logging.warning(f"Failed to save disk cache: {e}")
-            
-        return df.copy()
+        return load_sheet_from_excel(filename, sheet_name, mtime_ns, size)
     except Exception as e:
         logging.error(f"Reading Excel failed: {e}")
         import traceback
@@ -322,148 +1313,905 @@ def get_cached_dataframe(filename: str, sheet_name: str) -> pd.DataFrame:
         raise HTTPException(status_code=500, detail=f"Error reading Excel file: {str(e)}")
 
 
-@app.get("/api/customers")
-def get_customers(filename: str = DEFAULT_EXCEL_FILE):
-    """Get customer list from the Excel file"""
-    try:
-        # Get dataframe from cache
-        df = get_cached_dataframe(filename, '得意先_List')
-        
-        # Clean up column names
-        df.columns = [str(col).replace('\n', '').strip() for col in df.columns]
-        
-        # デバッグログ: カラム名を出力
-        logging.info(f"得意先_List columns: {list(df.columns)}")
-        
-        # 現目標カラムの存在確認
-        target_col = None
-        for col in df.columns:
-            if '現目標' in col or '目標' in col:
-                target_col = col
-                logging.info(f"Found target column: '{col}'")
-        
-        # Rename specific columns
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-            '直送先CD.': '直送先CD',
-        })
-        
-        # Fill NaN values with empty strings
-        df = df.fillna(value='')
-        
-        # Convert to dict
-        records = df.to_dict(orient="records")
-        
-        # デバッグ: 最初のレコードの現目標値を確認
-        if records and len(records) > 0:
-            sample = records[0]
-            logging.info(f"Sample record keys: {list(sample.keys())}")
-            if '現目標' in sample:
-                logging.info(f"Sample 現目標 value: '{sample.get('現目標')}'")
-            else:
-                logging.warning("現目標 column not found in record!")
-        
-        # Clean the records
-        import math
-        cleaned_records = []
-        for record in records:
-            cleaned_record = {}
-            for key, value in record.items():
-                if isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        cleaned_record[key] = None
-                    else:
-                        cleaned_record[key] = value
-                elif value == '':
-                    cleaned_record[key] = None
-                elif isinstance(value, str):
-                    import re
-                    cleaned_value = re.sub(r'_x000D_', '\n', value)
-                    cleaned_value = cleaned_value.replace('\r', '')
-                    cleaned_record[key] = cleaned_value
-                else:
-                    cleaned_record[key] = value
-            cleaned_records.append(cleaned_record)
+def load_sheet_from_excel(filename: str, sheet_name: str, mtime_ns: int, size: int) -> dict:
+    """
+    Excel からシートを読み込んでエントリを返す。WORKBOOK_SHEETS は1回の読み込みでまとめて読むので、
+    同じブック・同じ版の読み込みが実行中なら、別のシートのための読み込みでもその結果を待つ。
+    """
+    group = 'workbook' if sheet_name in WORKBOOK_SHEETS else sheet_name
+    entries = SINGLE_FLIGHT.do(('excel', filename, group, mtime_ns, size),
+                               lambda: load_workbook_sheets(filename, sheet_name, mtime_ns, size))
+    if sheet_name not in entries:
+        # 待っていた読み込みには含まれていなかった（その時点ではキャッシュ済みだったなど）
+        entries = load_workbook_sheets(filename, sheet_name, mtime_ns, size)
+    if entries[sheet_name] is None:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return entries[sheet_name]
 
-        return cleaned_records
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
+def load_workbook_sheets(filename: str, sheet_name: str, mtime_ns: int, size: int) -> dict:
+    """
+    sheet_name を Excel から読み込み、同じブックの WORKBOOK_SHEETS でまだキャッシュにないシートも
+    同じ1回の読み込みで取り出して、メモリ・ディスクキャッシュに入れる。
+    読んだシートごとのエントリを返す {シート名: エントリ}（ブックにないシートは None）。
+    """
+    excel_file = os.path.join(EXCEL_DIR, filename)
+    others = [other for other in WORKBOOK_SHEETS if other != sheet_name] if sheet_name in WORKBOOK_SHEETS else []
+    parts = sheet_parts(excel_file, [sheet_name] + others)
+    sheet_names = [sheet_name]
+    for other in others:
+        cached = CACHE.get((filename, other))
+        if cached is not None and ((cached['mtime_ns'], cached['size']) == (mtime_ns, size)
+                                   or revalidate_cached_sheet(filename, other, cached, mtime_ns, size, parts)):
+            continue
+        if os.path.exists(column_cache_path(excel_file, other, size, mtime_ns)):
+            continue
+        sheet_names.append(other)
+
+    logging.debug(f"Reading Excel {excel_file}, sheets={sheet_names} ({SHEET_READER})")
+    frames = read_sheets_in_pool(excel_file, sheet_names)
+    entries = dict.fromkeys(sheet_names)
+    for name, df in frames.items():
+        entries[name] = {'mtime_ns': mtime_ns, 'size': size, 'df': df, 'parts': parts.get(name)}
+        CACHE.put((filename, name), entries[name])
 
-@app.get("/api/priority-customers")
-def get_priority_customers(filename: str = DEFAULT_EXCEL_FILE):
-    """得意先_Listからカラム H (重点顧客) が「重点」の顧客を取得。カラム I の担当者情報も含める"""
+    # ディスクキャッシュは要求されたシートはすぐ、ついでに読んだシートはバックグラウンドで保存
+    for name, entry in entries.items():
+        if entry is None:
+            continue
+        if name == sheet_name:
+            save_column_cache(excel_file, name, entry)
+        else:
+            threading.Thread(target=save_column_cache, args=(excel_file, name, entry), daemon=True).start()
+    return entries
+
+
+def write_through_cache(filename: str, before: tuple, mutations: list, results: list):
+    """保存した変更をキャッシュ済みの営業日報にも適用し、保存後の mtime/size を記録（次の読み込みで再パースしない）"""
+    excel_file = os.path.join(EXCEL_DIR, filename)
+    cache_key = (filename, '営業日報')
+    cached = CACHE.get(cache_key)
+    if cached is None:
+        return
+    if (cached['mtime_ns'], cached['size']) != before:
+        # 保存前のファイルと一致しないキャッシュは使えないので、次回読み直す
+        CACHE.pop(cache_key, None)
+        return
+    
+    frame_mutations = []
+    for m, result in zip(mutations, results):
+        if result['status'] != 'ok':
+            continue
+        if m['op'] == 'add':
+            # 管理番号・現目標はレーンで決まった値を使う
+            frame_mutations.append({'op': 'add', 'management_number': result['management_number'], 'values': result['values']})
+        else:
+            frame_mutations.append(m)
     try:
-        # 得意先_Listを読み込み
-        df = get_cached_dataframe(filename, '得意先_List')
-        
-        # カラム名をクリーンアップ
-        df.columns = [str(col).replace('\n', '').strip() for col in df.columns]
-        
-        # カラム名を保存
-        col_customer_cd = df.columns[0]  # 得意先CD
-        col_customer_name = df.columns[1] if len(df.columns) > 1 else None  # 得意先名
-        col_priority = df.columns[7] if len(df.columns) > 7 else None  # カラムH: 重点顧客
-        col_staff = df.columns[8] if len(df.columns) > 8 else None  # カラムI: 担当者
-        
-        # 得意先CDがある行のみ抽出（ヘッダー行や空行を除外）
-        df = df.dropna(subset=[col_customer_cd])
+        old_df = cache_entry_frame(cached)
+        df = apply_mutations_to_frame(old_df.copy(), frame_mutations)
+        mtime_ns, size = file_signature(excel_file)
+        parts = sheet_parts(excel_file, ['営業日報']).get('営業日報')
+    except Exception as e:
+        logging.warning(f"Write-through cache update failed for {filename}: {e}")
+        CACHE.pop(cache_key, None)
+        return
+    
+    old_dtypes = old_df.dtypes
+    if any(col in old_dtypes and old_dtypes[col] != object and df[col].dtype == object for col in df.columns):
+        # 数値列に文字列が入った場合、元が文字列だった数字を区別できないので読み直しに任せる
+        CACHE.pop(cache_key, None)
+        return
+    
+    entry = {'mtime_ns': mtime_ns, 'size': size, 'df': df, 'parts': parts}
+    CACHE.put(cache_key, entry)
+    # ディスクキャッシュはバックグラウンドで更新
+    threading.Thread(target=save_column_cache, args=(excel_file, '営業日報', entry), daemon=True).start()
+
+
+# --- Normalized Sheet Views ---
+# 読み込み系エンドポイントが毎回行っていたヘッダー整形・列名の統一・コードの文字列化・テキストの整形を
+# ブックの版（mtime_ns, size と未反映の変更）ごとに一度だけ行い、全リクエストで共有する。
+# ビューはキャッシュの DataFrame をコピーせずに参照するので、エンドポイントでは変更しないこと。
+REPORT_COLUMN_RENAMES = {
+    '得意先CD.': '得意先CD',
+    '訪問先名得意先名': '訪問先名',
+    '直送先CD.': '直送先CD',
+    '直送先名.': '直送先名',
+    'コメント': '上長コメント',  # Excel uses 'コメント' for manager comment
+}
+CUSTOMER_COLUMN_RENAMES = {
+    '得意先CD.': '得意先CD',
+    '直送先CD.': '直送先CD',
+}
+SHEET_COLUMN_RENAMES = {
+    '営業日報': REPORT_COLUMN_RENAMES,
+    '得意先_List': CUSTOMER_COLUMN_RENAMES,
+}
+CODE_COLUMNS = ('得意先CD', '直送先CD')
+REPORT_DATE_FORMATS = ('%y/%m/%d', '%Y/%m/%d', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S')
+
+
+def clean_text(value: str) -> str:
+    """Excel の改行の名残 (_x000D_, \r) を整える"""
+    return value.replace('_x000D_', '\n').replace('\r', '')
+
+
+def canonical_code(value) -> Optional[str]:
+    """得意先CD などのコードを文字列に揃える（Excel の数値 1003.0 → '1003'、空は None）"""
+    if value is None or isinstance(value, bool):
+        return None if value is None else str(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    text = str(value).strip()
+    return text or None
+
+
+def canonical_code_param(code: str) -> Optional[str]:
+    """URL で受け取ったコードを canonical_code と同じ形に（'1003.0' も '1003' と同じ得意先）"""
+    try:
+        return canonical_code(float(code))
+    except ValueError:
+        return canonical_code(code)
+
+
+def parse_report_date(value):
+    """日付セルを Timestamp に（Excel の日付はそのまま、'25/10/01' のような入力値も読む。読めなければ NaT）"""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return pd.Timestamp(value)
+    if isinstance(value, str):
+        text = value.strip()
+        for fmt in REPORT_DATE_FORMATS:
+            try:
+                return pd.Timestamp(datetime.strptime(text, fmt))
+            except ValueError:
+                continue
+    return pd.NaT
+
+
+def clean_column(series: pd.Series, code: bool = False, date: bool = False) -> list:
+    """
+    1 列分を JSON で返せる値のリストに（NaN・空文字は None、コードは文字列、テキストは整形）。
+    セルごとに型を調べず、列の型ごとにまとめて処理する。
+    """
+    if date:
+        # 日付列は文字列にして返す（NaT は空文字 → None）
+        series = (series.fillna('') if series.hasnans else series).astype(str)
+    dtype = series.dtype
+    if dtype.kind in 'iub':
+        return series.tolist()
+    if dtype.kind == 'f':
+        arr = series.to_numpy()
+        finite = np.isfinite(arr)
+        out = np.full(len(arr), None, dtype=object)
+        if code:
+            # Convert customer code to string without decimal
+            out[finite] = [str(int(value)) for value in arr[finite].tolist()]
+        else:
+            out[finite] = arr[finite].tolist()
+        return out.tolist()
+    if dtype.kind == 'M':
+        # fillna('') は datetime64 列の NaT を置き換えないので、以前と同じく NaT のまま返す
+        return series.tolist()
+
+    # object 列: 文字列はまとめて整形し、空文字・NaN・None は None に
+    values = series.to_numpy(dtype=object, copy=True)
+    missing = series.isna().to_numpy()
+    is_str = np.fromiter((type(value) is str for value in values), dtype=bool, count=len(values))
+    if is_str.any():
+        texts = series[is_str]
+        values[is_str] = texts.str.replace('_x000D_', '\n', regex=False).str.replace('\r', '', regex=False).to_numpy()
+        values[np.flatnonzero(is_str)[(texts == '').to_numpy()]] = None
+    values[missing] = None
+    # 文字列以外（数値・日時など）は数が少ないので個別に
+    for i in np.flatnonzero(~is_str & ~missing):
+        value = values[i]
+        if isinstance(value, np.generic):
+            value = values[i] = value.item()
+        if isinstance(value, float):
+            if math.isinf(value):
+                values[i] = None
+            elif code:
+                values[i] = str(int(value))
+        elif isinstance(value, str):
+            # str のサブクラス
+            values[i] = None if value == '' else clean_text(value)
+    return values.tolist()
+
+
+def clean_columns(df: pd.DataFrame, code_columns: tuple = (), date_columns: tuple = ()) -> dict:
+    """DataFrame を {列名: 整形済みの値のリスト} に"""
+    return {
+        col: clean_column(df.iloc[:, i], code=col in code_columns, date=col in date_columns)
+        for i, col in enumerate(df.columns)
+    }
+
+
+def clean_records(df: pd.DataFrame, code_columns: tuple = (), date_columns: tuple = ()) -> list:
+    """DataFrame を JSON で返せるレコードのリストに（NaN・空文字は None、コードは文字列、テキストは整形）"""
+    columns = clean_columns(df, code_columns, date_columns)
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())] if keys else [{} for _ in range(len(df))]
+
+
+_encode_json_string = json.encoder.encode_basestring  # ensure_ascii=False と同じ文字列のエンコード
+
+
+def _encode_json_value(value) -> str:
+    if value is None:
+        return 'null'
+    value_type = type(value)
+    if value_type is str:
+        return _encode_json_string(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float:
+        return float.__repr__(value)
+    if value_type is bool:
+        return 'true' if value else 'false'
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+
+def encode_records_json(columns: dict, nrows: int) -> bytes:
+    """
+    clean_columns の結果を列ごとにエンコードしてレコードの JSON 配列にする。
+    encode_json(clean_records(...)) とバイト単位で同じ結果になる。
+    """
+    if not columns:
+        return encode_json([{} for _ in range(nrows)])
+    fragments = []
+    for key, values in columns.items():
+        prefix = _encode_json_string(key) + ':'
+        fragments.append([prefix + _encode_json_value(value) for value in values])
+    if nrows == 0:
+        return b'[]'
+    return ('[{' + '},{'.join(map(','.join, zip(*fragments))) + '}]').encode('utf-8')
+
+
+def approx_bytes(obj) -> int:
+    """派生データのおおよそのメモリ量（キャッシュの上限計算用）"""
+    if isinstance(obj, pd.DataFrame):
+        return frame_bytes(obj)
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_bytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(approx_bytes(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+class SheetView:
+    """
+    正規化済みのシート（読み取り専用・全リクエストで共有）
+    columns: 列名（改行・前後の空白を除き SHEET_COLUMN_RENAMES で統一）
+    column(name) / select(names): 必要な列だけの Series / DataFrame。値は読み込んだまま
+    frame: 全列の DataFrame（列キャッシュから開いたシートでは初回参照時に全列を読み込むので、列が決まっていれば column / select を使う）
+    codes: 得意先CD / 直送先CD を文字列に揃えた Series（string 型、空は <NA>）
+    dates: 日付 を datetime64 にした Series（営業日報のみ、初回参照時に作る）
+    derived(name, build): build(view) の結果を版ごとに一度だけ計算して使い回す
+    """
+
+    def __init__(self, sheet_name: str, source, load_frame=None, on_load=None):
+        """
+        source: キャッシュの DataFrame、または列キャッシュ (ColumnCacheFile)。
+        load_frame: source が列キャッシュのとき全列の DataFrame を返す関数（キャッシュのエントリと共有するため）
+        on_load: source が列キャッシュのとき、列を新しく読み込んだあとに呼ぶ（キャッシュのサイズの計り直し）
+        """
+        renames = SHEET_COLUMN_RENAMES.get(sheet_name, {})
+        columns = []
+        for col in source.columns:
+            name = str(col).replace('\n', '').strip()
+            columns.append(renames.get(name, name))
+        self.sheet_name = sheet_name
+        self.source = source  # 元の（キャッシュの）DataFrame / ColumnCacheFile
+        self.columns = columns
+        self._source_columns = {name: (i, col) for i, (name, col) in enumerate(zip(columns, source.columns))}
+        self.load_frame = load_frame
+        self.on_load = on_load
+        self._lock = threading.RLock()
+        if isinstance(source, pd.DataFrame):
+            self._frame = source.set_axis(columns, axis=1, copy=False)
+            self.index = source.index
+        else:
+            self._frame = None
+            self.index = pd.RangeIndex(source.nrows)
+        self.nrows = len(self.index)
+        self.codes = {}
+        for col in CODE_COLUMNS:
+            if col in self._source_columns:
+                values = [canonical_code(value) for value in self.column(col).tolist()]
+                self.codes[col] = pd.Series(values, index=self.index, dtype='string')
+        self.version = None
+        self.on_resize = None
+        self._derived = {}
+        self._derived_bytes = 0
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    df = self.load_frame() if self.load_frame is not None else self.source.frame()
+                    self._frame = df.set_axis(self.columns, axis=1, copy=False)
+                    if self.on_load is not None:
+                        self.on_load()
+        return self._frame
+
+    def column(self, name: str) -> pd.Series:
+        """1列分の Series（同じ列名が複数あれば、レコードと同じく最後の列）"""
+        position, source_column = self._source_columns[name]
+        if self._frame is not None:
+            return self._frame.iloc[:, position]
+        loaded = self.source.resident_bytes()
+        series = self.source.series(source_column)
+        if self.on_load is not None and self.source.resident_bytes() != loaded:
+            self.on_load()
+        return series.rename(name, copy=False)
+
+    def select(self, names) -> pd.DataFrame:
+        """names の列だけの DataFrame（ビューにない列名は除く）。使わない列は読み込まない"""
+        names = [name for name in dict.fromkeys(names) if name in self._source_columns]
+        return pd.DataFrame({name: self.column(name) for name in names}, index=self.index, columns=names, copy=False)
+
+    @property
+    def dates(self) -> pd.Series:
+        return self.derived('dates', lambda view: pd.Series(
+            [parse_report_date(value) for value in view.column('日付').tolist()],
+            index=view.index, dtype='datetime64[ns]'))
+
+    def code_mask(self, column: str, code: Optional[str]) -> np.ndarray:
+        """コード列が code と一致する行"""
+        return self.codes[column].eq(code).fillna(False).to_numpy(dtype=bool)
+
+    def derived(self, name: str, build):
+        if name in self._derived:
+            return self._derived[name]
+        with self._lock:
+            # 同時に要求されても作るのは1回（build の中から別の派生データを使ってもよい）
+            if name not in self._derived:
+                value = build(self)
+                self._derived[name] = value
+                self._derived_bytes += approx_bytes(value)
+                if self.on_resize is not None:
+                    self.on_resize()
+        return self._derived[name]
+
+    def resident_bytes(self) -> int:
+        # frame・読み込んだ列はシートのエントリ（DataFrame / 列キャッシュ）と共有しているので数えない
+        # （LRUCache はそのエントリを捨てるときにビューも捨てる）
+        return sum(approx_bytes(codes) for codes in self.codes.values()) + self._derived_bytes
+
+
+def sheet_version(filename: str, sheet_name: str, request: Optional[Request] = None) -> dict:
+    """
+    シートのデータの版: {'tag': str, 'mtime_ns': int, 'size': int, 'pending': 未反映の変更の版}
+    tag はレスポンスの X-Data-Version / ETag に使う。ファイルの stat だけで求まる。
+    request に Cache-Control: no-cache があれば、信用期間中の stat を使わずに確認し直す。
+    """
+    excel_file = os.path.join(EXCEL_DIR, filename)
+    if request is not None:
+        record_workbook_access(filename)
+    signature = workbook_signature(excel_file, revalidate=request is not None and wants_revalidation(request))
+    if signature is None:
+        logging.error(f"File not found: {excel_file}")
+        raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found at {excel_file}")
+    pending = pending_writes_token(filename) if sheet_name == '営業日報' else None
+    mtime_ns, size = signature
+    tag = f"{mtime_ns:x}-{size:x}"
+    if pending is not None:
+        tag += f"-p{pending[0]}.{pending[2]}"
+    return {'tag': tag, 'mtime_ns': mtime_ns, 'size': size, 'pending': pending}
+
+
+def get_sheet_view(filename: str, sheet_name: str, fresh: bool = False) -> SheetView:
+    """
+    ブックの現在の版の SheetView（なければ作る）。
+    stale_while_revalidate が有効なら前の版のビューを返すことがある（view.version['superseded_at'] が付く）。
+    fresh=True は必ず現在の版を返す。
+    """
+    # 版を先に確認してから読み込む（途中で更新されても古い版として捨てられるだけ）
+    version = sheet_version(filename, sheet_name)
+    key = (filename, sheet_name, 'view')
+    stale = CACHE.get(key)
+    if stale is not None and (stale['mtime_ns'], stale['size']) != (version['mtime_ns'], version['size']) \
+            and stale.get('pending') == version['pending'] \
+            and can_serve_stale(filename, (version['mtime_ns'], version['size']), fresh):
+        view = stale['view']
+        view.version['superseded_at'] = version['mtime_ns']
+        revalidate_in_background(('view', filename, sheet_name, version['tag']),
+                                 lambda: build_sheet_view(filename, sheet_name, version, stale))
+        return view
+    entry = CACHE.lookup(key, version['mtime_ns'], version['size'], version['pending'])
+    if entry is not None:
+        # ビューの frame はシートの DataFrame のエントリとして数えているので、そちらも使ったことにする
+        CACHE.touch((filename, sheet_name))
+        return entry['view']
+    # 同じ版のビューを作っている途中なら、それを待つ
+    return SINGLE_FLIGHT.do(('view', filename, sheet_name, version['tag']),
+                            lambda: build_sheet_view(filename, sheet_name, version, stale))
+
+
+def build_sheet_view(filename: str, sheet_name: str, version: dict, stale: Optional[dict]) -> SheetView:
+    """version の SheetView を作ってキャッシュに入れる（stale は前の版のビューのエントリ）"""
+    key = (filename, sheet_name, 'view')
+    source, sheet_entry = sheet_view_source(filename, sheet_name)
+    if stale is not None and stale['view'].source is source and stale.get('pending') == version['pending']:
+        # シートが変わっていない（同じ DataFrame を使い続けている）ので、ビューと派生データも使い続ける
+        view = stale['view']
+        view.version = version
+        stale['mtime_ns'], stale['size'] = version['mtime_ns'], version['size']
+        CACHE.put(key, stale)
+        if sheet_name == '営業日報' and report_changes_tracked(filename):
+            record_report_generation(filename, view)
+        return view
+
+    if sheet_entry is not None:
+        sheet_key = (filename, sheet_name)
+        view = SheetView(sheet_name, source, load_frame=lambda: cache_entry_frame(sheet_entry),
+                         on_load=lambda: CACHE.update_bytes(sheet_key, sheet_entry))
+    else:
+        view = SheetView(sheet_name, source)
+    view.version = version
+    entry = {'mtime_ns': version['mtime_ns'], 'size': version['size'], 'pending': version['pending'], 'view': view}
+    view.on_resize = lambda: CACHE.update_bytes(key, entry)
+    CACHE.put(key, entry)
+    if sheet_name == '営業日報' and report_changes_tracked(filename):
+        record_report_generation(filename, view)
+    return view
+
+
+def sheet_view_source(filename: str, sheet_name: str) -> tuple:
+    """
+    ビューの元データと、そのシートのキャッシュエントリ。
+    列キャッシュから開いたシートは (ColumnCacheFile, エントリ)（列はビューが使うときに読む。
+    全列の DataFrame を組み立て済みでも、その列は列キャッシュと共有している）、Excel から読んだシートは (DataFrame, None)。
+    営業日報に未反映の変更があれば、それを重ねた DataFrame
+    """
+    if sheet_name == '営業日報' and pending_journal_entries(filename):
+        return get_cached_dataframe(filename, sheet_name, copy=False, fresh=True), None
+    entry = read_cache_entry(filename, sheet_name, fresh=True)
+    if entry.get('store') is not None:
+        return entry['store'], entry
+    return entry['df'], None
+
+
+def report_column(view: SheetView, name: str) -> list:
+    """営業日報の1列分の整形済みの値（列ごと・版ごとに一度だけ作る）"""
+    return view.derived(f'column:{name}', lambda v: clean_column(v.column(name), code=name in CODE_COLUMNS, date=name == '日付'))
+
+
+def report_columns(view: SheetView, names=None) -> dict:
+    """{列名: 整形済みの値のリスト}。names を指定するとその列だけを読み込んで整形する"""
+    return {name: report_column(view, name) for name in (view.columns if names is None else names)}
+
+
+def build_report_positions(view: SheetView) -> dict:
+    """管理番号 → 行位置（同じ番号が複数あれば最初の行）"""
+    positions = {}
+    for position, number in enumerate(view.column('管理番号').tolist()):
+        positions.setdefault(number, position)
+    return positions
+
+
+def encode_report_records(view: SheetView) -> bytes:
+    return encode_records_json(report_columns(view), view.nrows)
+
+
+def encode_customer_records(view: SheetView) -> bytes:
+    columns = {name: clean_column(view.column(name)) for name in view.columns}
+    
+    # デバッグ: 最初のレコードの現目標値を確認
+    if view.nrows:
+        logging.info(f"Sample record keys: {list(columns.keys())}")
+        if '現目標' in columns:
+            logging.info(f"Sample 現目標 value: '{columns['現目標'][0]}'")
+        else:
+            logging.warning("現目標 column not found in record!")
+    return encode_records_json(columns, view.nrows)
+
+
+# --- Pre-serialized Responses ---
+# 一覧系のレスポンスは JSON にエンコードしたバイト列（と gzip 圧縮したもの）を SheetView の派生データとして
+# 版ごとに一度だけ作り、そのまま返す。メモリはビューの分としてキャッシュの上限に含まれる。
+# config.json の "response_gzip": false で圧縮を無効化。
+RESPONSE_GZIP = bool(CONFIG.get('response_gzip', True))
+RESPONSE_GZIP_MIN_BYTES = 1024  # これより小さいレスポンスは圧縮しない
+
+
+def encode_json(content) -> bytes:
+    """FastAPI が返すのと同じ JSON のバイト列"""
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+def accepts_gzip(request: Request) -> bool:
+    for part in request.headers.get('accept-encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def cached_json_response(request: Request, view: SheetView, name: str, encode) -> Response:
+    """encode(view) が作る JSON のバイト列を版ごとに一度だけ作って返す（クライアントが対応していれば gzip で）"""
+    raw = view.derived(f'{name}.json', encode)
+    if RESPONSE_GZIP and len(raw) >= RESPONSE_GZIP_MIN_BYTES and accepts_gzip(request):
+        headers = validator_headers(request, view.version, 'gzip')
+        headers['Content-Encoding'] = 'gzip'
+        body = view.derived(f'{name}.json.gz', lambda v: gzip.compress(raw, compresslevel=6))
+        return Response(content=body, media_type='application/json', headers=headers)
+    return Response(content=raw, media_type='application/json', headers=validator_headers(request, view.version))
+
+
+# --- Conditional GET ---
+# ブック・売上 CSV を元にした読み込み系エンドポイントは、データの版とクエリから作った強い ETag と
+# Last-Modified を返し、If-None-Match / If-Modified-Since が一致すれば本文なしの 304 を返す。
+# 版は X-Data-Version ヘッダーでも返す。Cache-Control: no-cache なのでブラウザは毎回確認しに来る。
+VERSION_HEADER = 'X-Data-Version'
+
+
+def representation_etag(request: Request, version: dict, encoding: str = 'identity') -> str:
+    params = sorted(request.query_params.multi_items())
+    digest = hashlib.sha1(f"{request.url.path}|{params}|{version['tag']}|{encoding}".encode('utf-8')).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def validator_headers(request: Request, version: dict, encoding: str = 'identity') -> dict:
+    headers = {
+        'ETag': representation_etag(request, version, encoding),
+        VERSION_HEADER: version['tag'],
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if version.get('mtime_ns') is not None:
+        headers['Last-Modified'] = formatdate(version['mtime_ns'] / 1e9, usegmt=True)
+    if version.get('superseded_at') is not None:
+        # stale_while_revalidate で前の版を返した: ブックが更新されてからの秒数
+        headers[STALE_HEADER] = str(max(0, int(time.time() - version['superseded_at'] / 1e9)))
+    return headers
+
+
+def not_modified_response(request: Request, version: dict, encodings: tuple = ('identity',)) -> Optional[Response]:
+    """クライアントの持っている版が最新なら 304 を返す（違えば None）"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if RESPONSE_GZIP and 'gzip' in encodings and accepts_gzip(request):
+            candidates = {representation_etag(request, version, encoding) for encoding in encodings}
+        else:
+            candidates = {representation_etag(request, version)}
+        # If-None-Match は弱い比較（W/ を無視）
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        if '*' in tags or any(tag in candidates for tag in tags):
+            return Response(status_code=304, headers=validator_headers(request, version, _matched_encoding(request, version, tags, encodings)))
+        return None
+
+    # If-Modified-Since は If-None-Match がないときだけ使う（未反映の変更がある版や、秒単位で区別できない直近の更新は対象外）
+    if_modified_since = request.headers.get('if-modified-since')
+    mtime_ns = version.get('mtime_ns')
+    if if_modified_since and mtime_ns is not None and version.get('pending') is None and time.time() - mtime_ns / 1e9 > 1:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+        if int(mtime_ns // 1_000_000_000) <= since:
+            return Response(status_code=304, headers=validator_headers(request, version))
+    return None
+
+
+def _matched_encoding(request: Request, version: dict, tags: list, encodings: tuple) -> str:
+    for encoding in encodings:
+        if representation_etag(request, version, encoding) in tags:
+            return encoding
+    return 'identity'
+
+
+# --- Report Delta Sync ---
+# GET /api/reports/changes 用に、営業日報の版ごとの「管理番号 → 行内容のハッシュ」を直近 "change_history" 版分だけ残す。
+# ハッシュは GET /api/reports で返す値から計算するので、アプリからの保存も Excel での直接編集も同じように差分になる。
+# ハッシュには全列が要るので、ブックごとに最初の /api/reports/changes から版を記録し始める（それまでは列を読み込まない）。
+CHANGE_HISTORY_SIZE = int(CONFIG.get('change_history', 32))
+# {filename: [{'version': str, 'numbers': ndarray, 'hashes': ndarray}, ...]}（古い順）
+REPORT_GENERATIONS = {}
+_GENERATIONS_LOCK = threading.Lock()
+
+
+def build_row_hashes(view: SheetView) -> dict:
+    """管理番号の昇順に並べた 管理番号・行内容のハッシュ・行位置（同じ番号が複数あれば最初の行）"""
+    # 保存直後は日付・コードが入力値の形（'25/10/01', '1003'）のままなので、読み直した値と同じ形に揃えてから比べる
+    table = pd.DataFrame(report_columns(view), dtype=object)
+    for col, codes in view.codes.items():
+        table[col] = codes.astype(object)
+    if '日付' in table.columns:
+        dates = view.dates
+        table['日付'] = dates.dt.strftime('%Y-%m-%d').where(dates.notna(), table['日付'])
+    hashes = pd.util.hash_pandas_object(table, index=False).to_numpy()
+    numbers = pd.to_numeric(view.column('管理番号'), errors='coerce').to_numpy(dtype=float)
+    valid = np.flatnonzero(~np.isnan(numbers))
+    numbers, first = np.unique(numbers[valid], return_index=True)
+    return {'numbers': numbers, 'hashes': hashes[valid][first], 'positions': valid[first]}
+
+
+def report_changes_tracked(filename: str) -> bool:
+    """このブックの版の記録を始めているか（/api/reports/changes が使われたか）"""
+    with _GENERATIONS_LOCK:
+        return filename in REPORT_GENERATIONS
+
+
+def record_report_generation(filename: str, view: SheetView):
+    row_hashes = view.derived('row_hashes', build_row_hashes)
+    with _GENERATIONS_LOCK:
+        history = REPORT_GENERATIONS.setdefault(filename, [])
+        if any(generation['version'] == view.version['tag'] for generation in history):
+            return
+        history.append({'version': view.version['tag'], 'numbers': row_hashes['numbers'], 'hashes': row_hashes['hashes']})
+        del history[:-CHANGE_HISTORY_SIZE]
+
+
+def find_report_generation(filename: str, version: str) -> Optional[dict]:
+    with _GENERATIONS_LOCK:
+        for generation in REPORT_GENERATIONS.get(filename, []):
+            if generation['version'] == version:
+                return generation
+    return None
+
+
+def _management_number_json(number: float) -> str:
+    return str(int(number)) if float(number).is_integer() else repr(float(number))
+
+
+def encode_report_changes(view: SheetView, base: Optional[dict]) -> bytes:
+    """
+    base の版からの差分: {"version", "full": false, "inserted": [行], "updated": [行], "deleted": [管理番号]}
+    base がなければ全件: {"version", "full": true, "reports": [行]}
+    """
+    version = json.dumps(view.version['tag'])
+    if base is None:
+        reports = view.derived('records.json', encode_report_records)
+        return b'{"version":' + version.encode('utf-8') + b',"full":true,"reports":' + reports + b'}'
+
+    current = view.derived('row_hashes', build_row_hashes)
+    columns = report_columns(view)
+    new_numbers, new_hashes = current['numbers'], current['hashes']
+    old_numbers, old_hashes = base['numbers'], base['hashes']
+    inserted = np.setdiff1d(new_numbers, old_numbers, assume_unique=True)
+    deleted = np.setdiff1d(old_numbers, new_numbers, assume_unique=True)
+    common, new_index, old_index = np.intersect1d(new_numbers, old_numbers, assume_unique=True, return_indices=True)
+    updated = common[new_hashes[new_index] != old_hashes[old_index]]
+
+    def rows(numbers) -> bytes:
+        positions = current['positions'][np.searchsorted(new_numbers, numbers)].tolist()
+        page = {name: [values[i] for i in positions] for name, values in columns.items()}
+        return encode_records_json(page, len(positions))
+
+    deleted_json = '[' + ','.join(_management_number_json(number) for number in deleted.tolist()) + ']'
+    return (b'{"version":' + version.encode('utf-8') + b',"full":false,"inserted":' + rows(inserted)
+            + b',"updated":' + rows(updated) + b',"deleted":' + deleted_json.encode('utf-8') + b'}')
+
+
+# --- Report List Paging ---
+# GET /api/reports の fields / sort / limit / offset / cursor。並べ替えた行の順序はビューの派生データとして
+# 版・並べ替え列ごとに一度だけ作る。カーソルは前のページの最後の行の (並べ替えキー, 管理番号) なので、
+# ページの間に行が追加・削除されても重複や抜けが出ない。
+REPORT_SORT_DEFAULT = '管理番号'
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+TOTAL_COUNT_HEADER = 'X-Total-Count'
+
+
+def _sort_keys(view: SheetView, column: str) -> list:
+    """行ごとの並べ替えキー (空なら1, 値)。空の行は最後に並ぶ"""
+    if column == '日付':
+        dates = view.dates
+        missing = dates.isna().tolist()
+        values = dates.to_numpy(dtype='datetime64[ns]').astype(np.int64).tolist()
+        empty = 0
+    else:
+        series = view.column(column)
+        missing = series.isna().tolist()
+        if series.dtype.kind in 'iufb':
+            values = series.to_numpy(dtype=float, na_value=0.0).tolist()
+            empty = 0.0
+        elif column in view.codes:
+            values = view.codes[column].fillna('').tolist()
+            empty = ''
+        else:
+            values = series.astype(str).tolist()
+            empty = ''
+    return [(1, empty) if is_missing else (0, value) for is_missing, value in zip(missing, values)]
+
+
+def build_sort_index(view: SheetView, column: str) -> dict:
+    """column、同じ値の中では 管理番号 の順に並べた行位置と、その順のキー"""
+    keys = _sort_keys(view, column)
+    if column != REPORT_SORT_DEFAULT:
+        keys = [key + number for key, number in zip(keys, _sort_keys(view, REPORT_SORT_DEFAULT))]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return {'order': order, 'keys': [keys[i] for i in order]}
+
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    data = json.dumps({'sort': sort, 'key': list(key)}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _cursor_value_kind(value) -> Optional[str]:
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 'number'
+    return None
+
+
+def decode_cursor(cursor: str, sort: str, sample_key: Optional[tuple]) -> tuple:
+    """
+    カーソルからキーを取り出す。sample_key（同じ並べ替えのキーの1つ）と長さ・要素の型が
+    合わないキーは bisect で比較できないので 400 にする
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        key = tuple(data['key'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get('sort') != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    kinds = [_cursor_value_kind(value) for value in key]
+    if None in kinds or (sample_key is not None and kinds != [_cursor_value_kind(value) for value in sample_key]):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def report_page_response(request: Request, view: SheetView, fields: Optional[str], sort: Optional[str],
+                         limit: Optional[int], offset: Optional[int], cursor: Optional[str]) -> Response:
+    if cursor is not None and offset is not None:
+        raise HTTPException(status_code=400, detail="Use either cursor or offset, not both")
+    columns = set(view.columns)
+
+    names = list(dict.fromkeys(view.columns))
+    if fields is not None:
+        names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+        unknown = [name for name in names if name not in columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+
+    sort = sort or REPORT_SORT_DEFAULT
+    descending = sort.startswith('-')
+    sort_column = sort[1:] if descending else sort
+    if sort_column not in columns:
+        raise HTTPException(status_code=400, detail=f"Unknown sort field: {sort_column}")
+    index = view.derived(f'sort:{sort_column}', lambda v: build_sort_index(v, sort_column))
+    order, keys = index['order'], index['keys']
+    total = len(order)
+
+    after = decode_cursor(cursor, sort, keys[0] if keys else None) if cursor is not None else None
+    if not descending:
+        start = bisect.bisect_right(keys, after) if after is not None else min(offset or 0, total)
+        stop = total if limit is None else min(total, start + limit)
+        positions = order[start:stop]
+        next_key = keys[stop - 1] if stop < total and stop > start else None
+    else:
+        stop = bisect.bisect_left(keys, after) if after is not None else max(total - (offset or 0), 0)
+        start = 0 if limit is None else max(0, stop - limit)
+        positions = order[start:stop][::-1]
+        next_key = keys[start] if start > 0 and stop > start else None
+
+    # 返す列だけを読み込んで整形する（fields で絞れば 商談内容 などの長いテキスト列はデコードしない）
+    page = {name: [values[i] for i in positions] for name, values in report_columns(view, names).items()}
+    headers = validator_headers(request, view.version)
+    headers[TOTAL_COUNT_HEADER] = str(total)
+    if next_key is not None:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, next_key)
+    return Response(content=encode_records_json(page, len(positions)), media_type='application/json', headers=headers)
+
+
+@app.get("/api/customers")
+@bulkhead('cpu')
+def get_customers(request: Request, filename: str = DEFAULT_EXCEL_FILE):
+    """Get customer list from the Excel file"""
+    try:
+        cached = not_modified_response(request, sheet_version(filename, '得意先_List', request), ('identity', 'gzip'))
+        if cached is not None:
+            return cached
         
-        # カラム H の名前を特定
-        priority_col = col_priority
-        if not priority_col:
-            # フォールバック: 「重点顧客」という名前のカラムを探す
-            for col in df.columns:
-                if '重点' in str(col):
-                    priority_col = col
-                    break
-            if not priority_col:
-                logging.warning(f"Priority column not found. Columns: {list(df.columns)}")
-                return []
+        # Get normalized sheet (shared, read-only)
+        view = get_sheet_view(filename, '得意先_List')
         
-        logging.info(f"Priority column: {priority_col}, Staff column: {col_staff}")
+        # デバッグログ: カラム名を出力
+        logging.info(f"得意先_List columns: {view.columns}")
+        
+        # 現目標カラムの存在確認
+        for col in view.columns:
+            if '現目標' in col or '目標' in col:
+                logging.info(f"Found target column: '{col}'")
         
-        # 「重点」と記載されている行のみ抽出
-        priority_df = df[df[priority_col].astype(str).str.contains('重点', na=False)]
+        return cached_json_response(request, view, 'records', encode_customer_records)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def build_priority_customers(view: SheetView) -> list:
+    """得意先_Listからカラム H (重点顧客) が「重点」の顧客を抽出。カラム I の担当者情報も含める"""
+    all_columns = view.columns
+    
+    # カラム名を保存
+    col_customer_cd = all_columns[0]  # 得意先CD
+    col_customer_name = all_columns[1] if len(all_columns) > 1 else None  # 得意先名
+    col_priority = all_columns[7] if len(all_columns) > 7 else None  # カラムH: 重点顧客
+    col_staff = all_columns[8] if len(all_columns) > 8 else None  # カラムI: 担当者
+    
+    # カラム H の名前を特定
+    priority_col = col_priority
+    if not priority_col:
+        # フォールバック: 「重点顧客」という名前のカラムを探す
+        for col in all_columns:
+            if '重点' in str(col):
+                priority_col = col
+                break
+        if not priority_col:
+            logging.warning(f"Priority column not found. Columns: {list(all_columns)}")
+            return []
+    
+    # 使う列だけ読み込み、得意先CDがある行のみ抽出（ヘッダー行や空行を除外）
+    df = view.select([col for col in (col_customer_cd, col_customer_name, priority_col, col_staff) if col])
+    df = df.dropna(subset=[col_customer_cd])
+    
+    logging.info(f"Priority column: {priority_col}, Staff column: {col_staff}")
+    
+    # 「重点」と記載されている行のみ抽出
+    priority_df = df[df[priority_col].astype(str).str.contains('重点', na=False)]
+    
+    logging.info(f"Found {len(priority_df)} priority customers")
+    
+    # レコードを作成
+    records = []
+    for _, row in priority_df.iterrows():
+        customer_cd = row[col_customer_cd]
+        customer_name = row[col_customer_name] if col_customer_name else ''
+        staff = row[col_staff] if col_staff else ''
+        
+        # CDをクリーンアップ
+        if isinstance(customer_cd, float):
+            if math.isnan(customer_cd):
+                continue
+            customer_cd = str(int(customer_cd))
+        else:
+            customer_cd = str(customer_cd).strip()
         
-        logging.info(f"Found {len(priority_df)} priority customers")
+        if not customer_cd:
+            continue
         
-        # レコードを作成
-        records = []
-        for _, row in priority_df.iterrows():
-            customer_cd = row[col_customer_cd]
-            customer_name = row[col_customer_name] if col_customer_name else ''
-            staff = row[col_staff] if col_staff else ''
-            
-            # CDをクリーンアップ
-            if isinstance(customer_cd, float):
-                import math
-                if math.isnan(customer_cd):
-                    continue
-                customer_cd = str(int(customer_cd))
+        # 担当者をクリーンアップ
+        if isinstance(staff, float):
+            if math.isnan(staff):
+                staff = ''
             else:
-                customer_cd = str(customer_cd).strip()
-            
-            if not customer_cd:
-                continue
+                staff = str(staff)
+        else:
+            staff = str(staff).strip() if staff else ''
             
-            # 担当者をクリーンアップ
-            if isinstance(staff, float):
-                import math
-                if math.isnan(staff):
-                    staff = ''
-                else:
-                    staff = str(staff)
-            else:
-                staff = str(staff).strip() if staff else ''
-                
-            records.append({
-                '得意先CD': customer_cd,
-                '得意先名': str(customer_name).strip() if customer_name else '',
-                '担当者': staff
-            })
-        
-        return records
+        records.append({
+            '得意先CD': customer_cd,
+            '得意先名': str(customer_name).strip() if customer_name else '',
+            '担当者': staff
+        })
+    
+    return records
+
+
+@app.get("/api/priority-customers")
+@bulkhead('cpu')
+def get_priority_customers(request: Request, response: Response, filename: str = DEFAULT_EXCEL_FILE):
+    """得意先_Listからカラム H (重点顧客) が「重点」の顧客を取得。カラム I の担当者情報も含める"""
+    try:
+        cached = not_modified_response(request, sheet_version(filename, '得意先_List', request))
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '得意先_List')
+        response.headers.update(validator_headers(request, view.version))
+        return view.derived('priority_customers', build_priority_customers)
     except Exception as e:
         logging.error(f"Error in get_priority_customers: {e}")
         import traceback
@@ -473,26 +2221,21 @@ def get_priority_customers(filename: str = DEFAULT_EXCEL_FILE):
 
 
 @app.get("/api/interviewers")
-def get_interviewers(customer_code: str, filename: str = DEFAULT_EXCEL_FILE):
+@bulkhead('cpu')
+def get_interviewers(request: Request, response: Response, customer_code: str, filename: str = DEFAULT_EXCEL_FILE):
     """Get list of interviewers for a specific customer"""
-    excel_file = os.path.join(EXCEL_DIR, filename)
-    if not os.path.exists(excel_file):
-        raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found")
+    # ファイルの有無は sheet_version（フォルダの stat キャッシュ）で確かめる。なければ 404
+    version = sheet_version(filename, '営業日報', request)
     
     try:
-        # Read the '営業日報' sheet
-        df = pd.read_excel(excel_file, sheet_name='営業日報', header=0)
-        
-        # Clean up column names
-        df.columns = [str(col).replace('\n', '').strip() for col in df.columns]
-        
-        # Rename specific columns to match frontend expectations
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-        })
+        cached = not_modified_response(request, version)
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '営業日報')
+        response.headers.update(validator_headers(request, view.version))
         
         # Filter by customer code
-        customer_reports = df[df['得意先CD'] == customer_code]
+        customer_reports = view.select(['面談者'])[view.code_mask('得意先CD', canonical_code_param(customer_code))]
         
         # Get unique interviewers, excluding NaN and '-'
         interviewers = customer_reports['面談者'].dropna().unique().tolist()
@@ -502,123 +2245,87 @@ def get_interviewers(customer_code: str, filename: str = DEFAULT_EXCEL_FILE):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/reports/changes")
+@bulkhead('cpu')
+def get_report_changes(request: Request, since: Optional[str] = None, filename: str = DEFAULT_EXCEL_FILE):
+    """
+    since（前回のレスポンスの X-Data-Version）以降に追加・更新・削除された日報。
+    since がない・古すぎて履歴にない場合は full=true で全件を返す。
+    """
+    try:
+        cached = not_modified_response(request, sheet_version(filename, '営業日報', request))
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '営業日報')
+        base = find_report_generation(filename, since) if since else None
+        record_report_generation(filename, view)  # 以降の版は build_sheet_view で記録する
+        body = encode_report_changes(view, base)
+        return Response(content=body, media_type='application/json', headers=validator_headers(request, view.version))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/reports/{management_number}")
-def get_report_by_id(management_number: int, filename: str = DEFAULT_EXCEL_FILE):
-    """指定された管理番号の日報を取得"""
+@bulkhead('cpu')
+def get_report_by_id(request: Request, response: Response, management_number: int, filename: str = DEFAULT_EXCEL_FILE):
+    """指定された管理番号の日報を取得（GET /api/reports と同じ形のレコード）"""
     try:
-        # Get dataframe from cache
-        df = get_cached_dataframe(filename, '営業日報')
-        
-        # Clean up column names
-        df.columns = [str(col).replace('\n', '') for col in df.columns]
-        
-        # Rename specific columns
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-            '訪問先名得意先名': '訪問先名',
-            'コメント': '上長コメント',  # Excel uses 'コメント' for manager comment
-            'コメント返信欄': 'コメント返信欄'  # Keep as-is for reply field
-        })
+        cached = not_modified_response(request, sheet_version(filename, '営業日報', request))
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '営業日報')
         
-        # Filter by management number
-        report_df = df[df['管理番号'] == management_number]
+        # Find by management number
+        position = view.derived('positions', build_report_positions).get(management_number)
         
-        if report_df.empty:
+        if position is None:
             raise HTTPException(status_code=404, detail=f"Report with management number {management_number} not found")
         
-        # Get the first (and should be only) record
-        record = report_df.iloc[0].to_dict()
-        
-        # Clean the record
-        import math
-        cleaned_record = {}
-        for key, value in record.items():
-            if isinstance(value, float):
-                if math.isnan(value) or math.isinf(value):
-                    cleaned_record[key] = None
-                elif key == '得意先CD' and not math.isnan(value):
-                    cleaned_record[key] = str(int(value))
-                else:
-                    cleaned_record[key] = value
-            elif value == '':
-                cleaned_record[key] = None
-            elif isinstance(value, str):
-                import re
-                cleaned_value = re.sub(r'_x000D_', '\n', value)
-                cleaned_value = cleaned_value.replace('\r', '')
-                cleaned_record[key] = cleaned_value
-            else:
-                cleaned_record[key] = value
-        
-        return cleaned_record
+        response.headers.update(validator_headers(request, view.version))
+        return {key: values[position] for key, values in report_columns(view).items()}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/reports")
-def get_reports(filename: str = DEFAULT_EXCEL_FILE):
+@bulkhead('cpu')
+def get_reports(
+    request: Request,
+    filename: str = DEFAULT_EXCEL_FILE,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: Optional[int] = Query(None, ge=0),
+    cursor: Optional[str] = None,
+):
+    """
+    日報一覧。パラメーターがなければ全件・全列。
+    fields=列名,... で列を絞り、sort=列名（-列名 で降順、既定は 管理番号）で並べ替え、
+    limit と offset または cursor（前のページの X-Next-Cursor）でページングする。
+    """
     try:
         logging.debug(f"Fetching reports for {filename} from {EXCEL_DIR}")
-        # Get dataframe from cache
-        df = get_cached_dataframe(filename, '営業日報')
-        
-        # Clean up column names (remove newlines and strip)
-        df.columns = [str(col).replace('\n', '').strip() for col in df.columns]
-        
-        # Rename specific columns to match frontend expectations
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-            '訪問先名得意先名': '訪問先名',
-            '直送先CD.': '直送先CD',
-            '直送先名.': '直送先名',
-            'コメント': '上長コメント',  # Excel uses 'コメント' for manager comment
-            'コメント返信欄': 'コメント返信欄'  # Keep as-is for reply field
-        })
-        
-        # Replace all NaN, infinity, and null values with None
-        # Use fillna to replace NaN with None
-        df = df.fillna(value='')
-        
-        # Convert dates to string to avoid serialization issues
-        if '日付' in df.columns:
-             df['日付'] = df['日付'].astype(str)
-        
-        # Convert to dict and manually clean any remaining problematic values
-        records = df.to_dict(orient="records")
-        
-        # Clean the records to ensure JSON compatibility
-        import math
-        cleaned_records = []
-        for record in records:
-            cleaned_record = {}
-            for key, value in record.items():
-                if isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        cleaned_record[key] = None
-                    # Convert customer code to string without decimal
-                    elif key in ['得意先CD', '直送先CD'] and not math.isnan(value):
-                        cleaned_record[key] = str(int(value))
-                    else:
-                        cleaned_record[key] = value
-                elif value == '':
-                    cleaned_record[key] = None
-                elif isinstance(value, str):
-                    # Replace Excel's carriage return artifacts with proper newlines
-                    import re
-                    cleaned_value = re.sub(r'_x000D_', '\n', value)
-                    cleaned_value = cleaned_value.replace('\r', '')
-                    cleaned_record[key] = cleaned_value
-                else:
-                    cleaned_record[key] = value
-            cleaned_records.append(cleaned_record)
-
-        return cleaned_records
+        cached = not_modified_response(request, sheet_version(filename, '営業日報', request), ('identity', 'gzip'))
+        if cached is not None:
+            return cached
+        
+        view = get_sheet_view(filename, '営業日報')
+        if fields is None and sort is None and limit is None and offset is None and cursor is None:
+            # Response bytes are built once per workbook version and shared between requests
+            return cached_json_response(request, view, 'records', encode_report_records)
+        return report_page_response(request, view, fields, sort, limit, offset, cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/interviewers/{customer_cd}")
+@bulkhead('cpu')
 def get_interviewers(
+    request: Request,
+    response: Response,
     customer_cd: str, 
     filename: str = DEFAULT_EXCEL_FILE,
     customer_name: Optional[str] = None,
@@ -626,30 +2333,14 @@ def get_interviewers(
 ):
     """Get list of interviewers for a specific customer with optional name filtering"""
     try:
-        # Get dataframe from cache
-        df = get_cached_dataframe(filename, '営業日報')
-        
-        # Clean up column names
-        df.columns = [str(col).replace('\n', '') for col in df.columns]
-        
-        # Rename specific columns to standard names
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-            '直送先CD.': '直送先CD',
-            '訪問先名得意先名': '訪問先名', # Case where \n was removed
-            '訪問先名\n得意先名': '訪問先名', # Just in case
-        })
-        
-        # Convert customer_cd to float for matching (Excel stores as float)
-        try:
-            customer_cd_float = float(customer_cd)
-        except ValueError:
-            # If conversion fails, try string matching
-            customer_cd_float = customer_cd
+        cached = not_modified_response(request, sheet_version(filename, '営業日報', request))
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '営業日報')
+        response.headers.update(validator_headers(request, view.version))
         
-        # Base filter: customer code
-        # Handle potential float/string mismatch by trying both if needed, but usually float is correct for number-like CDs
-        customer_reports = df[df['得意先CD'] == customer_cd_float]
+        # Base filter: customer code（数値・文字列どちらで入力されたコードも同じ得意先として扱う）
+        customer_reports = view.select(['訪問先名', '直送先名', '面談者'])[view.code_mask('得意先CD', canonical_code_param(customer_cd))]
         
         # Name filtering logic
         if delivery_name:
@@ -699,252 +2390,2079 @@ def get_interviewers(
                  (customer_reports['直送先名'] == None)
              ]
 
-        interviewers = customer_reports['面談者'].dropna().unique().tolist()
-        
-        # Remove empty strings and sort
-        interviewers = [str(i).strip() for i in interviewers if str(i).strip() and str(i).strip() != 'nan']
-        interviewers = sorted(set(interviewers))
-        
-        return {"customer_cd": customer_cd, "interviewers": interviewers}
-    except Exception as e:
-        logging.error(f"Error in get_interviewers: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        interviewers = customer_reports['面談者'].dropna().unique().tolist()
+        
+        # Remove empty strings and sort
+        interviewers = [str(i).strip() for i in interviewers if str(i).strip() and str(i).strip() != 'nan']
+        interviewers = sorted(set(interviewers))
+        
+        return {"customer_cd": customer_cd, "interviewers": interviewers}
+    except Exception as e:
+        logging.error(f"Error in get_interviewers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/designs/{customer_cd}")
+@bulkhead('cpu')
+def get_designs(request: Request, response: Response, customer_cd: str, delivery_name: Optional[str] = None, filename: str = DEFAULT_EXCEL_FILE):
+    """Get list of design requests for a specific customer (optionally filtered by delivery destination)"""
+    try:
+        logging.info(f"get_designs called: customer_cd={customer_cd}, delivery_name={delivery_name}")
+        
+        cached = not_modified_response(request, sheet_version(filename, '営業日報', request))
+        if cached is not None:
+            return cached
+        view = get_sheet_view(filename, '営業日報')
+        response.headers.update(validator_headers(request, view.version))
+        
+        logging.info(f"Columns in dataframe: {view.columns[:20]}...")  # Log first 20 columns
+        
+        # Filter by customer code
+        design_columns = ['直送先名', 'デザイン依頼No.', 'デザイン進捗状況', 'デザイン名', 'デザイン種別', 'デザイン提案有無']
+        customer_reports = view.select(design_columns)[view.code_mask('得意先CD', canonical_code_param(customer_cd))]
+        logging.info(f"After customer filter: {len(customer_reports)} rows")
+        
+        # Filter by delivery destination if provided
+        if delivery_name and '直送先名' in customer_reports.columns:
+            before_count = len(customer_reports)
+            customer_reports = customer_reports[customer_reports['直送先名'] == delivery_name]
+            logging.info(f"After delivery_name filter ({delivery_name}): {len(customer_reports)} rows (was {before_count})")
+        else:
+            logging.info(f"Skipping delivery_name filter: delivery_name={delivery_name}, has_column={'直送先名' in customer_reports.columns}")
+        
+        # Filter for records with design request number
+        design_reports = customer_reports[customer_reports['デザイン依頼No.'].notna()]
+        logging.info(f"After design no filter: {len(design_reports)} rows")
+        
+        # Get unique design request numbers
+        unique_design_nos = design_reports['デザイン依頼No.'].unique()
+        
+        designs = []
+        for design_no in unique_design_nos:
+            # Get all records for this design number
+            design_records = design_reports[design_reports['デザイン依頼No.'] == design_no]
+            
+            # Get the latest record (assuming lower down in Excel is newer, or we could sort by date if available)
+            # Here we just take the last one in the dataframe which corresponds to the last row in Excel
+            latest_record = design_records.iloc[-1]
+            
+            # Get the status
+            status = str(latest_record['デザイン進捗状況']) if pd.notna(latest_record['デザイン進捗状況']) else ""
+            
+            # Skip designs with completed/rejected statuses: 出稿, 不採用(コンペ負け), 不採用(企画倒れ)
+            if '出稿' in status or 'コンペ負け' in status or '企画倒れ' in status:
+                continue
+            
+            design_info = {
+                "デザイン依頼No": design_no,
+                "デザイン名": str(latest_record['デザイン名']) if pd.notna(latest_record['デザイン名']) else "",
+                "デザイン種別": str(latest_record['デザイン種別']) if pd.notna(latest_record['デザイン種別']) else "",
+                "デザイン進捗状況": status,
+                "デザイン提案有無": str(latest_record['デザイン提案有無']) if pd.notna(latest_record['デザイン提案有無']) else ""
+            }
+            designs.append(design_info)
+            
+        return {"customer_cd": customer_cd, "designs": designs}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- 営業日報 書き込みヘルパー ---
+
+def report_columns_to_write(report: ReportInput, new_mgmt_num: Optional[int] = None, current_target: Optional[str] = None) -> dict:
+    """ReportInput を {列番号: 値} に変換（新規追加時のみ 管理番号 と 得意先目標 を含める）"""
+    # 2026年度版カラム構造（K列に「得意先目標」が追加）
+    columns_to_write = {
+        2: report.日付,              # B: 日付
+        3: report.行動内容,           # C: 行動内容
+        4: report.エリア,             # D: エリア
+        5: report.得意先CD,           # E: 得意先CD.
+        6: report.直送先CD,           # F: 直送先CD.
+        7: report.訪問先名,           # G: 訪問先名/得意先名
+        8: report.直送先名,           # H: 直送先名
+        9: report.重点顧客,           # I: 重点顧客
+        10: report.ランク,            # J: ランク
+        # 11: 得意先目標 (K) - 更新時は手動入力のため省略
+        12: report.面談者,            # L: 面談者
+        13: report.滞在時間,          # M: 滞在時間
+        14: report.デザイン提案有無,   # N: デザイン提案有無
+        15: report.デザイン種別,       # O: デザイン種別
+        16: report.デザイン名,         # P: デザイン名
+        17: report.デザイン進捗状況,   # Q: デザイン進捗状況
+        18: report.デザイン依頼No,     # R: デザイン依頼No.
+        19: report.商談内容,           # S: 商談内容
+        20: report.提案物,             # T: 提案物
+        21: report.次回プラン,         # U: 次回プラン
+        22: report.競合他社情報,       # V: 競合他社情報
+        23: report.上長コメント,       # W: 上長コメント
+        24: report.コメント返信欄      # X: コメント返信欄
+    }
+    if new_mgmt_num is not None:
+        columns_to_write[1] = new_mgmt_num                # A: 管理番号
+        columns_to_write[11] = current_target or ""       # K: 得意先目標（得意先_Listから自動取得）
+    return dict(sorted(columns_to_write.items()))
+
+
+def code_text(value) -> str:
+    """得意先CD/直送先CD を文字列に変換（floatの場合は整数に）"""
+    if isinstance(value, float):
+        return str(int(value))
+    return str(value).strip()
+
+
+def build_current_target_map(rows) -> dict:
+    """得意先_List の (得意先CD, 直送先CD, 現目標) の並びから {(得意先CD, 直送先CD): 現目標} を作成"""
+    # マッチング条件: 得意先CDが一致 AND (直送先CDが一致 OR 両方空)。同じキーは先頭行を優先
+    targets = {}
+    for cell_customer_cd, cell_dd_cd, target_value in rows:
+        if cell_customer_cd is None:
+            continue
+        key = (code_text(cell_customer_cd), code_text(cell_dd_cd) if cell_dd_cd is not None else "")
+        if key not in targets:
+            targets[key] = str(target_value).strip() if target_value else ""
+    return targets
+
+
+def current_target_key(report: ReportInput) -> tuple:
+    customer_cd = str(report.得意先CD).strip()
+    direct_delivery_cd = str(report.直送先CD).strip() if report.直送先CD else ""
+    return (customer_cd, direct_delivery_cd)
+
+
+# 2026年度版: W列(23) = 上長コメント, X列(24) = コメント返信欄
+COMMENT_COLUMNS = {
+    '上長コメント': 23,
+    'コメント返信欄': 24,
+}
+
+# 2026年度版カラムマッピング: Y=上長(25), Z=山澄常務(26), AA=岡本常務(27), AB=中野次長(28), AC=既読チェック(29)
+APPROVAL_COLUMNS = {
+    '上長': 25,           # Y列
+    '山澄常務': 26,        # Z列
+    '岡本常務': 27,        # AA列
+    '中野次長': 28,        # AB列
+    '既読チェック': 29     # AC列
+}
+
+# 楽観的ロックで比較する列 (critical text fields)
+CONFLICT_CHECK_FIELDS = {
+    22: '上長コメント',
+    23: 'コメント返信欄',
+    18: '商談内容'
+}
+
+
+def comment_columns_to_write(comment) -> dict:
+    """CommentInput / ReplyInput のうち指定された項目だけを {列番号: 値} に変換"""
+    return {
+        col_idx: getattr(comment, field)
+        for field, col_idx in COMMENT_COLUMNS.items()
+        if getattr(comment, field, None) is not None
+    }
+
+
+def approval_columns_to_write(approval) -> dict:
+    """ApprovalInput のうち指定された項目だけを {列番号: 値} に変換"""
+    return {
+        col_idx: getattr(approval, field)
+        for field, col_idx in APPROVAL_COLUMNS.items()
+        if getattr(approval, field) is not None
+    }
+
+
+def find_report_conflicts(get_current_value, original_values: dict) -> list:
+    """楽観的ロック: 編集開始時の値と現在の値が異なる項目名の一覧を返す"""
+    conflicts = []
+    for col_idx, field_name in CONFLICT_CHECK_FIELDS.items():
+        current_val = get_current_value(col_idx)
+        current_str = str(current_val) if current_val is not None else ""
+        
+        original_val = original_values.get(field_name, "")
+        original_str = str(original_val) if original_val is not None else ""
+        
+        # Normalize newlines for comparison
+        current_str = current_str.replace('\r\n', '\n').replace('\r', '\n').strip()
+        original_str = original_str.replace('\r\n', '\n').replace('\r', '\n').strip()
+        
+        if current_str != original_str:
+            logging.warning(f"CONFLICT: Field '{field_name}' changed. Current: '{current_str}' vs Original: '{original_str}'")
+            conflicts.append(field_name)
+    return conflicts
+
+
+def capture_row_styles(ws, style_row: int, columns) -> dict:
+    """書式のコピー元の行 (style_row) から列ごとの書式を一度だけ取得"""
+    styles = {}
+    # Ensure we are copying from a valid row
+    if style_row < 2:
+        return styles
+    for col_idx in columns:
+        source_cell = ws.cell(row=style_row, column=col_idx)
+        if source_cell.has_style:
+            styles[col_idx] = copy(source_cell._style)
+    return styles
+
+
+def write_report_row(ws, row: int, columns_to_write: dict, styles: dict):
+    """新しい行に値を書き込み、capture_row_styles で取得した書式を適用"""
+    for col_idx, value in columns_to_write.items():
+        target_cell = ws.cell(row=row, column=col_idx)
+        target_cell.value = value
+        if col_idx in styles:
+            target_cell._style = copy(styles[col_idx])
+
+
+# --- Worksheet XML Patch ---
+# セル値だけの変更（コメント・承認・返信・更新）は openpyxl でブック全体を読み書きせず、
+# .xlsm の zip から対象シートの XML だけを書き換える。他のパーツ（vbaProject.bin, styles, 数式など）はそのままコピー。
+# 数式セルの上書きや日付値など、ここで安全に扱えない変更は XmlPatchUnsupported を投げて openpyxl にフォールバックする。
+XML_PATCH_ENABLED = bool(CONFIG.get('xml_patch', True))
+
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_ROW_NUM_RE = re.compile(r'<row\b[^>]*?\br="(\d+)"')
+_CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_CELL_REF_RE = re.compile(r'^<c\b[^>]*?\br="([A-Z]+)(\d+)"')
+_ATTR_RE = re.compile(r'\b(s|t)="([^"]*)"')
+_V_RE = re.compile(r'<v>(.*?)</v>', re.S)
+_T_RE = re.compile(r'<t\b[^>]*?(?:/>|>(.*?)</t>)', re.S)
+_RPH_RE = re.compile(r'<rPh\b.*?</rPh>', re.S)
+_ILLEGAL_XML_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class XmlPatchUnsupported(Exception):
+    """XML パッチで扱えない変更（openpyxl で保存し直す）"""
+
+
+def column_letter(col_idx: int) -> str:
+    letters = ''
+    while col_idx > 0:
+        col_idx, rem = divmod(col_idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def column_index(letters: str) -> int:
+    col_idx = 0
+    for ch in letters:
+        col_idx = col_idx * 26 + ord(ch) - 64
+    return col_idx
+
+
+def _xml_text(text: str) -> str:
+    # XML の実体参照・文字参照を戻す
+    return html.unescape(text)
+
+
+def _string_item_text(fragment: str) -> str:
+    """<si> / <is> の中身から文字列を取り出す（ふりがな rPh は除く）"""
+    fragment = _RPH_RE.sub('', fragment)
+    return ''.join(_xml_text(m.group(1) or '') for m in _T_RE.finditer(fragment))
+
+
+class _PatchCell:
+    def __init__(self, sheet, row: int, column: int):
+        self._sheet = sheet
+        self._key = (row, column)
+
+    @property
+    def value(self):
+        return self._sheet.get_value(*self._key)
+
+    @value.setter
+    def value(self, value):
+        self._sheet.set_value(*self._key, value)
+
+
+class WorksheetXmlPatch:
+    """シート XML を openpyxl の Worksheet と同じ使い方 (cell / iter_rows) で読み書きする"""
+
+    def __init__(self, xml: str, load_shared_strings):
+        self.xml = xml
+        self._load_shared_strings = load_shared_strings
+        self._shared_strings = None
+        self.rows = {}      # {行番号: (開始位置, 終了位置)}
+        self.edits = {}     # {行番号: {列番号: 値}}
+        for m in _ROW_RE.finditer(xml):
+            num = _ROW_NUM_RE.match(m.group(0))
+            if num is None:
+                # r 属性のない行は位置で解釈する必要があるので対象外
+                raise XmlPatchUnsupported("row without r attribute")
+            self.rows[int(num.group(1))] = (m.start(), m.end())
+        self.max_row = max(self.rows) if self.rows else 1
+        self._cells_cache = {}
+
+    def _row_cells(self, row: int) -> dict:
+        """行の XML から {列番号: セルの XML} を取得"""
+        cells = self._cells_cache.get(row)
+        if cells is not None:
+            return cells
+        cells = {}
+        span = self.rows.get(row)
+        if span is not None:
+            for m in _CELL_RE.finditer(self.xml, *span):
+                ref = _CELL_REF_RE.match(m.group(0))
+                if ref is None:
+                    raise XmlPatchUnsupported(f"cell without r attribute in row {row}")
+                cells[column_index(ref.group(1))] = m.group(0)
+        self._cells_cache[row] = cells
+        return cells
+
+    def _cell_value(self, cell_xml: Optional[str]):
+        if cell_xml is None or cell_xml.endswith('/>'):
+            return None
+        attrs = dict(_ATTR_RE.findall(cell_xml.split('>', 1)[0]))
+        cell_type = attrs.get('t', 'n')
+        if cell_type == 'inlineStr':
+            return _string_item_text(cell_xml)
+        v = _V_RE.search(cell_xml)
+        if v is None:
+            return None
+        text = _xml_text(v.group(1))
+        if cell_type == 's':
+            if self._shared_strings is None:
+                self._shared_strings = self._load_shared_strings()
+            return self._shared_strings[int(text)]
+        if cell_type in ('str', 'e'):
+            return text
+        if cell_type == 'b':
+            return text == '1'
+        # openpyxl と同じく、小数点・指数のない数値は int
+        return float(text) if '.' in text or 'E' in text.upper() else int(text)
+
+    def get_value(self, row: int, column: int):
+        edits = self.edits.get(row)
+        if edits is not None and column in edits:
+            return edits[column]
+        return self._cell_value(self._row_cells(row).get(column))
+
+    def set_value(self, row: int, column: int, value):
+        if row not in self.rows:
+            raise XmlPatchUnsupported(f"row {row} not in sheet XML")
+        if value is not None and not isinstance(value, (str, int, float, bool)):
+            raise XmlPatchUnsupported(f"unsupported value type {type(value).__name__}")
+        if isinstance(value, str) and _ILLEGAL_XML_CHARS_RE.search(value):
+            raise XmlPatchUnsupported("illegal characters in value")
+        if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+            raise XmlPatchUnsupported("non-finite number")
+        current = self._row_cells(row).get(column)
+        if current is not None and '<f' in current:
+            # 数式セルの上書きは calcChain 等の整合が必要なので openpyxl に任せる
+            raise XmlPatchUnsupported(f"formula cell {column_letter(column)}{row}")
+        self.edits.setdefault(row, {})[column] = value
+
+    def cell(self, row: int, column: int, value=None):
+        if value is not None:
+            self.set_value(row, column, value)
+        return _PatchCell(self, row, column)
+
+    def iter_rows(self, min_row: int = 1, max_row: Optional[int] = None, max_col: int = 1, values_only: bool = True):
+        for row in range(min_row, (max_row or self.max_row) + 1):
+            yield tuple(self.get_value(row, col_idx) for col_idx in range(1, max_col + 1))
+
+    def _cell_xml(self, row: int, column: int, value, old_xml: Optional[str]) -> str:
+        ref = f"{column_letter(column)}{row}"
+        style = ''
+        if old_xml is not None:
+            s = dict(_ATTR_RE.findall(old_xml.split('>', 1)[0])).get('s')
+            if s is not None:
+                style = f' s="{s}"'
+        if value is None or (isinstance(value, str) and value == ''):
+            return f'<c r="{ref}"{style}/>'
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{style} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f'<c r="{ref}"{style}><v>{value!r}</v></c>'
+        # 文字列はインライン文字列で書き込む（sharedStrings.xml は変更しない）。CR は文字参照で残す
+        text = xml_escape(value, {'\r': '&#13;'})
+        return f'<c r="{ref}"{style} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def _patched_row(self, row: int) -> str:
+        start, end = self.rows[row]
+        row_xml = self.xml[start:end]
+        cells = dict(self._row_cells(row))
+        for column, value in self.edits[row].items():
+            cells[column] = self._cell_xml(row, column, value, cells.get(column))
+        body = ''.join(cells[col_idx] for col_idx in sorted(cells))
+        open_tag = row_xml.split('>', 1)[0]
+        if open_tag.endswith('/'):
+            open_tag = open_tag[:-1]
+        # spans は任意の最適化ヒントなので、範囲外の列を追加した場合は外す
+        spans = re.search(r'\sspans="(\d+):(\d+)"', open_tag)
+        if spans and (min(cells) < int(spans.group(1)) or max(cells) > int(spans.group(2))):
+            open_tag = open_tag.replace(spans.group(0), '')
+        return f'{open_tag}>{body}</row>'
+
+    def to_xml(self) -> str:
+        parts = []
+        pos = 0
+        for row in sorted(self.edits):
+            start, end = self.rows[row]
+            parts.append(self.xml[pos:start])
+            parts.append(self._patched_row(row))
+            pos = end
+        parts.append(self.xml[pos:])
+        return ''.join(parts)
+
+
+def _sheet_part_name(zf: zipfile.ZipFile, sheet_name: str) -> Optional[str]:
+    """workbook.xml とそのリレーションからシート名に対応する XML パーツ名を取得"""
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    rel_id = None
+    for sheet in workbook.iter(f'{_NS_MAIN}sheet'):
+        if sheet.get('name') == sheet_name:
+            rel_id = sheet.get(f'{_NS_REL}id')
+            break
+    if rel_id is None:
+        return None
+    rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{_NS_PKG_REL}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    return None
+
+
+def open_sheet_patch(excel_file: str, sheet_name: str):
+    """対象シートの XML を読み込んで (パーツ名, WorksheetXmlPatch) を返す"""
+    zf = zipfile.ZipFile(excel_file)
+    try:
+        part_name = _sheet_part_name(zf, sheet_name)
+        if part_name is None:
+            raise HTTPException(status_code=404, detail=f"Sheet '{sheet_name}' not found")
+        xml = zf.read(part_name).decode('utf-8')
+    finally:
+        zf.close()
+    if '<sheetData' not in xml:
+        raise XmlPatchUnsupported("prefixed or unexpected worksheet XML")
+
+    def load_shared_strings():
+        with zipfile.ZipFile(excel_file) as shared:
+            strings_part = _shared_strings_part(shared)
+            if not strings_part:
+                return []
+            with shared.open(strings_part) as f:
+                return _read_shared_string_table(f)
+
+    return part_name, WorksheetXmlPatch(xml, load_shared_strings)
+
+
+def copy_zip_member_raw(zin: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile):
+    """
+    圧縮済みのバイト列をそのままコピーする（展開・再圧縮しない）。
+    ローカルヘッダーは元の CRC・サイズで書き直し、データディスクリプタは付けない。
+    zipfile に公開 API がないので、ZipFile.write と同じ手順で fp とセントラルディレクトリを直接扱う。
+    """
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+    out_info = copy(info)
+    out_info.flag_bits &= ~0x08
+    out_info.header_offset = zout.fp.tell()
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    zout.fp.write(out_info.FileHeader(zip64))
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = zin.fp.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated member: {info.filename}")
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
+
+
+def write_patched_workbook(excel_file: str, output_file: str, replacements: dict):
+    """replacements のパーツだけ差し替え、他のパーツは圧縮済みのバイト列をそのままコピー"""
+    with zipfile.ZipFile(excel_file) as zin, zipfile.ZipFile(output_file, 'w') as zout:
+        for info in zin.infolist():
+            if info.filename in replacements:
+                zout.writestr(copy(info), replacements[info.filename], compress_type=info.compress_type)
+            else:
+                copy_zip_member_raw(zin, info, zout)
+
+
+# --- Sheet Readers ---
+# get_cached_dataframe がシートを DataFrame に変換する方法。config.json の "sheet_reader" で選択:
+#   "streaming": シート XML を iterparse で流し読みし、必要な列・行だけ取り出す（既定）
+#   "pandas":    従来どおり pd.read_excel
+# streaming のセル値の変換は openpyxl (read_only, data_only) と、型推論は pd.read_excel と同じ
+# TextParser に揃えているので、同じ列・行範囲なら結果は一致する。読めない場合は pandas で読み直す。
+SHEET_READER = CONFIG.get('sheet_reader', 'streaming')
+
+# シートごとの読み込み範囲: max_col = 読む列数, key_col = この列が空でない最後の行で打ち切る
+SHEET_READ_SPECS = {
+    '営業日報': {'max_col': 29, 'key_col': 1},   # A〜AC、管理番号のある最後の行まで
+}
+
+_CT_SHARED_STRINGS = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+_NS_CONTENT_TYPES = '{http://schemas.openxmlformats.org/package/2006/content-types}'
+_CELL_REF_PARTS_RE = re.compile(r'([A-Z]+)(\d+)')
+
+
+def read_sheet_pandas(excel_file: str, sheet_name: str) -> pd.DataFrame:
+    return pd.read_excel(excel_file, sheet_name=sheet_name, header=0)
+
+
+def read_workbook_pandas(excel_file: str, sheet_names: list) -> dict:
+    """pd.ExcelFile で1回だけ開いて複数シートを読む（ブックにないシートは含めない）"""
+    with pd.ExcelFile(excel_file) as xls:
+        return {name: xls.parse(name, header=0) for name in sheet_names if name in xls.sheet_names}
+
+
+def _shared_strings_part(zf: zipfile.ZipFile) -> Optional[str]:
+    """[Content_Types].xml から sharedStrings のパーツ名を取得（openpyxl と同じ探し方）"""
+    types = ET.fromstring(zf.read('[Content_Types].xml'))
+    for override in types.iter(f'{_NS_CONTENT_TYPES}Override'):
+        if override.get('ContentType') == _CT_SHARED_STRINGS:
+            return override.get('PartName').lstrip('/')
+    return None
+
+
+def _rich_text_content(elem) -> str:
+    """<si> / <is> 要素の文字列（openpyxl の Text.content と同じ: t と各 r/t をつなげる）"""
+    parts = [elem.findtext(f'{_NS_MAIN}t') or '']
+    parts.extend(run.findtext(f'{_NS_MAIN}t') or '' for run in elem.iterfind(f'{_NS_MAIN}r'))
+    return ''.join(parts)
+
+
+def _read_shared_string_table(f) -> list:
+    """sharedStrings を一度だけデコード（openpyxl の read_string_table と同じ結果、ふりがな rPh は除く）"""
+    strings = []
+    si_tag = f'{_NS_MAIN}si'
+    for _, elem in ET.iterparse(f):
+        if elem.tag != si_tag:
+            continue
+        strings.append(_rich_text_content(elem).replace('x005F_', ''))
+        elem.clear()
+    return strings
+
+
+def _date_style_ids(zf: zipfile.ZipFile) -> tuple:
+    """日付・時間の書式が付いたセルスタイル番号 (date_formats, timedelta_formats)"""
+    try:
+        src = zf.read('xl/styles.xml')
+    except KeyError:
+        return set(), set()
+    stylesheet = Stylesheet.from_tree(ET.fromstring(src))
+    return stylesheet.date_formats, stylesheet.timedelta_formats
+
+
+def _workbook_epoch(zf: zipfile.ZipFile):
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    props = workbook.find(f'{_NS_MAIN}workbookPr')
+    if props is not None and props.get('date1904') in ('1', 'true'):
+        return CALENDAR_MAC_1904
+    return WINDOWS_EPOCH
+
+
+def _workbook_cell_context(zf: zipfile.ZipFile) -> dict:
+    """シートをまたいで共通の情報（共有文字列・日付スタイル・日付の基準）。ブックを開くたびに一度だけ読む"""
+    shared_strings = []
+    strings_part = _shared_strings_part(zf)
+    if strings_part:
+        with zf.open(strings_part) as f:
+            shared_strings = _read_shared_string_table(f)
+    date_formats, timedelta_formats = _date_style_ids(zf)
+    return {
+        'shared_strings': shared_strings,
+        'date_formats': date_formats,
+        'timedelta_formats': timedelta_formats,
+        'epoch': _workbook_epoch(zf),
+    }
+
+
+def _read_sheet_part(zf: zipfile.ZipFile, part_name: str, sheet_name: str, context: dict) -> pd.DataFrame:
+    """シート XML を流し読みして pd.read_excel(header=0) と同じ DataFrame を作る"""
+    spec = SHEET_READ_SPECS.get(sheet_name, {})
+    max_col = spec.get('max_col')
+    key_col = spec.get('key_col')
+    shared_strings = context['shared_strings']
+    date_formats, timedelta_formats = context['date_formats'], context['timedelta_formats']
+    epoch = context['epoch']
+
+    cells = {}      # {行番号: {列番号: 値}}（空でないセルのみ）
+    columns = {}    # 列記号 → 列番号
+    c_tag, v_tag, is_tag = f'{_NS_MAIN}c', f'{_NS_MAIN}v', f'{_NS_MAIN}is'
+    row_tag = f'{_NS_MAIN}row'
+    with zf.open(part_name) as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == row_tag:
+                elem.clear()
+                continue
+            if elem.tag != c_tag:
+                continue
+            ref = elem.get('r')
+            if ref is None:
+                raise ValueError("cell without reference")
+            letters, row = _CELL_REF_PARTS_RE.match(ref).groups()
+            col = columns.get(letters)
+            if col is None:
+                col = columns[letters] = column_index(letters)
+            if max_col is not None and col > max_col:
+                elem.clear()
+                continue
+
+            # openpyxl の parse_cell と pandas の _convert_cell に合わせた変換
+            data_type = elem.get('t', 'n')
+            if data_type == 'inlineStr':
+                child = elem.find(is_tag)
+                value = _rich_text_content(child) if child is not None else None
+            else:
+                value = elem.findtext(v_tag, None) or None
+                if value is not None:
+                    if data_type == 'n':
+                        value = float(value) if ('.' in value or 'E' in value or 'e' in value) else int(value)
+                        style_id = int(elem.get('s', 0) or 0)
+                        if style_id in date_formats:
+                            try:
+                                value = from_excel(value, epoch, timedelta=style_id in timedelta_formats)
+                            except (OverflowError, ValueError):
+                                value = np.nan
+                        elif isinstance(value, float) and value == int(value):
+                            value = int(value)
+                    elif data_type == 's':
+                        value = shared_strings[int(value)]
+                    elif data_type == 'b':
+                        value = bool(int(value))
+                    elif data_type == 'd':
+                        value = from_ISO8601(value)
+                    elif data_type == 'e':
+                        value = np.nan
+            elem.clear()
+            if value is None or (isinstance(value, str) and value == ''):
+                continue
+            cells.setdefault(int(row), {})[col] = value
+
+    # 最後の行（key_col があればその列が空でない最後の行）までを行のリストにする
+    if key_col is not None:
+        last_row = max((r for r, values in cells.items() if key_col in values), default=1)
+    else:
+        last_row = max(cells, default=0)
+    rows = [cells.get(r, {}) for r in range(1, last_row + 1)]
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        return pd.DataFrame()
+
+    width = max((max(values) for values in rows if values), default=0)
+    data = [[values.get(col, '') for col in range(1, width + 1)] for values in rows]
+    try:
+        return TextParser(data, header=0, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def read_workbook_streaming(excel_file: str, sheet_names: list) -> dict:
+    """
+    ブックを1回開いて複数シートを流し読みする（共有文字列・スタイルのデコードも1回）。
+    ブックにないシートは含めない。
+    """
+    with zipfile.ZipFile(excel_file) as zf:
+        parts = {}
+        for sheet_name in sheet_names:
+            part_name = _sheet_part_name(zf, sheet_name)
+            if part_name is not None:
+                parts[sheet_name] = part_name
+        if not parts:
+            return {}
+        context = _workbook_cell_context(zf)
+        return {sheet_name: _read_sheet_part(zf, part_name, sheet_name, context) for sheet_name, part_name in parts.items()}
+
+
+def read_sheet_streaming(excel_file: str, sheet_name: str) -> pd.DataFrame:
+    frames = read_workbook_streaming(excel_file, [sheet_name])
+    if sheet_name not in frames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return frames[sheet_name]
+
+
+SHEET_READERS = {
+    'pandas': read_sheet_pandas,
+    'streaming': read_sheet_streaming,
+}
+WORKBOOK_READERS = {
+    'pandas': read_workbook_pandas,
+    'streaming': read_workbook_streaming,
+}
+
+
+def read_sheet(excel_file: str, sheet_name: str) -> pd.DataFrame:
+    """設定された方式でシートを読み込む（streaming が失敗した場合は pandas で読み直す）"""
+    frames = read_sheets(excel_file, [sheet_name])
+    if sheet_name not in frames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return frames[sheet_name]
+
+
+def read_sheets(excel_file: str, sheet_names: list) -> dict:
+    """設定された方式で複数シートを1回の読み込みで取り出す（ブックにないシートは含めない。streaming が失敗した場合は pandas で読み直す）"""
+    reader = WORKBOOK_READERS.get(SHEET_READER, read_workbook_pandas)
+    if reader is read_workbook_pandas:
+        return read_workbook_pandas(excel_file, sheet_names)
+    try:
+        return reader(excel_file, sheet_names)
+    except Exception as e:
+        logging.warning(f"{SHEET_READER} reader failed for {excel_file} ({', '.join(sheet_names)}): {e}; falling back to pandas")
+        return read_workbook_pandas(excel_file, sheet_names)
+
+
+# --- Process Pool ---
+# Excel の読み込み (read_sheets) と openpyxl / XML パッチでの保存・検証は GIL を数秒つかむので、
+# 別プロセスのプールで実行して、その間も他のリクエスト（/api/sales など）に応答できるようにする。
+# 読み込み結果は列ごとの配列で受け取って DataFrame に組み立て直す。
+# 保存はブックごとに同じワーカーで実行する（ワーカー内の行インデックスを保存の間で使い続けるため）。
+# config.json の "process_pool_workers"（既定 2、0 でこのプロセス内で実行）と
+# "process_pool_queue"（ワーカー待ちのタスク数の上限。超えた分は呼び出し側で空きを待つ）で調整する。
+PROCESS_POOL_WORKERS = max(0, int(CONFIG.get('process_pool_workers', min(2, os.cpu_count() or 1))))
+PROCESS_POOL_QUEUE = max(1, int(CONFIG.get('process_pool_queue', 8)))
+
+
+class WorkerPool:
+    """
+    上限付きのプロセスプール。ワーカーごとに1プロセスのエグゼキューターを持ち、最初のタスクで起動する（Windows と同じ spawn 方式）。
+    affinity（ブックのパス）を指定したタスクは毎回同じワーカー、それ以外は実行中のタスクが最も少ないワーカーで実行する。
+    ワーカーが落ちたらそのワーカーを作り直す。読み込み (parse) はこのプロセス内でやり直し、保存はエラーにする。
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executors = [None] * workers
+        self._busy = [0] * workers  # ワーカーごとの実行中・待ちのタスク数
+        self._log_listener = None  # ワーカーのログを親プロセスのロガーに流す QueueListener
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._in_flight = 0
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'restarts': 0, 'inline': 0, 'max_in_flight': 0}
+        self.kinds = {}  # {種類: {'tasks', 'total_ms', 'max_ms', 'wait_ms'}}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_executor(self, worker: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executors[worker] is None:
+                context = multiprocessing.get_context('spawn')
+                if self._log_listener is None:
+                    self._log_listener = logging.handlers.QueueListener(context.Queue(), _ParentLogHandler())
+                    self._log_listener.start()
+                # ワーカーは import 時にこれを見て、サーバーの初期化を省き同じ設定で動く
+                os.environ[POOL_WORKER_ENV] = json.dumps({'config': CONFIG, 'excel_dir': EXCEL_DIR})
+                self._executors[worker] = ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                                              initializer=_init_worker_logging,
+                                                              initargs=(self._log_listener.queue,))
+            return self._executors[worker]
+
+    def _choose_worker(self, affinity: Optional[str]) -> int:
+        """タスクを実行するワーカー（呼び出し側で _lock を持つこと）"""
+        if affinity is not None:
+            return zlib.crc32(affinity.encode('utf-8')) % self.workers
+        return min(range(self.workers), key=self._busy.__getitem__)
+
+    def _record(self, kind: str, started: float, submitted: float):
+        ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self.kinds.setdefault(kind, {'tasks': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'wait_ms': 0.0})
+            stats['tasks'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            stats['wait_ms'] += (submitted - started) * 1000
+
+    def run(self, kind: str, fn, *args, affinity: Optional[str] = None):
+        """
+        fn(*args) をワーカーで実行して結果を返す（プールが無効ならこのプロセスで実行）。
+        affinity が同じタスクは同じワーカーで実行する
+        """
+        started = time.perf_counter()
+        if not self.enabled:
+            with self._lock:
+                self.stats['inline'] += 1
+            try:
+                return fn(*args)
+            finally:
+                self._record(kind, started, started)
+
+        self._slots.acquire()  # 待ちが上限に達していれば空くまで待つ
+        submitted = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            self.stats['submitted'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            worker = self._choose_worker(affinity)
+            self._busy[worker] += 1
+        try:
+            executor = self._get_executor(worker)
+            try:
+                outcome = executor.submit(_run_in_worker, fn, args).result()
+            except BrokenProcessPool as e:
+                retry_inline = kind == 'parse'
+                logging.error(f"Process pool broken during {kind} ({e}); restarting"
+                              + (" and running in-process" if retry_inline else ""))
+                with self._lock:
+                    if self._executors[worker] is executor:
+                        self._executors[worker] = None
+                        self.stats['restarts'] += 1
+                    if retry_inline:
+                        self.stats['inline'] += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+                if not retry_inline:
+                    # 保存はワーカーが os.replace の後に落ちたかもしれないので、ここでやり直すと二重に追加しうる。
+                    # 呼び出し側（書き込みレーン・ジャーナルの再試行）にエラーとして返す
+                    raise
+                return fn(*args)
+        except BaseException:
+            with self._lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._busy[worker] -= 1
+            self._slots.release()
+            self._record(kind, started, submitted)
+
+        with self._lock:
+            self.stats['completed'] += 1
+        if outcome[0] == 'http_error':
+            raise HTTPException(status_code=outcome[1], detail=outcome[2])
+        return outcome[1]
+
+    def shutdown(self):
+        with self._lock:
+            executors, self._executors = self._executors, [None] * self.workers
+            listener, self._log_listener = self._log_listener, None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        if listener is not None:
+            listener.stop()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            running = sum(1 for busy in self._busy if busy)
+            kinds = {}
+            for kind, stats in self.kinds.items():
+                kinds[kind] = {**stats, 'total_ms': round(stats['total_ms'], 1), 'max_ms': round(stats['max_ms'], 1),
+                               'wait_ms': round(stats['wait_ms'], 1),
+                               'avg_ms': round(stats['total_ms'] / stats['tasks'], 1) if stats['tasks'] else None}
+            started = any(executor is not None for executor in self._executors)
+            return {**self.stats, 'workers': self.workers, 'max_queue': self.max_queue, 'started': started,
+                    'running': running, 'queued': self._in_flight - running, 'kinds': kinds}
+
+
+class _ParentLogHandler(logging.Handler):
+    """ワーカーから届いたログレコードを、親プロセスの同じ名前のロガーで出力する"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def _init_worker_logging(queue):
+    """ワーカー側の初期化: ログはすべてキューで親プロセスに送る（レベルの絞り込みは親のハンドラーで行う）"""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(queue)]
+    root.setLevel(logging.DEBUG)
+
+
+def _run_in_worker(fn, args) -> tuple:
+    """ワーカー側の入口。HTTPException は pickle できないので (状態, 値) の形で返す"""
+    try:
+        return 'ok', fn(*args)
+    except HTTPException as e:
+        return 'http_error', e.status_code, e.detail
+
+
+PROCESS_POOL = WorkerPool(PROCESS_POOL_WORKERS, PROCESS_POOL_QUEUE)
+
+
+@app.on_event("shutdown")
+def stop_process_pool():
+    PROCESS_POOL.shutdown()
+
+
+def frame_to_columns(df: pd.DataFrame) -> dict:
+    """DataFrame をプロセス間で受け渡す形にする: 列名と列ごとの numpy 配列（object 列は Python の値の配列）"""
+    return {'columns': list(df.columns), 'index': df.index, 'arrays': [df.iloc[:, i].to_numpy() for i in range(df.shape[1])]}
+
+
+def columns_to_frame(data: dict) -> pd.DataFrame:
+    df = pd.DataFrame(dict(enumerate(data['arrays'])), index=data['index'], copy=False)
+    return df.set_axis(data['columns'], axis=1, copy=False) if len(data['columns']) else pd.DataFrame(index=data['index'])
+
+
+def read_sheets_columnar(excel_file: str, sheet_names: list) -> dict:
+    """ワーカーで実行: read_sheets の結果を {シート名: frame_to_columns の形} で返す"""
+    return {name: frame_to_columns(df) for name, df in read_sheets(excel_file, sheet_names).items()}
+
+
+def read_sheets_in_pool(excel_file: str, sheet_names: list) -> dict:
+    """read_sheets をプロセスプールで実行する（プールが無効ならこのプロセスで読む）"""
+    if not PROCESS_POOL.enabled:
+        return PROCESS_POOL.run('parse', read_sheets, excel_file, sheet_names)
+    columns = PROCESS_POOL.run('parse', read_sheets_columnar, excel_file, sheet_names)
+    return {name: columns_to_frame(data) for name, data in columns.items()}
+
+
+def apply_mutations_in_worker(excel_file: str, mutations: list, target_map: Optional[dict]) -> list:
+    """ワーカーで実行: apply_mutations_to_workbook（現目標は呼び出し側のキャッシュから引いたものを使う）"""
+    return apply_mutations_to_workbook(excel_file, mutations, (lambda: target_map) if target_map is not None else None)
+
+
+def apply_mutations_in_pool(excel_file: str, mutations: list, load_target_map=None) -> list:
+    """apply_mutations_to_workbook をプロセスプールで実行する（保存・検証もワーカー側）"""
+    if not PROCESS_POOL.enabled:
+        return PROCESS_POOL.run('save', apply_mutations_to_workbook, excel_file, mutations, load_target_map)
+
+    # ワーカーからはこのプロセスのキャッシュを使えないので、追加がある場合だけ現目標を先に引いて渡す
+    target_map = None
+    if load_target_map is not None and any(m['op'] == 'add' and m.get('target_key') for m in mutations):
+        try:
+            target_map = load_target_map()
+        except Exception as e:
+            logging.warning(f"Cached current targets unavailable for {excel_file}: {e}")
+    with get_workbook_lock(excel_file):
+        try:
+            # 同じブックの保存は同じワーカーで行い、そのワーカーの行インデックスを次の保存でも使う
+            results = PROCESS_POOL.run('save', apply_mutations_in_worker, excel_file, mutations, target_map,
+                                       affinity=os.path.abspath(excel_file))
+        finally:
+            # 保存・行インデックスの更新はワーカー側で行われたので、このプロセスの stat と行インデックスを合わせる
+            signature = refresh_workbook_signature(excel_file)
+            ROW_INDEX.pop(excel_file, None)
+        if signature is not None and any(r['status'] == 'ok' for r in results):
+            LOCAL_WRITES[excel_file] = signature
+    return results
+
+
+# --- Workbook Writer Lanes ---
+# 書き込みはワークブックごとに1本のレーン（専用スレッド）で直列化する。
+# 保存中や短い待ち時間 (write_coalesce_window) の間に届いた変更は、まとめて1回の読み込み・保存で反映する。
+# 変更 (mutation): {'op': 'add'|'cells'|'delete', 'management_number', 'values': {列番号: 値},
+#                  'target_key': (得意先CD, 直送先CD) ※追加時のみ, 'original_values' ※楽観的ロック, 'backup': bool}
+WRITE_COALESCE_WINDOW = float(CONFIG.get('write_coalesce_window', 0.05))
+WRITER_IDLE_TIMEOUT = 30.0
+
+WRITERS = {}
+_WRITERS_GUARD = threading.Lock()
+
+
+def verify_saved_workbook(path: str):
+    """保存した .xlsm を軽く検証: zip の中央ディレクトリと必須パーツ、営業日報シートの CRC を確認"""
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        for required in ('[Content_Types].xml', 'xl/workbook.xml'):
+            if required not in names:
+                raise zipfile.BadZipFile(f"{required} missing in saved workbook")
+        part_name = _sheet_part_name(zf, '営業日報')
+        if part_name is None or part_name not in names:
+            raise zipfile.BadZipFile("営業日報 sheet missing in saved workbook")
+        # 読み切ると zipfile が CRC を照合する（不一致なら BadZipFile）
+        with zf.open(part_name) as f:
+            while f.read(1024 * 1024):
+                pass
+
+
+def save_via_temp(excel_file: str, write):
+    """安全な保存: 同じフォルダの一時ファイルに write(一時ファイル) で保存し、検証してから os.replace で置き換え
+    同じボリューム上なので置き換えはアトミック（途中で落ちても元のファイルは壊れない）
+    """
+    directory, name = os.path.split(excel_file)
+    temp_file = os.path.join(directory, f".~{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    
+    try:
+        # 一時ファイルに保存してディスクまで書き出す
+        write(temp_file)
+        with open(temp_file, 'rb+') as f:
+            os.fsync(f.fileno())
+        logging.debug(f"saved to temp: {temp_file}")
+        
+        # 一時ファイルが正常か確認（zip 構造と CRC）
+        verify_saved_workbook(temp_file)
+        logging.debug("temp file verified")
+        
+        # 元のファイルを一時ファイルで置き換え
+        os.replace(temp_file, excel_file)
+        signature = refresh_workbook_signature(excel_file)
+        if signature is not None:
+            LOCAL_WRITES[excel_file] = signature
+        logging.debug("replaced original file")
+    finally:
+        # 置き換えに失敗した場合は一時ファイルを削除
+        if os.path.exists(temp_file):
+            try:
+                os.remove(temp_file)
+            except:
+                pass
+
+
+# 追加の再実行の判定で比べない列: 管理番号・得意先目標（保存時に引き直す）・上長コメント・コメント返信欄（追加後に他の人も書く）
+REPLAY_IGNORED_COLUMNS = (1, 11, 23, 24)
+
+
+def _comparable_cell_text(value) -> str:
+    text = str(value) if value is not None else ""
+    return text.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+def add_already_applied(ws, row: int, m: dict, later_mutations: list) -> bool:
+    """
+    指定の管理番号の行が、この追加（と同じ保存で続けて適用するその行のセル更新）で書いた内容と同じか。
+    同じならジャーナルの再実行、違えば他の PC や Excel が同じ番号で追加した別の行
+    """
+    expected = dict(m['values'])
+    for later in later_mutations:
+        if later['op'] == 'cells' and later.get('management_number') == m['management_number']:
+            expected.update(later['values'])
+    return all(_comparable_cell_text(ws.cell(row=row, column=col_idx).value) == _comparable_cell_text(value)
+               for col_idx, value in expected.items() if col_idx not in REPLAY_IGNORED_COLUMNS)
+
+
+def apply_mutations_to_sheet(excel_file: str, ws, mtime: float, mutations: list, load_target_map=None) -> list:
+    """変更を営業日報シート (openpyxl の Worksheet または WorksheetXmlPatch) に適用し、変更ごとの結果を返す"""
+    target_map = None   # 得意先_List の現目標（追加がある場合だけ一度読む）
+    styles = None       # 新規行の書式（一度だけ取得）
+    collided = set()    # 別の行が同じ番号を使っていて追加できなかった管理番号
+    results = []
+    for i, m in enumerate(mutations):
+        management_number = m.get('management_number')
+        if management_number in collided and 'seq' in m:
+            # 追加できなかった報告へのジャーナル上の続きの変更を、同じ番号の別の行に適用しない
+            results.append({'status': 'conflict', 'management_number': management_number, 'conflicts': ['管理番号'],
+                            'detail': f"管理番号 {management_number} の追加が別の行と重複したため適用しませんでした"})
+            continue
+        try:
+            if m['op'] == 'add':
+                index = get_row_index(excel_file, ws, mtime)
+                if management_number is None:
+                    management_number = index['next_number']
+                elif management_number in index['rows']:
+                    existing_row = index['rows'][management_number]
+                    if add_already_applied(ws, existing_row, m, mutations[i + 1:]):
+                        # ジャーナルの再実行（保存後・ジャーナル更新前に落ちた場合など）: 反映済みなので追加しない
+                        logging.info(f"Management number {management_number} already exists in {excel_file} "
+                                     f"with the same content; add treated as already applied")
+                        results.append({'status': 'ok', 'management_number': management_number,
+                                        'values': {**m['values'], 1: management_number}, 'already_applied': True})
+                    else:
+                        # 別の PC・Excel が同じ番号で追加した行: 上書きも読み捨てもせず、呼び出し側（デッドレター）に任せる
+                        logging.error(f"Management number {management_number} in {excel_file} (row {existing_row}) "
+                                      f"holds a different report; queued add not applied")
+                        collided.add(management_number)
+                        results.append({'status': 'conflict', 'management_number': management_number, 'conflicts': ['管理番号'],
+                                        'detail': f"管理番号 {management_number} は別の報告が使用しています"})
+                    continue
+
+                columns_to_write = {**m['values'], 1: management_number}
+                if m.get('target_key'):
+                    if target_map is None:
+                        target_map = load_target_map()
+                    columns_to_write[11] = target_map.get(tuple(m['target_key']), "")
+                
+                # Insert at the row immediately after the last management number
+                next_row = index['last_row'] + 1
+                if styles is None:
+                    styles = capture_row_styles(ws, index['last_row'], range(1, 25))
+                write_report_row(ws, next_row, dict(sorted(columns_to_write.items())), styles)
+                row_index_after_insert(excel_file, management_number, next_row)
+                results.append({'status': 'ok', 'management_number': management_number, 'values': columns_to_write})
+                continue
+            
+            target_row = find_report_row(excel_file, ws, mtime, management_number)
+            if not target_row:
+                results.append({'status': 'not_found', 'management_number': management_number})
+                continue
+            
+            if m['op'] == 'delete':
+                ws.delete_rows(target_row, 1)
+                row_index_after_delete(excel_file, management_number, target_row)
+            else:
+                if m.get('original_values'):
+                    logging.debug(f"Performing conflict check for Report {management_number}")
+                    conflicts = find_report_conflicts(
+                        lambda col_idx: ws.cell(row=target_row, column=col_idx).value,
+                        m['original_values']
+                    )
+                    if conflicts:
+                        results.append({'status': 'conflict', 'management_number': management_number, 'conflicts': conflicts})
+                        continue
+                for col_idx, value in m['values'].items():
+                    ws.cell(row=target_row, column=col_idx, value=value)
+            results.append({'status': 'ok', 'management_number': management_number})
+        except XmlPatchUnsupported:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to apply {m['op']} for {management_number}: {e}")
+            results.append({'status': 'error', 'management_number': management_number, 'detail': str(e)})
+    return results
+
+
+def patch_workbook_cells(excel_file: str, mutations: list) -> list:
+    """セル値だけの変更を、営業日報シートの XML だけ書き換えて保存"""
+    mtime = os.path.getmtime(excel_file)
+    part_name, ws = open_sheet_patch(excel_file, '営業日報')
+    try:
+        results = apply_mutations_to_sheet(excel_file, ws, mtime, mutations)
+        if any(r['status'] == 'ok' for r in results):
+            xml = ws.to_xml().encode('utf-8')
+            save_via_temp(excel_file, lambda temp_file: write_patched_workbook(excel_file, temp_file, {part_name: xml}))
+    except BaseException:
+        # 行インデックスは保存前に更新しているので、保存できなかった場合は作り直す
+        ROW_INDEX.pop(excel_file, None)
+        raise
+    return results
+
+
+def apply_mutations_to_workbook(excel_file: str, mutations: list, load_target_map=None) -> list:
+    """複数の変更を1回の読み込み・保存で .xlsm に反映し、変更ごとの結果を返す
+    結果: {'status': 'ok'|'not_found'|'conflict'|'error', 'management_number', 'conflicts', 'detail'}
+    load_target_map: 追加時の現目標の取得（省略時は開いたブックの 得意先_List から読む）
+    """
+    with get_workbook_lock(excel_file):
+        if XML_PATCH_ENABLED and all(m['op'] == 'cells' for m in mutations):
+            try:
+                results = patch_workbook_cells(excel_file, mutations)
+                row_index_touch(excel_file)
+                return results
+            except XmlPatchUnsupported as e:
+                logging.info(f"XML patch not applicable to {excel_file} ({e}), falling back to openpyxl")
+        
+        mtime = os.path.getmtime(excel_file)
+        # Load workbook with openpyxl to preserve formulas and macros
+        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
+        try:
+            if '営業日報' not in wb.sheetnames:
+                raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
+            
+            def load_workbook_target_map():
+                if '得意先_List' not in wb.sheetnames:
+                    return {}
+                if load_target_map is not None:
+                    try:
+                        return load_target_map()
+                    except Exception as e:
+                        logging.warning(f"Cached current targets unavailable for {excel_file}: {e}")
+                # 得意先_Listの構造: A=得意先CD, B=直送先CD, ..., J=現目標
+                return build_current_target_map(
+                    (values[0], values[1], values[9])
+                    for values in wb['得意先_List'].iter_rows(min_row=2, max_col=10, values_only=True)
+                )
+            
+            results = apply_mutations_to_sheet(excel_file, wb['営業日報'], mtime, mutations, load_workbook_target_map)
+            failed_groups = failed_mutation_groups(mutations, results)
+            if not failed_groups and any(r['status'] == 'ok' for r in results):
+                # Save the workbook (Critical path - blocking)
+                save_via_temp(excel_file, wb.save)
+        except BaseException:
+            # 行インデックスは保存前に追加・削除を反映しているので、保存できなかった場合は作り直す
+            ROW_INDEX.pop(excel_file, None)
+            raise
+        finally:
+            wb.close()
+        if failed_groups:
+            # 開いたブックには失敗したグループの行も書き込まれているので保存せず、行インデックスも作り直す
+            ROW_INDEX.pop(excel_file, None)
+            return rollback_failed_groups(excel_file, mutations, results, failed_groups, load_target_map)
+        row_index_touch(excel_file)
+    return results
+
+
+def failed_mutation_groups(mutations: list, results: list) -> set:
+    """全件まとめて保存する変更のグループ ('group') のうち、1件でも失敗したもの"""
+    return {m['group'] for m, r in zip(mutations, results) if m.get('group') is not None and r['status'] != 'ok'}
+
+
+def rollback_failed_groups(excel_file: str, mutations: list, results: list, failed_groups: set, load_target_map=None) -> list:
+    """失敗したグループの変更はすべて保存せずにエラーとし、それ以外の変更だけで保存し直す"""
+    causes = {}
+    for m, r in zip(mutations, results):
+        if m.get('group') in failed_groups and r['status'] != 'ok':
+            causes.setdefault(m['group'], r.get('detail') or r['status'])
+    remaining = [i for i, m in enumerate(mutations) if m.get('group') not in failed_groups]
+    retried = apply_mutations_to_workbook(excel_file, [mutations[i] for i in remaining], load_target_map) if remaining else []
+    final = [None] * len(mutations)
+    for i, result in zip(remaining, retried):
+        final[i] = result
+    for i, m in enumerate(mutations):
+        if final[i] is None:
+            final[i] = {'status': 'error', 'management_number': None,
+                        'detail': f"一括追加の一部を保存できなかったため、すべて保存しませんでした: {causes[m['group']]}"}
+    return final
+
+
+class WorkbookWriter:
+    """ワークブック1つ分の書き込みレーン。キューに溜まった変更をまとめて1回で保存する"""
+    
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.excel_file = os.path.join(EXCEL_DIR, filename)
+        self.cond = threading.Condition()
+        self.queue = []   # [(mutation, Future)]
+        self.thread = None
+        self.stats = {'mutations': 0, 'saves': 0, 'failed_saves': 0, 'max_queue_depth': 0, 'last_batch_size': 0}
+    
+    def submit(self, mutations: list) -> list:
+        futures = [Future() for _ in mutations]
+        with self.cond:
+            self.queue.extend(zip(mutations, futures))
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self.queue))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"writer-{self.filename}", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return futures
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.queue:
+                    self.cond.wait(timeout=WRITER_IDLE_TIMEOUT)
+                    if not self.queue:
+                        # しばらく書き込みがなければスレッドを終了（次の submit で再作成）
+                        self.thread = None
+                        return
+            # 近いタイミングの変更を少し待ってまとめる
+            time.sleep(WRITE_COALESCE_WINDOW)
+            with self.cond:
+                batch, self.queue = self.queue, []
+            self._write(batch)
+    
+    def _write(self, batch: list):
+        mutations = [m for m, _ in batch]
+        try:
+            with get_workbook_lock(self.excel_file):
+                before = file_signature(self.excel_file)
+                # 現目標は保存前のブックを読んだキャッシュ（得意先_List）から引く
+                results = apply_mutations_in_pool(self.excel_file, mutations, lambda: current_target_map(self.filename))
+                if any(r['status'] == 'ok' for r in results):
+                    # キャッシュは破棄せず、同じ変更を適用して最新にする
+                    write_through_cache(self.filename, before, mutations, results)
+        except BaseException as e:
+            self.stats['failed_saves'] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        if any(r['status'] == 'ok' for r in results):
+            self.stats['saves'] += 1
+        self.stats['mutations'] += len(batch)
+        self.stats['last_batch_size'] = len(batch)
+        if len(batch) > 1:
+            logging.info(f"Coalesced {len(batch)} changes into one save of {self.filename}")
+        
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        
+        # バックアップはまとめた保存ごとに1回だけ
+        if any(m.get('backup') for m in mutations):
+            create_backup(self.excel_file)
+    
+    def metrics(self) -> dict:
+        with self.cond:
+            queue_depth = len(self.queue)
+        saves = self.stats['saves']
+        return {
+            **self.stats,
+            'queue_depth': queue_depth,
+            'coalescing_ratio': round(self.stats['mutations'] / saves, 2) if saves else None,  # 保存1回あたりの変更数
+            'active': self.thread is not None,
+        }
+
+
+def get_workbook_writer(filename: str) -> WorkbookWriter:
+    with _WRITERS_GUARD:
+        writer = WRITERS.get(filename)
+        if writer is None or writer.excel_file != os.path.join(EXCEL_DIR, filename):
+            writer = WorkbookWriter(filename)
+            WRITERS[filename] = writer
+        return writer
+
+
+def submit_report_changes(filename: str, mutations: list) -> list:
+    """変更をワークブックのレーンに投入し、保存されるまで待って結果を返す"""
+    note_interactive_request()
+    futures = get_workbook_writer(filename).submit(mutations)
+    try:
+        return [future.result() for future in futures]
+    except PermissionError:
+        raise HTTPException(
+            status_code=409,
+            detail="ファイルが開かれているため保存できません。Excelファイルを閉じてから再度実行してください。"
+        )
+
+
+def check_change_result(result: dict):
+    """レーンの結果を HTTP エラーに変換"""
+    if result['status'] == 'not_found':
+        raise HTTPException(status_code=404, detail=f"Report with management number {result['management_number']} not found")
+    if result['status'] == 'conflict':
+        conflict_msg = ", ".join(result['conflicts'])
+        raise HTTPException(
+            status_code=409, 
+            detail=f"他の方が編集しました（{conflict_msg}）。最新の情報を読み込んでからやり直してください。"
+        )
+    if result['status'] == 'error':
+        raise HTTPException(status_code=500, detail=result['detail'])
+
+
+@app.get("/api/metrics")
+@bulkhead('light')
+def get_metrics():
+    """キャッシュや書き込みレーンなどの内部状態（監視用）"""
+    with _WRITERS_GUARD:
+        writers = {filename: writer.metrics() for filename, writer in WRITERS.items()}
+    return {
+        "cache": CACHE.metrics(),
+        "disk_cache": dict(DISK_CACHE_STATS),
+        "sheet_changes": dict(SHEET_CHANGE_STATS),
+        "stat": stat_metrics(),
+        "watcher": dict(WATCH_STATS),
+        "single_flight": SINGLE_FLIGHT.metrics(),
+        "process_pool": PROCESS_POOL.metrics(),
+        "bulkheads": bulkhead_metrics(),
+        "stale_while_revalidate": swr_metrics(),
+        "writers": writers,
+        "write_behind": {"enabled": WRITE_BEHIND, "pending": len(JOURNAL['pending']), "dead_letter": JOURNAL['dead_letter']},
+    }
+
+
+# --- Write-behind Journal ---
+# config.json の "write_behind": true で有効化。変更内容をローカルのジャーナルに fsync 付きで
+# 追記した時点で応答し、バックグラウンドのフラッシャーがまとめて .xlsm に書き込む。
+# ジャーナルのエントリ: {'seq', 'filename', 'op': 'add'|'cells'|'delete', 'management_number', 'values': {列番号: 値}}
+WRITE_BEHIND = bool(CONFIG.get('write_behind', False))
+WRITE_BEHIND_INTERVAL = float(CONFIG.get('write_behind_interval', 1.0))  # まとめ書きの待ち時間（秒）
+WRITE_BEHIND_MAX_BACKOFF = float(CONFIG.get('write_behind_max_backoff', 60.0))
+JOURNAL_PATH = os.path.join(BASE_DIR, 'write_journal.jsonl')
+# ブックに反映できなかったエントリ（行が削除済み・書き込みエラーなど）。応答済みの変更なので捨てずにここへ移し、手作業で確認する
+DEAD_LETTER_PATH = os.path.join(BASE_DIR, 'write_journal.failed.jsonl')
+
+JOURNAL = {
+    'pending': [],        # 未反映のエントリ（追記順）
+    'seq': 0,
+    'allocated': {},      # {filename: 払い出し済みの最大管理番号}
+    'retry': {},          # {filename: {'attempts': int, 'next_try': float}}
+    'dead_letter': 0,     # DEAD_LETTER_PATH のエントリ数
+}
+_JOURNAL_LOCK = threading.Lock()
+_JOURNAL_WAKE = threading.Event()
+_JOURNAL_STOP = threading.Event()
+_journal_thread = None
+
+
+def _fsync_write(path: str, lines: list, mode: str):
+    with open(path, mode, encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _decode_journal_entry(entry: dict) -> dict:
+    # JSON ではキーが文字列になるので列番号を int に戻す
+    entry['values'] = {int(k): v for k, v in (entry.get('values') or {}).items()}
+    return entry
+
+
+def load_journal():
+    """起動時に未反映のジャーナルを読み込む（前回終了時に書き込めなかった分を再実行）"""
+    if os.path.exists(DEAD_LETTER_PATH):
+        try:
+            with open(DEAD_LETTER_PATH, 'r', encoding='utf-8') as f:
+                JOURNAL['dead_letter'] = sum(1 for line in f if line.strip())
+        except Exception as e:
+            logging.error(f"Failed to read dead-letter journal: {e}")
+    if not os.path.exists(JOURNAL_PATH):
+        return
+    pending = []
+    try:
+        with open(JOURNAL_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    pending.append(_decode_journal_entry(json.loads(line)))
+                except json.JSONDecodeError:
+                    # 書き込み途中で落ちた最終行は無視
+                    logging.warning(f"Skipping corrupt journal line: {line[:100]}")
+    except Exception as e:
+        logging.error(f"Failed to load write journal: {e}")
+        return
+
+    with _JOURNAL_LOCK:
+        JOURNAL['pending'] = pending
+        JOURNAL['seq'] = max([e['seq'] for e in pending], default=0)
+        for entry in pending:
+            if entry['op'] == 'add':
+                current = JOURNAL['allocated'].get(entry['filename'], 0)
+                JOURNAL['allocated'][entry['filename']] = max(current, entry['management_number'])
+    if pending:
+        logging.info(f"Loaded {len(pending)} pending journal entries")
+
+
+def _rewrite_journal():
+    """反映済みエントリを取り除いてジャーナルを書き直す（_JOURNAL_LOCK 内で呼ぶ）"""
+    lines = [json.dumps(e, ensure_ascii=False) for e in JOURNAL['pending']]
+    temp_path = JOURNAL_PATH + '.tmp'
+    _fsync_write(temp_path, lines, 'w')
+    os.replace(temp_path, JOURNAL_PATH)
+
+
+def append_journal(filename: str, op: str, management_number: int, values: Optional[dict] = None) -> dict:
+    """変更をジャーナルに追記して fsync し、フラッシャーを起こす"""
+    return append_journal_entries(filename, [(op, management_number, values)])[0]
+
+
+def append_journal_entries(filename: str, changes: list) -> list:
+    """複数の変更 [(op, 管理番号, values), ...] をまとめて1回の fsync で追記"""
+    with _JOURNAL_LOCK:
+        entries = []
+        for op, management_number, values in changes:
+            JOURNAL['seq'] += 1
+            entries.append({
+                'seq': JOURNAL['seq'],
+                'filename': filename,
+                'op': op,
+                'management_number': management_number,
+                'values': values or {},
+                'ts': datetime.now().isoformat(),
+            })
+        _fsync_write(JOURNAL_PATH, [json.dumps(e, ensure_ascii=False) for e in entries], 'a')
+        JOURNAL['pending'].extend(entries)
+    _JOURNAL_WAKE.set()
+    return entries
+
+
+def pending_journal_entries(filename: str) -> list:
+    with _JOURNAL_LOCK:
+        return [e for e in JOURNAL['pending'] if e['filename'] == filename]
+
+
+def pending_writes_token(filename: str) -> Optional[tuple]:
+    """未反映の変更の版（件数と最初・最後の seq）。なければ None"""
+    entries = pending_journal_entries(filename)
+    if not entries:
+        return None
+    return len(entries), entries[0]['seq'], entries[-1]['seq']
+
+
+def allocate_management_number(filename: str, count: int = 1) -> int:
+    """write-behind 用の採番: シート上の最大値・未反映分・払い出し済みの最大値の次から count 件を連番で確保"""
+    df = get_cached_dataframe(filename, '営業日報', fresh=True)  # 未反映の追加分も含む
+    numbers = pd.to_numeric(df[df.columns[0]], errors='coerce').dropna()
+    sheet_max = int(numbers.max()) if not numbers.empty else 0
+    with _JOURNAL_LOCK:
+        new_mgmt_num = max(sheet_max, JOURNAL['allocated'].get(filename, 0)) + 1
+        JOURNAL['allocated'][filename] = new_mgmt_num + count - 1
+    return new_mgmt_num
+
+
+def build_current_targets(view: SheetView) -> dict:
+    if len(view.columns) < 10:
+        return {}
+    # 得意先_Listの構造: A=得意先CD, B=直送先CD, ..., J=現目標
+    columns = view.select([view.columns[i] for i in (0, 1, 9)]).astype(object)
+    columns = columns.where(columns.notna(), None)
+    return build_current_target_map(columns.itertuples(index=False, name=None))
+
+
+def current_target_map(filename: str) -> dict:
+    """得意先_List(キャッシュ) の {(得意先CD, 直送先CD): 現目標}。版ごとに一度だけ作る"""
+    return get_sheet_view(filename, '得意先_List', fresh=True).derived('current_targets', build_current_targets)
+
+
+def lookup_current_target(filename: str, customer_cd: str, direct_delivery_cd: str) -> str:
+    """得意先_List(キャッシュ) から 現目標 (J列) を取得。一致条件は add_report と同じ"""
+    target_map = current_target_map(filename)
+    return target_map.get((str(customer_cd).strip(), str(direct_delivery_cd).strip() if direct_delivery_cd else ""), "")
+
+
+def _frame_value(series: pd.Series, value):
+    """pd.read_excel で読み直した場合と同じ表現になるよう値を変換（'' は NaN、数値列の数字文字列は数値）"""
+    if value is None or (isinstance(value, str) and value == ''):
+        return float('nan')
+    if isinstance(value, str) and pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        try:
+            number = float(value)
+            return int(number) if number.is_integer() and pd.api.types.is_integer_dtype(series.dtype) else number
+        except ValueError:
+            return value
+    return value
+
+
+def _fits_dtype(series: pd.Series, value) -> bool:
+    dtype = series.dtype
+    if dtype == object:
+        return True
+    is_nan = isinstance(value, float) and value != value
+    if pd.api.types.is_integer_dtype(dtype):
+        return isinstance(value, int) and not isinstance(value, bool)
+    if pd.api.types.is_float_dtype(dtype):
+        return is_nan or (isinstance(value, (int, float)) and not isinstance(value, bool))
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return is_nan or isinstance(value, (datetime, pd.Timestamp))
+    return False
+
+
+def _column_for_value(series: pd.Series, value) -> pd.Series:
+    """値が入らない dtype の列は、読み直した場合と同じく float64 / object に広げる"""
+    if _fits_dtype(series, value):
+        return series
+    if pd.api.types.is_integer_dtype(series.dtype) and isinstance(value, float):
+        return series.astype('float64')
+    if pd.api.types.is_float_dtype(series.dtype):
+        # openpyxl は整数値のセルを int で返すので、混在列では int に戻す
+        return pd.Series([int(v) if v == v and v.is_integer() else v for v in series.tolist()],
+                         index=series.index, dtype=object, name=series.name)
+    return series.astype(object)
+
+
+def _set_frame_cell(df: pd.DataFrame, label, col_idx: int, value):
+    if col_idx > len(df.columns):
+        return
+    col = df.columns[col_idx - 1]
+    value = _frame_value(df[col], value)
+    series = _column_for_value(df[col], value)
+    if series is not df[col]:
+        df[col] = series
+    df.at[label, col] = value
+
+
+def _append_frame_row(df: pd.DataFrame, values: dict) -> pd.DataFrame:
+    label = len(df)
+    columns = {}
+    for col_idx, col in enumerate(df.columns, start=1):
+        value = _frame_value(df[col], values.get(col_idx))
+        series = _column_for_value(df[col], value)
+        columns[col] = pd.concat([series, pd.Series([value], index=[label], dtype=series.dtype)])
+    return pd.DataFrame(columns, columns=df.columns)
+
+
+def apply_mutations_to_frame(df: pd.DataFrame, mutations: list) -> pd.DataFrame:
+    """営業日報の DataFrame に変更を適用（追加は同じ管理番号があれば無視するので二重適用しても安全）"""
+    if len(df.columns) == 0:
+        return df
+    mgmt_col = df.columns[0]
+    for m in mutations:
+        matches = df.index[df[mgmt_col] == m['management_number']]
+        if m['op'] == 'add':
+            if len(matches) == 0:
+                df = _append_frame_row(df, {**m['values'], 1: m['management_number']})
+        elif len(matches) == 0:
+            continue
+        elif m['op'] == 'delete':
+            df = df.drop(index=matches[0]).reset_index(drop=True)
+        else:
+            for col_idx, value in m['values'].items():
+                # ws.cell(..., value=None) と同じく None は既存の値を残す
+                if value is not None:
+                    _set_frame_cell(df, matches[0], col_idx, value)
+    return df
+
+
+def flush_journal(force: bool = False) -> int:
+    """未反映のエントリをファイルごとにまとめて書き込む。書き込めたエントリ数を返す"""
+    now = time.time()
+    with _JOURNAL_LOCK:
+        groups = {}
+        for entry in JOURNAL['pending']:
+            retry = JOURNAL['retry'].get(entry['filename'])
+            if not force and retry and retry['next_try'] > now:
+                continue
+            groups.setdefault(entry['filename'], []).append(entry)
+
+    flushed = 0
+    for filename, entries in groups.items():
+        try:
+            # 通常の書き込みと同じレーンを通す（バックアップは保存ごとに1回）
+            futures = get_workbook_writer(filename).submit([{**entry, 'backup': True} for entry in entries])
+            results = [future.result() for future in futures]
+        except Exception as e:
+            with _JOURNAL_LOCK:
+                retry = JOURNAL['retry'].setdefault(filename, {'attempts': 0, 'next_try': 0})
+                retry['attempts'] += 1
+                delay = min(2 ** retry['attempts'], WRITE_BEHIND_MAX_BACKOFF)
+                retry['next_try'] = time.time() + delay
+            if isinstance(e, PermissionError):
+                logging.info(f"Journal flush for {filename} postponed {delay:.0f}s (file is open)")
+            else:
+                logging.error(f"Journal flush for {filename} failed (retry in {delay:.0f}s): {e}")
+            continue
+
+        failed = []
+        for entry, result in zip(entries, results):
+            if result['status'] != 'ok':
+                logging.error(f"Journal entry {entry['seq']} ({entry['op']} {entry['management_number']}) "
+                              f"could not be applied: {result['status']}; moved to {DEAD_LETTER_PATH}")
+                failed.append({**entry, 'status': result['status'],
+                               'detail': result.get('detail') or result.get('conflicts'), 'failed_at': datetime.now().isoformat()})
+
+        done = {entry['seq'] for entry in entries}
+        with _JOURNAL_LOCK:
+            if failed:
+                # 応答済みの変更なので、ジャーナルから外す前にデッドレターへ fsync 付きで残す
+                _fsync_write(DEAD_LETTER_PATH, [json.dumps(e, ensure_ascii=False, default=str) for e in failed], 'a')
+                JOURNAL['dead_letter'] += len(failed)
+            JOURNAL['pending'] = [e for e in JOURNAL['pending'] if e['seq'] not in done]
+            JOURNAL['retry'].pop(filename, None)
+            _rewrite_journal()
+
+        flushed += len(entries)
+        logging.info(f"Flushed {len(entries)} journal entries to {filename}")
+    return flushed
+
+
+def _journal_worker():
+    while not _JOURNAL_STOP.is_set():
+        _JOURNAL_WAKE.wait(timeout=WRITE_BEHIND_MAX_BACKOFF)
+        _JOURNAL_WAKE.clear()
+        # 近いタイミングの変更をまとめて1回の保存にする
+        if _JOURNAL_STOP.wait(WRITE_BEHIND_INTERVAL):
+            break
+        try:
+            flush_journal()
+        except Exception as e:
+            logging.error(f"Journal worker error: {e}")
+        with _JOURNAL_LOCK:
+            retry_pending = bool(JOURNAL['retry'])
+        if retry_pending:
+            # バックオフ中のファイルがあれば次の再試行時刻に合わせて起きる
+            with _JOURNAL_LOCK:
+                next_try = min(r['next_try'] for r in JOURNAL['retry'].values()) if JOURNAL['retry'] else 0
+            _JOURNAL_STOP.wait(max(0.0, next_try - time.time()))
+            _JOURNAL_WAKE.set()
+
+
+@app.on_event("startup")
+def start_cache_gc():
+    _CACHE_GC_STOP.clear()
+    threading.Thread(target=_cache_gc_worker, name="cache-gc", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_cache_gc():
+    _CACHE_GC_STOP.set()
+
+
+# --- Workbook Watcher ---
+# ほかの PC で保存されたブックを最初のリクエストより先に読み込んでおくため、EXCEL_DIR を "watch_interval" 秒
+# （既定 5 秒、0 で無効）ごとに os.scandir 1回で走査し、キャッシュ済みのブックの mtime/size が変わっていたら読み直す。
+# 共有フォルダ (SMB) ではほかの PC からの変更通知が届かないことがあるので、通知ではなく走査で検出する。
+# 読み直しはリクエストと同じ get_sheet_view の経路で、応答 JSON まで作ってから新しい版としてキャッシュに入れる
+# （それまでのリクエストは前の版を使い、入れ替えは CACHE.put 1回）。
+WATCH_INTERVAL = float(CONFIG.get('watch_interval', 5.0))
+WATCH_STATS = {'scans': 0, 'changes': 0, 'refreshes': 0, 'refresh_errors': 0, 'last_refresh_ms': None, 'last_scan': None}
+_WATCH_STOP = threading.Event()
+
+# 読み直したときに先に作っておく派生データ（エンドポイントと同じ名前）
+WATCH_PREBUILD = {
+    '営業日報': (('records.json', encode_report_records),),
+    '得意先_List': (('records.json', encode_customer_records),),
+}
+
+
+def workbook_needs_refresh(filename: str, signature: tuple) -> bool:
+    """キャッシュ済みのシート・ビューに、ブックの現在の (mtime_ns, size) と違うものがあるか"""
+    for sheet_name in WORKBOOK_SHEETS:
+        for key in ((filename, sheet_name), (filename, sheet_name, 'view')):
+            entry = CACHE.get(key)
+            if entry is not None and (entry['mtime_ns'], entry['size']) != signature:
+                return True
+    return False
+
+
+def refresh_workbook(filename: str):
+    """ブックの WORKBOOK_SHEETS を現在の版で読み込み、ビューと応答 JSON を作っておく"""
+    for sheet_name in WORKBOOK_SHEETS:
+        try:
+            view = get_sheet_view(filename, sheet_name, fresh=True)
+        except HTTPException as e:
+            logging.debug(f"Watcher skipped {filename} ({sheet_name}): {e.detail}")
+            continue
+        for name, build in WATCH_PREBUILD.get(sheet_name, ()):
+            view.derived(name, build)
+
+
+def watch_workbooks_once():
+    """EXCEL_DIR を1回走査し、変更されたキャッシュ済みのブックを読み直す"""
+    files = scan_directory_stats(EXCEL_DIR)
+    WATCH_STATS['scans'] += 1
+    WATCH_STATS['last_scan'] = datetime.now().isoformat()
+    cached = {key[0] for key in CACHE.keys() if key[1] in WORKBOOK_SHEETS}
+    for filename in sorted(cached):
+        signature = files.get(filename)
+        if signature is None or not workbook_needs_refresh(filename, signature):
+            continue
+        WATCH_STATS['changes'] += 1
+        start = time.perf_counter()
+        try:
+            refresh_workbook(filename)
+        except Exception as e:
+            WATCH_STATS['refresh_errors'] += 1
+            logging.warning(f"Watcher failed to refresh {filename}: {e}")
+            continue
+        WATCH_STATS['refreshes'] += 1
+        WATCH_STATS['last_refresh_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        logging.info(f"Watcher refreshed {filename} in {WATCH_STATS['last_refresh_ms']} ms")
+
+
+def _watch_worker():
+    while not _WATCH_STOP.wait(WATCH_INTERVAL):
+        try:
+            watch_workbooks_once()
+        except Exception as e:
+            logging.debug(f"Workbook watcher scan failed: {e}")
+
+
+@app.on_event("startup")
+def start_workbook_watcher():
+    if WATCH_INTERVAL > 0:
+        _WATCH_STOP.clear()
+        threading.Thread(target=_watch_worker, name="workbook-watcher", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_workbook_watcher():
+    _WATCH_STOP.set()
+
+
+# --- Startup Prewarm ---
+# 起動直後の最初の表示で Excel の読み込みを待たないよう、EXCEL_DIR の各ブックの WORKBOOK_SHEETS を
+# バックグラウンドで先に読み込む（"prewarm": false で無効）。順番は 既定のファイル → 最近使われた順（利用履歴）→ 更新日時の新しい順。
+# "prewarm_workers" 並列で読み、直前の "prewarm_idle_seconds" 秒にリクエストがあれば空くまで待つ（ユーザーの操作を優先）。
+# メモリキャッシュが上限の 9 割に達したら残りは読まない（よく使うブックを追い出さないため）。
+PREWARM_ENABLED = bool(CONFIG.get('prewarm', True))
+PREWARM_WORKERS = max(1, int(CONFIG.get('prewarm_workers', 2)))
+PREWARM_IDLE_SECONDS = float(CONFIG.get('prewarm_idle_seconds', 0.5))
+PREWARM_STATE = {'running': False, 'total': 0, 'done': 0, 'files': {}}  # files: {filename: 'queued'|'warming'|'warm'|'skipped'|'error'}
+_PREWARM_STOP = threading.Event()
+_INTERACTIVE = {'last': 0.0}  # 最後にユーザーのリクエストが来た時刻 (time.monotonic)
+
+# ブックごとの利用履歴 {filename: {'last_access': UNIX 時刻, 'count': int}}。"usage_save_interval" 秒ごとと終了時に保存
+USAGE_LOG_PATH = os.path.join(BASE_DIR, 'workbook_usage.json')
+USAGE_SAVE_INTERVAL = float(CONFIG.get('usage_save_interval', 60.0))
+WORKBOOK_USAGE = {}
+_USAGE_LOCK = threading.Lock()
+_USAGE_STATE = {'dirty': False, 'saved_at': 0.0}
+
+
+def load_usage_log():
+    try:
+        with open(USAGE_LOG_PATH, 'r', encoding='utf-8') as f:
+            usage = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read usage log: {e}")
+        return
+    with _USAGE_LOCK:
+        WORKBOOK_USAGE.update(usage)
+
+
+def save_usage_log():
+    with _USAGE_LOCK:
+        if not _USAGE_STATE['dirty']:
+            return
+        data = json.dumps(WORKBOOK_USAGE, ensure_ascii=False)
+        _USAGE_STATE['dirty'] = False
+        _USAGE_STATE['saved_at'] = time.monotonic()
+    temp_path = USAGE_LOG_PATH + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, USAGE_LOG_PATH)
+    except OSError as e:
+        logging.warning(f"Could not save usage log: {e}")
+
+
+def note_interactive_request():
+    _INTERACTIVE['last'] = time.monotonic()
+
 
-@app.get("/api/designs/{customer_cd}")
-def get_designs(customer_cd: str, delivery_name: Optional[str] = None, filename: str = DEFAULT_EXCEL_FILE):
-    """Get list of design requests for a specific customer (optionally filtered by delivery destination)"""
+def record_workbook_access(filename: str):
+    """ユーザーのリクエストでブックが使われたことを記録（事前読み込みの順番に使う）"""
+    note_interactive_request()
+    with _USAGE_LOCK:
+        usage = WORKBOOK_USAGE.setdefault(filename, {'last_access': 0, 'count': 0})
+        usage['last_access'] = time.time()
+        usage['count'] += 1
+        _USAGE_STATE['dirty'] = True
+        due = time.monotonic() - _USAGE_STATE['saved_at'] >= USAGE_SAVE_INTERVAL
+    if due:
+        save_usage_log()
+
+
+def prewarm_order(files: dict) -> list:
+    """事前読み込みの順番: 既定のファイル → 最近使われた順 → 更新日時の新しい順"""
+    with _USAGE_LOCK:
+        last_access = {name: usage.get('last_access', 0) for name, usage in WORKBOOK_USAGE.items()}
+    return sorted(files, key=lambda name: (name != DEFAULT_EXCEL_FILE, -last_access.get(name, 0), -files[name][0]))
+
+
+def workbook_is_warm(filename: str) -> bool:
+    """ブックの現在の版の営業日報ビューがキャッシュにあるか"""
+    signature = workbook_signature(os.path.join(EXCEL_DIR, filename))
+    entry = CACHE.get((filename, '営業日報', 'view'))
+    return signature is not None and entry is not None and (entry['mtime_ns'], entry['size']) == signature
+
+
+def _wait_until_idle():
+    while not _PREWARM_STOP.is_set() and time.monotonic() - _INTERACTIVE['last'] < PREWARM_IDLE_SECONDS:
+        _PREWARM_STOP.wait(PREWARM_IDLE_SECONDS)
+
+
+def prewarm_workbook(filename: str):
+    _wait_until_idle()
+    if _PREWARM_STOP.is_set():
+        return
+    if CACHE.metrics()['resident_bytes'] >= CACHE.max_bytes * 0.9:
+        PREWARM_STATE['files'][filename] = 'skipped'
+    else:
+        PREWARM_STATE['files'][filename] = 'warming'
+        try:
+            refresh_workbook(filename)
+            PREWARM_STATE['files'][filename] = 'warm'
+        except Exception as e:
+            PREWARM_STATE['files'][filename] = 'error'
+            logging.warning(f"Prewarm failed for {filename}: {e}")
+    PREWARM_STATE['done'] += 1
+
+
+def run_prewarm():
+    start = time.perf_counter()
     try:
-        logging.info(f"get_designs called: customer_cd={customer_cd}, delivery_name={delivery_name}")
-        
-        # Get dataframe from cache
-        df = get_cached_dataframe(filename, '営業日報')
-        
-        # Clean up column names
-        df.columns = [str(col).replace('\n', '') for col in df.columns]
-        
-        # Rename specific columns
-        df = df.rename(columns={
-            '得意先CD.': '得意先CD',
-            '直送先名.': '直送先名'
-        })
-        
-        logging.info(f"Columns in dataframe: {list(df.columns)[:20]}...")  # Log first 20 columns
-        
-        # Convert customer_cd to float for matching
+        files = scan_directory_stats(EXCEL_DIR)
+    except OSError as e:
+        logging.warning(f"Prewarm skipped: cannot list {EXCEL_DIR}: {e}")
+        return
+    order = prewarm_order(files)
+    PREWARM_STATE.update({'running': True, 'total': len(order), 'done': 0,
+                          'files': {filename: 'queued' for filename in order}})
+    try:
+        with ThreadPoolExecutor(max_workers=PREWARM_WORKERS, thread_name_prefix="prewarm") as executor:
+            list(executor.map(prewarm_workbook, order))
+    finally:
+        PREWARM_STATE['running'] = False
+    logging.info(f"Prewarmed {PREWARM_STATE['done']} workbooks in {time.perf_counter() - start:.1f}s")
+
+
+@app.on_event("startup")
+def start_prewarm():
+    load_usage_log()
+    if PREWARM_ENABLED:
+        _PREWARM_STOP.clear()
+        threading.Thread(target=run_prewarm, name="prewarm", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_prewarm():
+    _PREWARM_STOP.set()
+    save_usage_log()
+
+
+@app.get("/api/ready")
+@bulkhead('share')
+def get_ready(filename: Optional[str] = None):
+    """
+    事前読み込みの状況。filename（省略時は既定のファイル）が読み込み済みなら 200、まだなら 503。
+    起動スクリプトはこれが 200 になってからブラウザを開く。
+    """
+    filename = filename or DEFAULT_EXCEL_FILE
+    if workbook_signature(os.path.join(EXCEL_DIR, filename)) is None:
+        raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found")
+    files = {}
+    for name, state in list(PREWARM_STATE['files'].items()):
+        files[name] = 'warm' if workbook_is_warm(name) else ('cold' if state == 'warm' else state)
+    ready = workbook_is_warm(filename)
+    files[filename] = 'warm' if ready else files.get(filename, 'cold')
+    content = {
+        "ready": ready,
+        "filename": filename,
+        "prewarm": {key: PREWARM_STATE[key] for key in ('running', 'total', 'done')},
+        "files": files,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+
+@app.on_event("startup")
+def start_journal_worker():
+    global _journal_thread
+    load_journal()
+    if WRITE_BEHIND or JOURNAL['pending']:
+        _journal_thread = threading.Thread(target=_journal_worker, name="journal-flusher", daemon=True)
+        _journal_thread.start()
+        if JOURNAL['pending']:
+            _JOURNAL_WAKE.set()
+
+
+@app.on_event("shutdown")
+def drain_journal():
+    """終了時にジャーナルを書き切る（書けなかった分は次回起動時に再実行）"""
+    _JOURNAL_STOP.set()
+    _JOURNAL_WAKE.set()
+    if _journal_thread is not None:
+        _journal_thread.join(timeout=WRITE_BEHIND_MAX_BACKOFF)
+    deadline = time.time() + float(CONFIG.get('write_behind_drain_timeout', 30.0))
+    delay = 0.5
+    while JOURNAL['pending'] and time.time() < deadline:
+        flush_journal(force=True)
+        if JOURNAL['pending']:
+            time.sleep(min(delay, max(0.0, deadline - time.time())))
+            delay = min(delay * 2, 5.0)
+    if JOURNAL['pending']:
+        logging.warning(f"{len(JOURNAL['pending'])} journal entries left for next startup")
+
+
+def overlay_pending_writes(filename: str, df: pd.DataFrame) -> pd.DataFrame:
+    """未反映の変更を読み込み結果に重ねる（自分の書き込みがすぐ見えるように）"""
+    entries = pending_journal_entries(filename)
+    if not entries:
+        return df
+    return apply_mutations_to_frame(df, entries)
+
+
+def get_pending_report_row(filename: str, management_number: int) -> pd.Series:
+    """write-behind 用: 未反映分を含めて対象の日報行を取得（なければ 404）。楽観的ロックの確認に使うので常に最新の版"""
+    df = get_cached_dataframe(filename, '営業日報', fresh=True)
+    matches = df[df[df.columns[0]] == management_number]
+    if matches.empty:
+        raise HTTPException(status_code=404, detail=f"Report with management number {management_number} not found")
+    return matches.iloc[0]
+
+
+def frame_cell_value(row: pd.Series, col_idx: int):
+    """DataFrame の値を openpyxl のセル値と同じ表現に戻す（楽観的ロックの比較用）"""
+    if col_idx > len(row):
+        return None
+    value = row.iloc[col_idx - 1]
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def report_add_mutation(report: ReportInput) -> dict:
+    """新規日報の追加を書き込みレーン用の変更に変換（管理番号と現目標はレーンで保存直前に決める）"""
+    return {
+        'op': 'add',
+        'management_number': None,
+        'values': report_columns_to_write(report, 0, ""),  # A列・K列はレーンで上書き
+        'target_key': current_target_key(report) if report.得意先CD else None,
+        'backup': True,
+    }
+
+
+def enqueue_add_report(filename: str, report: ReportInput) -> dict:
+    new_mgmt_num = allocate_management_number(filename)
+    current_target = ""
+    if report.得意先CD:
         try:
-            customer_cd_float = float(customer_cd)
-        except ValueError:
-            customer_cd_float = customer_cd
-        
-        # Filter by customer code
-        customer_reports = df[df['得意先CD'] == customer_cd_float].copy()
-        logging.info(f"After customer filter: {len(customer_reports)} rows")
-        
-        # Filter by delivery destination if provided
-        if delivery_name and '直送先名' in customer_reports.columns:
-            before_count = len(customer_reports)
-            customer_reports = customer_reports[customer_reports['直送先名'] == delivery_name]
-            logging.info(f"After delivery_name filter ({delivery_name}): {len(customer_reports)} rows (was {before_count})")
-        else:
-            logging.info(f"Skipping delivery_name filter: delivery_name={delivery_name}, has_column={'直送先名' in customer_reports.columns}")
-        
-        # Filter for records with design request number
-        design_reports = customer_reports[customer_reports['デザイン依頼No.'].notna()]
-        logging.info(f"After design no filter: {len(design_reports)} rows")
-        
-        # Get unique design request numbers
-        unique_design_nos = design_reports['デザイン依頼No.'].unique()
-        
-        designs = []
-        for design_no in unique_design_nos:
-            # Get all records for this design number
-            design_records = design_reports[design_reports['デザイン依頼No.'] == design_no]
-            
-            # Get the latest record (assuming lower down in Excel is newer, or we could sort by date if available)
-            # Here we just take the last one in the dataframe which corresponds to the last row in Excel
-            latest_record = design_records.iloc[-1]
-            
-            # Get the status
-            status = str(latest_record['デザイン進捗状況']) if pd.notna(latest_record['デザイン進捗状況']) else ""
-            
-            # Skip designs with completed/rejected statuses: 出稿, 不採用(コンペ負け), 不採用(企画倒れ)
-            if '出稿' in status or 'コンペ負け' in status or '企画倒れ' in status:
-                continue
-            
-            design_info = {
-                "デザイン依頼No": design_no,
-                "デザイン名": str(latest_record['デザイン名']) if pd.notna(latest_record['デザイン名']) else "",
-                "デザイン種別": str(latest_record['デザイン種別']) if pd.notna(latest_record['デザイン種別']) else "",
-                "デザイン進捗状況": status,
-                "デザイン提案有無": str(latest_record['デザイン提案有無']) if pd.notna(latest_record['デザイン提案有無']) else ""
-            }
-            designs.append(design_info)
-            
-        return {"customer_cd": customer_cd, "designs": designs}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            current_target = lookup_current_target(filename, report.得意先CD, report.直送先CD)
+        except HTTPException as e:
+            logging.warning(f"Could not look up current target: {e.detail}")
+    append_journal(filename, 'add', new_mgmt_num, report_columns_to_write(report, new_mgmt_num, current_target))
+    return {
+        "message": "Report added successfully",
+        "management_number": new_mgmt_num,
+        "file_path": os.path.abspath(os.path.join(EXCEL_DIR, filename)),
+        "queued": True
+    }
 
 
 @app.post("/api/reports")
+@bulkhead('share')
 def add_report(report: ReportInput, background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
     excel_file = os.path.join(EXCEL_DIR, filename)
     if not os.path.exists(excel_file):
         raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found")
     
+    if WRITE_BEHIND:
+        return enqueue_add_report(filename, report)
+    
     try:
-        # Load workbook with openpyxl to preserve formulas and macros
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        ws = wb['営業日報']
-        
-        # 得意先_Listから現目標を取得
-        current_target = ""
-        if report.得意先CD and '得意先_List' in wb.sheetnames:
-            customer_ws = wb['得意先_List']
-            customer_cd = str(report.得意先CD).strip()
-            direct_delivery_cd = str(report.直送先CD).strip() if report.直送先CD else ""
-            
-            # 得意先_Listの構造: A=得意先CD, B=直送先CD, ..., J=現目標
-            for row in range(2, customer_ws.max_row + 1):
-                cell_customer_cd = customer_ws.cell(row=row, column=1).value
-                cell_dd_cd = customer_ws.cell(row=row, column=2).value
-                
-                if cell_customer_cd is not None:
-                    # 得意先CDを文字列に変換（floatの場合は整数に）
-                    if isinstance(cell_customer_cd, float):
-                        cell_customer_cd = str(int(cell_customer_cd))
-                    else:
-                        cell_customer_cd = str(cell_customer_cd).strip()
-                    
-                    # 直送先CDも同様に処理
-                    if cell_dd_cd is not None:
-                        if isinstance(cell_dd_cd, float):
-                            cell_dd_cd = str(int(cell_dd_cd))
-                        else:
-                            cell_dd_cd = str(cell_dd_cd).strip()
-                    else:
-                        cell_dd_cd = ""
-                    
-                    # マッチング条件: 得意先CDが一致 AND (直送先CDが一致 OR 両方空)
-                    if cell_customer_cd == customer_cd:
-                        if direct_delivery_cd:
-                            # 直送先が指定されている場合は直送先CDも一致する必要がある
-                            if cell_dd_cd == direct_delivery_cd:
-                                target_value = customer_ws.cell(row=row, column=10).value  # J列=現目標
-                                if target_value:
-                                    current_target = str(target_value).strip()
-                                break
-                        else:
-                            # 直送先が指定されていない場合は、直送先CDが空の行を探す
-                            if not cell_dd_cd:
-                                target_value = customer_ws.cell(row=row, column=10).value  # J列=現目標
-                                if target_value:
-                                    current_target = str(target_value).strip()
-                                break
-            
-            logging.debug(f"Found current_target for {customer_cd}: {current_target}")
-        
-        # Find the maximum management number and its row by scanning all rows
-        max_mgmt_num = 0
-        max_mgmt_row = 1  # Default to header row if no data found
-        for row in range(2, ws.max_row + 1):  # Start from row 2 (skip header)
-            mgmt_num = ws.cell(row=row, column=1).value
-            try:
-                if mgmt_num is not None:
-                    val = int(mgmt_num)
-                    if val > max_mgmt_num:
-                        max_mgmt_num = val
-                        max_mgmt_row = row
-            except (ValueError, TypeError):
-                continue
+        # 採番から保存までワークブックのレーンで直列化（同時の追加はまとめて1回で保存）
+        result = submit_report_changes(filename, [report_add_mutation(report)])[0]
+        check_change_result(result)
         
-        logging.debug(f"Max Mgmt Num: {max_mgmt_num}, Max Mgmt Row: {max_mgmt_row}")
-
-        # Increment to get new management number
-        new_mgmt_num = max_mgmt_num + 1
-        
-        # Insert at the row immediately after the last management number
-        next_row = max_mgmt_row + 1
-        logging.debug(f"Writing to Row: {next_row}")
-        
-        # Prepare the data to write
-        # Adjust column indices based on actual Excel structure (251113_2026-_-_008.xlsm)
-        # Also copy styles from the previous row (max_mgmt_row) to the new row (next_row)
-        
-        from copy import copy
-
-        def copy_style(source_cell, target_cell):
-            if source_cell.has_style:
-                target_cell.font = copy(source_cell.font)
-                target_cell.border = copy(source_cell.border)
-                target_cell.fill = copy(source_cell.fill)
-                target_cell.number_format = copy(source_cell.number_format)
-                target_cell.protection = copy(source_cell.protection)
-                target_cell.alignment = copy(source_cell.alignment)
-
-        # Define the columns to write to and their values
-        # 2026年度版カラム構造（K列に「得意先目標」が追加）
-        columns_to_write = {
-            1: new_mgmt_num,        # A: 管理番号
-            2: report.日付,          # B: 日付
-            3: report.行動内容,       # C: 行動内容
-            4: report.エリア,         # D: エリア
-            5: report.得意先CD,       # E: 得意先CD.
-            6: report.直送先CD,       # F: 直送先CD.
-            7: report.訪問先名,       # G: 訪問先名/得意先名
-            8: report.直送先名,       # H: 直送先名
-            9: report.重点顧客,       # I: 重点顧客
-            10: report.ランク,        # J: ランク
-            11: current_target,       # K: 得意先目標（得意先_Listから自動取得）
-            12: report.面談者,        # L: 面談者
-            13: report.滞在時間,      # M: 滞在時間
-            14: report.デザイン提案有無,  # N: デザイン提案有無
-            15: report.デザイン種別,   # O: デザイン種別
-            16: report.デザイン名,     # P: デザイン名
-            17: report.デザイン進捗状況, # Q: デザイン進捗状況
-            18: report.デザイン依頼No,  # R: デザイン依頼No.
-            19: report.商談内容,       # S: 商談内容
-            20: report.提案物,         # T: 提案物
-            21: report.次回プラン,     # U: 次回プラン
-            22: report.競合他社情報,   # V: 競合他社情報
-            23: report.上長コメント,   # W: 上長コメント
-            24: report.コメント返信欄  # X: コメント返信欄
+        return {
+            "message": "Report added successfully", 
+            "management_number": result['management_number'],
+            "file_path": os.path.abspath(excel_file)
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        for col_idx, value in columns_to_write.items():
-            target_cell = ws.cell(row=next_row, column=col_idx)
-            target_cell.value = value
-            
-            # Copy style from the row above (max_mgmt_row)
-            # Ensure we are copying from a valid row
-            if max_mgmt_row >= 2:
-                source_cell = ws.cell(row=max_mgmt_row, column=col_idx)
-                copy_style(source_cell, target_cell)
-
-
-        
-        # Save the workbook (Critical path - blocking)
-        wb.save(excel_file)
-        wb.close()
-
-        # Create backup in background
-        background_tasks.add_task(create_backup, excel_file)
-        
-        
-        # Clear cache
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
+@app.post("/api/reports/batch")
+@bulkhead('share')
+def add_reports_batch(reports: List[Dict[str, Any]], background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
+    """複数の日報を1回の読み込み・保存でまとめて追加（日報一括入力用）。1件でも不正があれば何も保存しない"""
+    excel_file = os.path.join(EXCEL_DIR, filename)
+    if not os.path.exists(excel_file):
+        raise HTTPException(status_code=404, detail=f"Excel file '{filename}' not found")
+    if not reports:
+        raise HTTPException(status_code=400, detail="No reports to add")
+    
+    # 全件を先に検証し、エラーは件ごとに返す
+    validated = []
+    errors = []
+    for item_index, item in enumerate(reports):
+        try:
+            validated.append(ReportInput.model_validate(item))
+        except ValidationError as e:
+            errors.append({"index": item_index, "errors": e.errors(include_url=False, include_input=False)})
+    if errors:
+        logging.error(f"Batch validation error on {len(errors)} of {len(reports)} reports: {errors}")
+        return JSONResponse(status_code=422, content={"detail": errors})
+    
+    if WRITE_BEHIND:
+        first_mgmt_num = allocate_management_number(filename, len(validated))
+        changes = []
+        for offset, report in enumerate(validated):
+            current_target = ""
+            if report.得意先CD:
+                try:
+                    current_target = lookup_current_target(filename, report.得意先CD, report.直送先CD)
+                except HTTPException as e:
+                    logging.warning(f"Could not look up current target: {e.detail}")
+            new_mgmt_num = first_mgmt_num + offset
+            changes.append(('add', new_mgmt_num, report_columns_to_write(report, new_mgmt_num, current_target)))
+        append_journal_entries(filename, changes)
+        return {
+            "message": f"{len(changes)} reports added successfully",
+            "management_numbers": [mgmt_num for _, mgmt_num, _ in changes],
+            "file_path": os.path.abspath(excel_file),
+            "queued": True
+        }
+    
+    try:
+        # 全件を同じレーンに投入するので、連番・1回の保存になる。1件でも失敗すればレーンは全件を保存しない
+        group = uuid.uuid4().hex
+        results = submit_report_changes(filename, [{**report_add_mutation(report), 'group': group} for report in validated])
+        failed = next((result for result in results if result['status'] != 'ok'), None)
+        if failed is not None:
+            check_change_result(failed)
+        management_numbers = [result['management_number'] for result in results]
         
         return {
-            "message": "Report added successfully", 
-            "management_number": new_mgmt_num,
+            "message": f"{len(management_numbers)} reports added successfully",
+            "management_numbers": management_numbers,
             "file_path": os.path.abspath(excel_file)
         }
-    except PermissionError:
-        raise HTTPException(
-            status_code=409,
-            detail="ファイルが開かれているため保存できません。Excelファイルを閉じてから再度実行してください。"
-        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -966,71 +4484,26 @@ class ReplyInput(BaseModel):
     コメント返信欄: str
 
 @app.patch("/api/reports/{management_number}/reply")
+@bulkhead('share')
 def update_report_reply(management_number: int, reply: ReplyInput, background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
     """コメント返信欄のみを更新（安全な保存）"""
-    import tempfile
-    import shutil
-    
     logging.debug(f"update_report_reply: management_number={management_number}, reply={reply.コメント返信欄}")
     try:
         excel_file = os.path.join(EXCEL_DIR, filename)
         logging.debug(f"excel_file: {excel_file}")
         
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        logging.debug("workbook loaded")
-        if '営業日報' not in wb.sheetnames:
-            raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
-        
-        ws = wb['営業日報']
-        logging.debug(f"worksheet max_row: {ws.max_row}")
-        
-        # Find the row
-        target_row = None
-        for row in range(2, ws.max_row + 1):
-            if ws.cell(row=row, column=1).value == management_number:
-                target_row = row
-                break
-        
-        logging.debug(f"target_row: {target_row}")
-        if not target_row:
-            wb.close()
-            raise HTTPException(status_code=404, detail=f"Report {management_number} not found")
+        if WRITE_BEHIND:
+            get_pending_report_row(filename, management_number)
+            append_journal(filename, 'cells', management_number, comment_columns_to_write(reply))
+            return {"success": True, "management_number": management_number, "queued": True}
         
         # 2026年度版: X列(24) = コメント返信欄
-        ws.cell(row=target_row, column=24, value=reply.コメント返信欄)
-        logging.debug("cell set, saving to temp file...")
-        
-        # 安全な保存: 一時ファイルに保存してから置き換え
-        temp_dir = tempfile.gettempdir()
-        temp_file = os.path.join(temp_dir, f"temp_{filename}")
-        
-        try:
-            # 一時ファイルに保存
-            wb.save(temp_file)
-            wb.close()
-            logging.debug(f"saved to temp: {temp_file}")
-            
-            # 一時ファイルが正常か確認（読み込みテスト）
-            test_wb = openpyxl.load_workbook(temp_file, read_only=True)
-            test_wb.close()
-            logging.debug("temp file verified")
-            
-            # 元のファイルを一時ファイルで置き換え
-            shutil.copy2(temp_file, excel_file)
-            logging.debug("replaced original file")
-            
-        finally:
-            # 一時ファイルを削除
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        
-        # Clear cache
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
+        result = submit_report_changes(filename, [{
+            'op': 'cells',
+            'management_number': management_number,
+            'values': {24: reply.コメント返信欄},
+        }])[0]
+        check_change_result(result)
         
         return {"success": True, "management_number": management_number}
     except HTTPException:
@@ -1042,67 +4515,23 @@ def update_report_reply(management_number: int, reply: ReplyInput, background_ta
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.patch("/api/reports/{management_number}/comment")
+@bulkhead('share')
 def update_report_comment(management_number: int, comment: CommentInput, background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
     """上長コメントとコメント返信欄を個別に更新（安全な保存）"""
-    import tempfile
-    import shutil
-    
     logging.debug(f"update_report_comment: management_number={management_number}, 上長コメント={comment.上長コメント}, コメント返信欄={comment.コメント返信欄}")
     try:
-        excel_file = os.path.join(EXCEL_DIR, filename)
-        
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        if '営業日報' not in wb.sheetnames:
-            raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
-        
-        ws = wb['営業日報']
-        
-        # Find the row
-        target_row = None
-        for row in range(2, ws.max_row + 1):
-            if ws.cell(row=row, column=1).value == management_number:
-                target_row = row
-                break
-        
-        if not target_row:
-            wb.close()
-            raise HTTPException(status_code=404, detail=f"Report {management_number} not found")
-        
-        # Update only provided fields
-        # 2026年度版: W列(23) = 上長コメント, X列(24) = コメント返信欄
-        if comment.上長コメント is not None:
-            ws.cell(row=target_row, column=23, value=comment.上長コメント)
-        if comment.コメント返信欄 is not None:
-            ws.cell(row=target_row, column=24, value=comment.コメント返信欄)
-        
-        # 安全な保存: 一時ファイルに保存してから置き換え
-        temp_dir = tempfile.gettempdir()
-        temp_file = os.path.join(temp_dir, f"temp_{filename}")
-        
-        try:
-            wb.save(temp_file)
-            wb.close()
-            
-            # 一時ファイルが正常か確認
-            test_wb = openpyxl.load_workbook(temp_file, read_only=True)
-            test_wb.close()
-            
-            # 元のファイルを置き換え
-            shutil.copy2(temp_file, excel_file)
-        finally:
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        
-        # Clear cache
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
-        
-        # Create backup in background
-        background_tasks.add_task(create_backup, excel_file)
+        if WRITE_BEHIND:
+            get_pending_report_row(filename, management_number)
+            append_journal(filename, 'cells', management_number, comment_columns_to_write(comment))
+            return {"success": True, "management_number": management_number, "queued": True}
+        
+        result = submit_report_changes(filename, [{
+            'op': 'cells',
+            'management_number': management_number,
+            'values': comment_columns_to_write(comment),
+            'backup': True,
+        }])[0]
+        check_change_result(result)
         
         return {"success": True, "management_number": management_number}
     except HTTPException:
@@ -1114,79 +4543,23 @@ def update_report_comment(management_number: int, comment: CommentInput, backgro
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.patch("/api/reports/{management_number}/approval")
+@bulkhead('share')
 def update_report_approval(management_number: int, approval: ApprovalInput, background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
     """承認チェック（上長、山澄常務、岡本常務、中野次長、既読チェック）を個別に更新"""
-    import tempfile
-    import shutil
-    
     logging.debug(f"update_report_approval: management_number={management_number}")
     try:
-        excel_file = os.path.join(EXCEL_DIR, filename)
-        
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        if '営業日報' not in wb.sheetnames:
-            raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
-        
-        ws = wb['営業日報']
-        
-        # Find the row
-        target_row = None
-        for row in range(2, ws.max_row + 1):
-            if ws.cell(row=row, column=1).value == management_number:
-                target_row = row
-                break
-        
-        if not target_row:
-            wb.close()
-            raise HTTPException(status_code=404, detail=f"Report {management_number} not found")
-        
-        # Update only provided fields
-        # 2026年度版カラムマッピング: Y=上長(25), Z=山澄常務(26), AA=岡本常務(27), AB=中野次長(28), AC=既読チェック(29)
-        column_mapping = {
-            '上長': 25,           # Y列
-            '山澄常務': 26,        # Z列
-            '岡本常務': 27,        # AA列
-            '中野次長': 28,        # AB列
-            '既読チェック': 29     # AC列
-        }
-        
-        if approval.上長 is not None:
-            ws.cell(row=target_row, column=column_mapping['上長'], value=approval.上長)
-        if approval.山澄常務 is not None:
-            ws.cell(row=target_row, column=column_mapping['山澄常務'], value=approval.山澄常務)
-        if approval.岡本常務 is not None:
-            ws.cell(row=target_row, column=column_mapping['岡本常務'], value=approval.岡本常務)
-        if approval.中野次長 is not None:
-            ws.cell(row=target_row, column=column_mapping['中野次長'], value=approval.中野次長)
-        if approval.既読チェック is not None:
-            ws.cell(row=target_row, column=column_mapping['既読チェック'], value=approval.既読チェック)
-        
-        # 安全な保存
-        temp_dir = tempfile.gettempdir()
-        temp_file = os.path.join(temp_dir, f"temp_{filename}")
-        
-        try:
-            wb.save(temp_file)
-            wb.close()
-            
-            test_wb = openpyxl.load_workbook(temp_file, read_only=True)
-            test_wb.close()
-            
-            shutil.copy2(temp_file, excel_file)
-        finally:
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        
-        # Clear cache
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
-        
-        # Create backup in background
-        background_tasks.add_task(create_backup, excel_file)
+        if WRITE_BEHIND:
+            get_pending_report_row(filename, management_number)
+            append_journal(filename, 'cells', management_number, approval_columns_to_write(approval))
+            return {"success": True, "management_number": management_number, "queued": True}
+        
+        result = submit_report_changes(filename, [{
+            'op': 'cells',
+            'management_number': management_number,
+            'values': approval_columns_to_write(approval),
+            'backup': True,
+        }])[0]
+        check_change_result(result)
         
         return {"success": True, "management_number": management_number}
     except HTTPException:
@@ -1198,168 +4571,62 @@ def update_report_approval(management_number: int, approval: ApprovalInput, back
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/reports/{management_number}")
+@bulkhead('share')
 def update_report(management_number: int, report: ReportInput, background_tasks: BackgroundTasks, filename: str = DEFAULT_EXCEL_FILE):
     """既存の日報を更新（全項目対応）"""
     logging.info(f"update_report called: management_number={management_number}, original_values={report.original_values}")
     try:
-        excel_file = os.path.join(EXCEL_DIR, filename)
-        
-        # Load the workbook
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        if '営業日報' not in wb.sheetnames:
-            raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
-             
-        ws = wb['営業日報']
-        
-        # Find the row with the matching management number
-        target_row = None
-        for row in range(2, ws.max_row + 1):
-            cell_value = ws.cell(row=row, column=1).value
-            if cell_value == management_number:
-                target_row = row
-                break
-        
-        if not target_row:
-            raise HTTPException(status_code=404, detail=f"Report with management number {management_number} not found")
-
-        # --- Optimistic Locking Check ---
-        if report.original_values:
-            logging.debug(f"Performing conflict check for Report {management_number}")
-            
-            # Fields to check for conflicts (critical text fields)
-            check_fields = {
-                22: '上長コメント',
-                23: 'コメント返信欄',
-                18: '商談内容'
-            }
-            
-            conflicts = []
-            for col_idx, field_name in check_fields.items():
-                current_val = ws.cell(row=target_row, column=col_idx).value
-                current_str = str(current_val) if current_val is not None else ""
-                
-                original_val = report.original_values.get(field_name, "")
-                original_str = str(original_val) if original_val is not None else ""
-                
-                # Normalize newlines for comparison
-                current_str = current_str.replace('\r\n', '\n').replace('\r', '\n').strip()
-                original_str = original_str.replace('\r\n', '\n').replace('\r', '\n').strip()
-                
-                if current_str != original_str:
-                    logging.warning(f"CONFLICT: Field '{field_name}' changed. Current: '{current_str}' vs Original: '{original_str}'")
-                    conflicts.append(field_name)
-            
-            if conflicts:
-                conflict_msg = ", ".join(conflicts)
-                raise HTTPException(
-                    status_code=409, 
-                    detail=f"他の方が編集しました（{conflict_msg}）。最新の情報を読み込んでからやり直してください。"
-                )
-        # --------------------------------
-        
-        # Update all fields (2026年度版カラム構造 - K列に得意先目標が追加)
-        columns_to_write = {
-            2: report.日付,              # B: 日付
-            3: report.行動内容,           # C: 行動内容
-            4: report.エリア,             # D: エリア
-            5: report.得意先CD,           # E: 得意先CD.
-            6: report.直送先CD,           # F: 直送先CD.
-            7: report.訪問先名,           # G: 訪問先名/得意先名
-            8: report.直送先名,           # H: 直送先名
-            9: report.重点顧客,           # I: 重点顧客
-            10: report.ランク,            # J: ランク
-            # 11: 得意先目標 (K) - 手動入力のため省略
-            12: report.面談者,            # L: 面談者
-            13: report.滞在時間,          # M: 滞在時間
-            14: report.デザイン提案有無,   # N: デザイン提案有無
-            15: report.デザイン種別,       # O: デザイン種別
-            16: report.デザイン名,         # P: デザイン名
-            17: report.デザイン進捗状況,   # Q: デザイン進捗状況
-            18: report.デザイン依頼No,     # R: デザイン依頼No.
-            19: report.商談内容,           # S: 商談内容
-            20: report.提案物,             # T: 提案物
-            21: report.次回プラン,         # U: 次回プラン
-            22: report.競合他社情報,       # V: 競合他社情報
-            23: report.上長コメント,       # W: 上長コメント
-            24: report.コメント返信欄      # X: コメント返信欄
-        }
-
-        for col_idx, value in columns_to_write.items():
-            ws.cell(row=target_row, column=col_idx, value=value)
-        
-        # Save the workbook (Critical path - blocking)
-        wb.save(excel_file)
-        wb.close()
-        
-        # Create backup in background
-        background_tasks.add_task(create_backup, excel_file)
-        
-        # Clear cache for this file
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
+        if WRITE_BEHIND:
+            current_row = get_pending_report_row(filename, management_number)
+            if report.original_values:
+                conflicts = find_report_conflicts(lambda col_idx: frame_cell_value(current_row, col_idx), report.original_values)
+                if conflicts:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"他の方が編集しました（{', '.join(conflicts)}）。最新の情報を読み込んでからやり直してください。"
+                    )
+            append_journal(filename, 'cells', management_number, report_columns_to_write(report))
+            return {"message": "Report updated successfully", "management_number": management_number, "queued": True}
+        
+        # 競合チェック（楽観的ロック）は保存直前にレーン内で行う
+        result = submit_report_changes(filename, [{
+            'op': 'cells',
+            'management_number': management_number,
+            'values': report_columns_to_write(report),
+            'original_values': report.original_values,
+            'backup': True,
+        }])[0]
+        check_change_result(result)
         
         return {"message": "Report updated successfully", "management_number": management_number}
     except HTTPException:
         raise
-    except PermissionError:
-        raise HTTPException(
-            status_code=409,
-            detail="ファイルが開かれているため保存できません。Excelファイルを閉じてから再度実行してください。"
-        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/reports/{management_number}")
+@bulkhead('share')
 def delete_report(management_number: int, filename: str = DEFAULT_EXCEL_FILE):
     """指定された管理番号の日報を削除"""
     try:
-        excel_file = os.path.join(EXCEL_DIR, filename)
-        
-        # Load the workbook
-        wb = openpyxl.load_workbook(excel_file, keep_vba=True)
-        if '営業日報' not in wb.sheetnames:
-            raise HTTPException(status_code=404, detail="Sheet '営業日報' not found")
-             
-        ws = wb['営業日報']
-        
-        # Find the row with the matching management number
-        target_row = None
-        for row in range(2, ws.max_row + 1):
-            cell_value = ws.cell(row=row, column=1).value
-            if cell_value == management_number:
-                target_row = row
-                break
-        
-        if not target_row:
-            raise HTTPException(status_code=404, detail=f"Report with management number {management_number} not found")
-        
-        # Delete the row
-        ws.delete_rows(target_row, 1)
-        
-        # Save the workbook
-        wb.save(excel_file)
-        wb.close()
+        if WRITE_BEHIND:
+            get_pending_report_row(filename, management_number)
+            append_journal(filename, 'delete', management_number)
+            return {"message": "Report deleted successfully", "management_number": management_number, "queued": True}
         
-        # Clear cache for this file
-        cache_key = (filename, '営業日報')
-        if cache_key in CACHE:
-            del CACHE[cache_key]
+        result = submit_report_changes(filename, [{'op': 'delete', 'management_number': management_number}])[0]
+        check_change_result(result)
         
         return {"message": "Report deleted successfully", "management_number": management_number}
     except HTTPException:
         raise
-    except PermissionError:
-        raise HTTPException(
-            status_code=409,
-            detail="ファイルが開かれているため保存できません。Excelファイルを閉じてから再度実行してください。"
-        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
+@bulkhead('share')
+def upload_file(file: UploadFile = File(...)):
     """Upload an Excel file to the backend directory"""
     try:
         # Validate file extension
@@ -1384,14 +4651,16 @@ async def upload_file(file: UploadFile = File(...)):
 # Set up logging
 import logging
 
-logging.basicConfig(
-    filename='debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8' # Ensure we can log Japanese characters
-)
+if not IS_POOL_WORKER:
+    logging.basicConfig(
+        filename='debug.log',
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        encoding='utf-8' # Ensure we can log Japanese characters
+    )
 
 @app.get("/api/images/list")
+@bulkhead('share')
 def get_design_images(filename: str):
     """
     Get list of images from the matching folder in Design Data directory.
@@ -1541,6 +4810,7 @@ def get_design_images(filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/images/content")
+@bulkhead('share')
 def serve_design_image(path: str):
     """
     Serve the image file content.
@@ -1566,6 +4836,7 @@ def serve_design_image(path: str):
          raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/images/search")
+@bulkhead('share')
 def search_design_images(query: str, filename: Optional[str] = None):
     """
     Search for images matching the query (Design No) in the Design Data directory.
@@ -1803,19 +5074,23 @@ def search_design_images(query: str, filename: Optional[str] = None):
 # --- Sales Data Integration (Global) ---
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 SALES_CSV_PATH = os.path.join(DATA_DIR, 'sales_data.csv')
-os.makedirs(DATA_DIR, exist_ok=True)
+if not IS_POOL_WORKER:
+    os.makedirs(DATA_DIR, exist_ok=True)
 
 global_sales_df = None
+# 読み込んだ CSV の版（ETag 用）
+SALES_VERSION = {'tag': 'none', 'mtime_ns': None}
 
 def load_sales_data():
     """Loads sales data from CSV into global DataFrame."""
-    global global_sales_df
+    global global_sales_df, SALES_VERSION
     if not os.path.exists(SALES_CSV_PATH):
         logging.info("No existing sales data found.")
         return
 
     try:
         logging.info("Loading sales data from disk...")
+        mtime_ns, size = file_signature(SALES_CSV_PATH)
         try:
             df = pd.read_csv(SALES_CSV_PATH, encoding='cp932')
         except:
@@ -1826,6 +5101,7 @@ def load_sales_data():
         if '得意先コード' in df.columns:
             df['得意先コード'] = df['得意先コード'].astype(str).str.split('.').str[0]
             global_sales_df = df
+            SALES_VERSION = {'tag': f"sales-{mtime_ns:x}-{size:x}", 'mtime_ns': mtime_ns}
             logging.info(f"Sales data loaded successfully. {len(df)} rows.")
         else:
             logging.error("Sales CSV missing '得意先コード' column.")
@@ -1833,16 +5109,18 @@ def load_sales_data():
         logging.error(f"Failed to load sales data: {e}")
 
 # Load on startup
-load_sales_data()
+if not IS_POOL_WORKER:
+    load_sales_data()
 
 @app.post("/api/sales/upload")
-async def upload_sales_csv(file: UploadFile = File(...)):
+@bulkhead('cpu')
+def upload_sales_csv(file: UploadFile = File(...)):
     """
     Uploads a global sales data CSV file, saves it, and unloads it into memory.
     """
     try:
         logging.info(f"Receiving sales CSV: {file.filename}")
-        contents = await file.read()
+        contents = file.file.read()
         
         import io
         try:
@@ -1867,10 +5145,15 @@ async def upload_sales_csv(file: UploadFile = File(...)):
 
 
 @app.get("/api/sales/all")
-async def get_all_sales_data():
+@bulkhead('cpu')
+def get_all_sales_data(request: Request, response: Response):
     """
     Retrieves ALL sales data as a list.
     """
+    cached = not_modified_response(request, SALES_VERSION)
+    if cached is not None:
+        return cached
+    response.headers.update(validator_headers(request, SALES_VERSION))
     if global_sales_df is None:
         return []
 
@@ -1907,10 +5190,15 @@ async def get_all_sales_data():
 
 
 @app.get("/api/sales/{customer_code}")
-async def get_sales_data(customer_code: str):
+@bulkhead('light')
+def get_sales_data(request: Request, response: Response, customer_code: str):
     """
     Retrieves sales data for a specific customer from the global dataset.
     """
+    cached = not_modified_response(request, SALES_VERSION)
+    if cached is not None:
+        return cached
+    response.headers.update(validator_headers(request, SALES_VERSION))
     if global_sales_df is None:
         return {"found": False, "message": "Sales data not yet uploaded."}
     
@@ -1931,7 +5219,6 @@ async def get_sales_data(customer_code: str):
                 return val.item() 
             return val
 
-        from datetime import datetime
         data = {
             "found": True,
             "rank": get_val('順位'),
@@ -1943,8 +5230,7 @@ async def get_sales_data(customer_code: str):
             "profit_last_year": get_val('前年粗利'),
             "sales_2y_ago": get_val('前々年売上'),
             "profit_2y_ago": get_val('前々年粗利'),
-            "customer_name": get_val('得意先名称'),
-            "updated_at": datetime.now().isoformat()
+            "customer_name": get_val('得意先名称')
         }
         return data
 
@@ -1996,6 +5282,7 @@ if os.path.exists(STATIC_DIR):
 # ----------------------------------------------
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PyInstaller の exe でプロセスプールのワーカーを起動するため
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
 
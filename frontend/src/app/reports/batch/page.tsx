@@ -2,7 +2,7 @@
 
 import { useState, useEffect, useMemo, useCallback } from 'react';
 import { useFile } from '@/context/FileContext';
-import { Customer, Design, getCustomers, getInterviewers, getDesigns, addReport } from '@/lib/api';
+import { Customer, Design, getCustomers, getInterviewers, getDesigns, addReportsBatch } from '@/lib/api';
 import { queryKeys, useReports } from '@/hooks/useQueryHooks';
 import { useQueryClient } from '@tanstack/react-query';
 import { Plus, Trash2, Save, Calendar, Building2, Clock, MessageSquare, ChevronDown, ChevronUp, Search, Loader2, AlertCircle } from 'lucide-react';
@@ -15,9 +15,16 @@ type ValidationErrors = {
         得意先CD?: string;
         行動内容?: string;
         外出時間?: string;
+        保存?: string;  // サーバー側の検証エラー（一括保存の422）
     };
 };
 
+// 一括保存APIの422レスポンスの件ごとのエラー
+type BatchItemError = {
+    index: number;
+    errors: { loc: (string | number)[]; msg: string }[];
+};
+
 // 訪問ブロックのデータ型
 type VisitEntry = {
     id: string;
@@ -385,7 +392,7 @@ export default function BatchReportPage() {
         let successCount = 0;
         let errorCount = 0;
 
-        for (const visit of validVisits) {
+        const reportsData = validVisits.map(visit => {
             // 商談内容の構築（外出時間の場合）
             let finalCommercialContent = visit.商談内容 || '';
             let finalRank = visit.ランク;
@@ -425,13 +432,39 @@ export default function BatchReportPage() {
                 デザイン進捗状況: visit.デザイン進捗状況,
                 'デザイン依頼No.': visit['デザイン依頼No.'],
             };
+            return reportData;
+        });
 
-            try {
-                await addReport(reportData as any, selectedFile);
-                successCount++;
-            } catch (error) {
-                console.error('Failed to create report:', error);
-                errorCount++;
+        // まとめて1回で保存（途中で失敗した場合は1件も保存されない）
+        try {
+            const result = await addReportsBatch(reportsData as any, selectedFile);
+            successCount = result.management_numbers.length;
+        } catch (error: any) {
+            console.error('Failed to create reports:', error);
+            const detail = error.response?.status === 422 ? error.response.data?.detail : undefined;
+            if (Array.isArray(detail)) {
+                // 不正な訪問に印を付ける（1件でも不正があれば何も保存されていない）
+                const itemErrors = detail as BatchItemError[];
+                const serverErrors: ValidationErrors = {};
+                itemErrors.forEach(item => {
+                    const visit = validVisits[item.index];
+                    if (!visit) return;
+                    const visitErrors: ValidationErrors[string] = {};
+                    const messages = item.errors.map(e => {
+                        const field = String(e.loc[e.loc.length - 1] ?? '');
+                        if (field === '得意先CD' || field === '行動内容') {
+                            visitErrors[field] = e.msg;
+                        }
+                        return field ? `${field}: ${e.msg}` : e.msg;
+                    });
+                    visitErrors.保存 = messages.join(' / ');
+                    serverErrors[visit.id] = visitErrors;
+                });
+                setValidationErrors(serverErrors);
+                setVisits(prev => prev.map(v => serverErrors[v.id] ? { ...v, isExpanded: true } : v));
+                errorCount = itemErrors.length;
+            } else {
+                errorCount = reportsData.length;
             }
         }
 
@@ -489,7 +522,10 @@ export default function BatchReportPage() {
                 {visits.map((visit, index) => (
                     <div
                         key={visit.id}
-                        className="bg-white rounded border border-sf-border shadow-sm overflow-hidden"
+                        className={`bg-white rounded border shadow-sm overflow-hidden ${showErrors && validationErrors[visit.id]?.保存
+                            ? 'border-red-500'
+                            : 'border-sf-border'
+                            }`}
                     >
                         {/* 訪問ヘッダー */}
                         <div
@@ -510,6 +546,12 @@ export default function BatchReportPage() {
                                         {visit.行動内容}
                                     </span>
                                 )}
+                                {showErrors && validationErrors[visit.id]?.保存 && (
+                                    <span className="flex items-center gap-1 text-xs text-red-500">
+                                        <AlertCircle size={12} />
+                                        {validationErrors[visit.id].保存}
+                                    </span>
+                                )}
                             </div>
                             <div className="flex items-center gap-2">
                                 {visits.length > 1 && (
@@ -79,6 +79,13 @@ export const addReport = async (report: Omit<Report, '管理番号'>, filename?:
     return response.data;
 };
 
+// 一括追加API（日報一括入力用。1回の保存でまとめて追加し、1件でも不正があれば何も保存しない）
+export const addReportsBatch = async (reports: Omit<Report, '管理番号'>[], filename?: string): Promise<{ management_numbers: number[] }> => {
+    const params = filename ? { filename } : {};
+    const response = await apiLong.post(`${API_URL}/reports/batch`, reports, { params });
+    return response.data;
+};
+
 export const updateReport = async (managementNumber: number, report: Partial<Omit<Report, '管理番号'>>, filename?: string) => {
     const params = filename ? { filename } : {};
     const response = await apiLong.post(`${API_URL}/reports/${managementNumber}`, report, { params });